@@ -0,0 +1,309 @@
+"""Columnar analytics log of every analysis run, for bulk queries and dashboards.
+
+Each finished run (successful, failed or cancelled) appends rows to three
+Parquet tables under DATA_DIR/analytics, partitioned by UTC date:
+
+    runs/date=YYYY-MM-DD/       one row per run: outcome, wall time, route, tokens,
+                                cost, output sizes, action items, words per speaker
+    segments/date=YYYY-MM-DD/   one row per segment of a long-audio run: time range,
+                                status, latency, tokens
+    calls/date=YYYY-MM-DD/      one row per model call: stage, model, latency, tokens, cost
+
+Files are zstd-compressed. A run writes one small file per table; partitions
+of earlier days are merged into one file per table the first time a process
+writes on a new day (or with `python analytics.py compact`). The tables read
+back with any Parquet reader (pyarrow, pandas, DuckDB, Spark) as a
+hive-partitioned dataset, or with read() here.
+
+pyarrow is optional: without it (or with AUDIO_ANALYSIS_ANALYTICS=0) nothing
+is recorded.
+
+    python analytics.py summary --since 2026-10-01
+    python analytics.py export segments segments.parquet --since 2026-10-01
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+import usage
+from results_store import DATA_DIR, base_analysis_type
+from routing import route_label
+
+ANALYTICS_ENABLED = os.environ.get("AUDIO_ANALYSIS_ANALYTICS", "1") != "0"
+ANALYTICS_DIR = os.path.join(DATA_DIR, "analytics")
+TABLES = ("runs", "segments", "calls")
+
+# "Speaker 1: ...", "[00:12] Alice: ..." at the start of a transcript line
+SPEAKER_LINE = re.compile(r"^(?:\[[\d:]+\]\s*)?([A-Z][\w.'-]*(?: [A-Z0-9][\w.'-]*){0,3}):\s+(.+)$", re.MULTILINE)
+WORD = re.compile(r"\w+")
+
+def available():
+    """Return True when runs are recorded: enabled and pyarrow installed."""
+    if not ANALYTICS_ENABLED:
+        return False
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _schemas():
+    import pyarrow as pa
+    timestamp = pa.timestamp("ms", tz="UTC")
+    return {
+        "runs": pa.schema([
+            ("run_id", pa.string()), ("created_at", timestamp), ("user_id", pa.string()),
+            ("audio_hash", pa.string()), ("file_name", pa.string()), ("analysis_type", pa.string()),
+            ("mode", pa.string()), ("route", pa.string()), ("num_segments", pa.int16()),
+            ("trim_silence", pa.bool_()), ("outcome", pa.string()), ("seconds", pa.float64()),
+            ("audio_bytes", pa.int64()), ("model_calls", pa.int32()), ("input_tokens", pa.int64()),
+            ("output_tokens", pa.int64()), ("cost_usd", pa.float64()), ("result_chars", pa.int64()),
+            ("transcript_chars", pa.int64()), ("compacted_tokens_before", pa.int64()),
+            ("compacted_tokens_after", pa.int64()), ("action_items", pa.int32()),
+            ("speaker_words", pa.list_(pa.struct([("speaker", pa.string()), ("words", pa.int32())]))),
+        ]),
+        "segments": pa.schema([
+            ("run_id", pa.string()), ("created_at", timestamp), ("audio_hash", pa.string()),
+            ("segment_index", pa.int16()), ("num_segments", pa.int16()), ("start_seconds", pa.float64()),
+            ("end_seconds", pa.float64()), ("status", pa.string()), ("seconds", pa.float64()),
+            ("input_tokens", pa.int64()), ("output_tokens", pa.int64()), ("transcript_chars", pa.int64()),
+            ("error", pa.string()),
+        ]),
+        "calls": pa.schema([
+            ("run_id", pa.string()), ("created_at", timestamp), ("stage", pa.string()), ("model", pa.string()),
+            ("seconds", pa.float64()), ("input_tokens", pa.int64()), ("output_tokens", pa.int64()),
+            ("cost_usd", pa.float64()),
+        ]),
+    }
+
+def speaker_words(transcript):
+    """Return [(speaker, words)] for transcript lines opening with a speaker label, most talkative first."""
+    words = Counter()
+    for speaker, text in SPEAKER_LINE.findall(transcript or ""):
+        words[speaker.strip()] += len(WORD.findall(text))
+    return words.most_common()
+
+def count_action_items(run_info):
+    """Return the number of action items of a structured result, or None when there is none."""
+    data = run_info.get("structured")
+    return len(data.get("action_items", [])) if data else None
+
+def run_rows(user_id, audio_hash, file_name, analysis_type, settings, run, run_info, result="", audio_bytes=0,
+             now=None, mode=None):
+    """Return {table: rows} describing one finished run; mode defaults to single or segmented."""
+    now = now or time.time()
+    run_id = uuid.uuid4().hex
+    created_at = datetime.fromtimestamp(now, timezone.utc)
+    calls = run_info.get("calls", [])
+    records = run_info.get("segments", [])
+    transcript = run_info.get("transcript", "")
+    compaction = run_info.get("compaction") or {}
+    models = settings.get("model")
+    num_segments = settings.get("num_segments", 0)
+    runs = [{
+        "run_id": run_id, "created_at": created_at, "user_id": user_id, "audio_hash": audio_hash,
+        "file_name": file_name, "analysis_type": base_analysis_type(analysis_type),
+        "mode": mode or ("segmented" if num_segments else "single"),
+        "route": route_label(models),
+        "num_segments": num_segments, "trim_silence": bool(settings.get("trim_silence")),
+        "outcome": run.get("outcome", "error"), "seconds": run.get("seconds"), "audio_bytes": audio_bytes,
+        "model_calls": len(calls),
+        "input_tokens": sum(c["input_tokens"] for c in calls),
+        "output_tokens": sum(c["output_tokens"] for c in calls),
+        "cost_usd": sum(usage.call_cost(c["model"], c["stage"], c["input_tokens"], c["output_tokens"])
+                        for c in calls),
+        "result_chars": len(result or ""), "transcript_chars": len(transcript),
+        "compacted_tokens_before": compaction.get("tokens_before"),
+        "compacted_tokens_after": compaction.get("tokens_after"),
+        "action_items": count_action_items(run_info),
+        "speaker_words": [{"speaker": s, "words": w} for s, w in speaker_words(transcript)],
+    }]
+    segments = [{
+        "run_id": run_id, "created_at": created_at, "audio_hash": audio_hash, "segment_index": r["index"],
+        "num_segments": len(records), "start_seconds": r["start_seconds"], "end_seconds": r["end_seconds"],
+        "status": r["status"], "seconds": r["seconds"], "input_tokens": r["input_tokens"],
+        "output_tokens": r["output_tokens"], "transcript_chars": len(r["text"] or ""), "error": r["error"] or None,
+    } for r in records]
+    call_rows = [{
+        "run_id": run_id, "created_at": datetime.fromtimestamp(c.get("finished_at", now), timezone.utc),
+        "stage": c["stage"], "model": usage.short_model_name(c["model"]), "seconds": c.get("seconds"),
+        "input_tokens": c["input_tokens"], "output_tokens": c["output_tokens"],
+        "cost_usd": usage.call_cost(c["model"], c["stage"], c["input_tokens"], c["output_tokens"]),
+    } for c in calls]
+    return {"runs": runs, "segments": segments, "calls": call_rows}
+
+class AnalyticsStore:
+    """Appends and reads the date-partitioned Parquet tables."""
+
+    def __init__(self, directory=ANALYTICS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._compacted_through = None
+
+    def _partition(self, table, date):
+        return os.path.join(self.directory, table, f"date={date}")
+
+    def append(self, tables, now=None):
+        """Write {table: rows} as one new file per non-empty table, in today's partition."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        today = datetime.fromtimestamp(now or time.time(), timezone.utc).strftime("%Y-%m-%d")
+        schemas = _schemas()
+        for table, rows in tables.items():
+            if not rows:
+                continue
+            directory = self._partition(table, today)
+            os.makedirs(directory, exist_ok=True)
+            name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+            self._write(pq, pa.Table.from_pylist(rows, schema=schemas[table]), os.path.join(directory, name))
+        with self._lock:
+            compact = self._compacted_through != today
+            self._compacted_through = today
+        if compact:
+            self.compact(before=today)
+
+    @staticmethod
+    def _write(pq, table, path):
+        # Readers never see a half-written file
+        partial = path + ".partial"
+        pq.write_table(table, partial, compression="zstd")
+        os.replace(partial, path)
+
+    def compact(self, before=None):
+        """Merge the files of each partition dated before `before` (YYYY-MM-DD) into one."""
+        import pyarrow.parquet as pq
+        merged = 0
+        for table in TABLES:
+            root = os.path.join(self.directory, table)
+            if not os.path.isdir(root):
+                continue
+            for partition in sorted(os.listdir(root)):
+                date = partition.split("=", 1)[-1]
+                if before is not None and date >= before:
+                    continue
+                directory = os.path.join(root, partition)
+                parts = sorted(f for f in os.listdir(directory) if f.endswith(".parquet"))
+                if len(parts) < 2:
+                    continue
+                # Another process compacting the same partition holds the lock
+                lock = os.path.join(directory, ".compacting")
+                try:
+                    os.close(os.open(lock, os.O_CREAT | os.O_EXCL))
+                except FileExistsError:
+                    continue
+                try:
+                    paths = [os.path.join(directory, f) for f in parts]
+                    combined = pq.ParquetDataset(paths).read()
+                    self._write(pq, combined, os.path.join(directory, f"compacted-{int(time.time() * 1000)}.parquet"))
+                    for path in paths:
+                        os.unlink(path)
+                    merged += len(paths)
+                finally:
+                    os.unlink(lock)
+        return merged
+
+    def read(self, table, since=None, until=None, columns=None):
+        """Return a table's rows between two dates (YYYY-MM-DD, inclusive) as a pyarrow Table."""
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        root = os.path.join(self.directory, table)
+        schema = _schemas()[table]
+        if not os.path.isdir(root):
+            return schema.empty_table()
+        dataset = ds.dataset(root, format="parquet", schema=schema.append(pa.field("date", pa.string())),
+                             partitioning=ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive"),
+                             exclude_invalid_files=True)
+        condition = None
+        for op, value in (("ge", since), ("le", until)):
+            if value:
+                term = getattr(ds.field("date"), f"__{op}__")(value)
+                condition = term if condition is None else condition & term
+        return dataset.to_table(columns=columns, filter=condition)
+
+_store = {}
+_store_lock = threading.Lock()
+
+def get_store():
+    """Return the process-wide analytics store."""
+    with _store_lock:
+        if "store" not in _store:
+            _store["store"] = AnalyticsStore()
+        return _store["store"]
+
+def record_run(user_id, audio_hash, file_name, analysis_type, settings, run, run_info, result="", audio_bytes=0,
+               mode=None):
+    """Append one finished run; run is the dict of metrics.track_run(). Never raises."""
+    if not available():
+        return
+    try:
+        get_store().append(run_rows(user_id, audio_hash, file_name, analysis_type, settings, run, run_info,
+                                    result, audio_bytes, mode=mode))
+    except Exception as e:
+        # Analytics must never fail the analysis it describes
+        print(json.dumps({"event": "analytics_error", "error": str(e)}), flush=True)
+
+def daily_summary(store, since=None, until=None):
+    """Return a pandas DataFrame of per-day run counts, latency percentiles, tokens and cost."""
+    runs = store.read("runs", since, until).to_pandas()
+    segments = store.read("segments", since, until, columns=["date", "seconds"]).to_pandas()
+    if runs.empty:
+        return runs
+    days = runs.groupby("date").agg(
+        runs=("run_id", "count"),
+        succeeded=("outcome", lambda o: (o == "success").mean()),
+        run_p50_s=("seconds", "median"),
+        run_p95_s=("seconds", lambda s: s.quantile(0.95)),
+        tokens=("input_tokens", "sum"),
+        output_tokens=("output_tokens", "sum"),
+        cost_usd=("cost_usd", "sum"),
+        action_items=("action_items", "sum"),
+    )
+    if not segments.empty:
+        by_day = segments.groupby("date")["seconds"]
+        days["segment_p50_s"] = by_day.median()
+        days["segment_p95_s"] = by_day.quantile(0.95)
+    days["tokens"] += days.pop("output_tokens")
+    return days
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="per-day runs, latency, tokens and cost")
+    export = commands.add_parser("export", help="write one table to a single Parquet or CSV file")
+    export.add_argument("table", choices=TABLES)
+    export.add_argument("out", help="output path; .csv writes CSV, anything else Parquet")
+    for command in (summary, export):
+        command.add_argument("--since", help="first date (YYYY-MM-DD)")
+        command.add_argument("--until", help="last date (YYYY-MM-DD)")
+    commands.add_parser("compact", help="merge the files of every partition before today")
+    return parser.parse_args(argv)
+
+def main(args):
+    store = get_store()
+    if args.command == "compact":
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        print(f"Merged {store.compact(before=today)} file(s)")
+    elif args.command == "export":
+        table = store.read(args.table, args.since, args.until)
+        if args.out.endswith(".csv"):
+            import pyarrow.csv as csv
+            if args.table == "runs":
+                table = table.drop_columns(["speaker_words"])
+            csv.write_csv(table, args.out)
+        else:
+            import pyarrow.parquet as pq
+            pq.write_table(table, args.out, compression="zstd")
+        print(f"Wrote {table.num_rows} row(s) to {args.out}")
+    else:
+        import pandas as pd
+        with pd.option_context("display.width", 200, "display.max_columns", None):
+            print(daily_summary(store, args.since, args.until).round(3))
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,444 +1,473 @@
 import streamlit as st
-import google.generativeai as genai
 from datetime import datetime
+import json
 import os
-import tempfile
 import time
-import io
-import base64
+from concurrent.futures import wait
+from contextlib import nullcontext
+import analytics
+import metrics
+import startup
+import usage
+import routing
+import segments
+import singleflight
+import compaction
+import batch
+import profiling
+import pipeline
+from pipeline import get_genai, initialize_genai
+from results_store import ResultsStore, base_analysis_type, content_hash, is_error_result, segment_plan_key
+from cancellation import CancelToken
 
-def initialize_genai(api_key):
-    """Initialize the Gemini AI model."""
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel("gemini-2.5-flash")
+# The analysis itself lives in pipeline.py; this page draws its progress and results.
+# The Gemini SDK and the NumPy-based audio modules are imported on first use
+# (or prewarmed after the first render), see startup.py
 
-def get_analysis_prompt(analysis_type):
-    """Return a specific prompt based on the selected analysis type."""
-    base_type = analysis_type.split(" - ")[0]
+def streamlit_progress():
+    """Return a progress callback drawing a progress bar and status line on first use."""
+    widgets = {}
     
-    prompts = {
-        "Transcript & Summary": """Please provide both a clean, accurate transcript of this audio file AND a comprehensive summary of the content.
+    def progress(fraction, message):
+        if not widgets:
+            widgets["bar"] = st.progress(0)
+            widgets["status"] = st.empty()
+        widgets["bar"].progress(fraction)
+        widgets["status"].text(message)
+    return progress
 
-        PART 1 - TRANSCRIPT:
-        Please provide a clean, accurate transcript of this audio file. Do not try to associate names that may be mentioned in the audio to piece of text in the transcript.
+def streamlit_log(level, message):
+    """Log callback showing pipeline messages as st.info / st.warning / st.error."""
+    getattr(st, level)(message)
 
-        PART 2 - SUMMARY:
-        Please provide a comprehensive meeting summary with the following elements:
+def process_audio(audio_file, analysis_type, model, use_segmentation=False, num_segments=2, run_info=None,
+                  cancel_token=None, completed_segments=None, job_key=None):
+    """Run pipeline.process_audio with its progress and messages drawn on the page."""
+    return pipeline.process_audio(audio_file, analysis_type, model, use_segmentation, num_segments, run_info,
+                                  cancel_token, completed_segments, streamlit_progress(), streamlit_log, job_key)
 
-        1. Meeting Overview:
-        - Identify all participants and their roles
-        - Extract the main purpose/objective of the meeting
-        - Note the overall tone and engagement level
-        
-        2. Key Discussion Points:
-        - List and elaborate on the major topics discussed
-        - Highlight any decisions made or conclusions reached
-        - Capture important questions raised and their answers
-        
-        3. Action Items & Next Steps:
-        - Extract all tasks and assignments
-        - Include who is responsible for each item
-        - Note any mentioned deadlines or timeframes
-        - Flag any items marked as high priority
-        
-        4. Follow-up Requirements:
-        - List any scheduled follow-up meetings
-        - Note any documents or resources that were requested
-        - Identify any pending decisions or unresolved issues
-        
-        5. Notable Quotes & Key Insights:
-        - Extract significant statements or important insights
-        - Include context for each notable point
-        - Highlight any strategic or innovative ideas proposed
-        
-        6. Additional Context:
-        - Note any important references to past meetings or decisions
-        - Capture any mentioned risks or concerns
-        - Highlight any budget or resource discussions
-        
-        Please organize this information in a clear, concise format while maintaining the natural flow of the discussion.
-        Format your response with clear headings separating the transcript and summary sections.""",
-        
-        "Transcription": "Please provide a clean, accurate transcript of this audio file.",
-        
-        "Summary": """Please provide a comprehensive summary of this audio content, including:
-        - Main topics discussed
-        - Key points and takeaways
-        - Overall context and purpose
-        Keep the summary clear and concise while capturing all important information.""",
-        
-        "Meeting Summary": """Please provide a comprehensive meeting summary with the following elements:
+def process_new_portions(audio_file, match, prior_transcript, analysis_type, model, run_info=None,
+                         cancel_token=None):
+    """Run pipeline.process_new_portions with its messages shown on the page."""
+    return pipeline.process_new_portions(audio_file, match, prior_transcript, analysis_type, model, run_info,
+                                         cancel_token, streamlit_log)
 
-        1. Meeting Overview:
-        - Identify all participants and their roles
-        - Extract the main purpose/objective of the meeting
-        - Note the overall tone and engagement level
-        
-        2. Key Discussion Points:
-        - List and elaborate on the major topics discussed
-        - Highlight any decisions made or conclusions reached
-        - Capture important questions raised and their answers
-        
-        3. Action Items & Next Steps:
-        - Extract all tasks and assignments
-        - Include who is responsible for each item
-        - Note any mentioned deadlines or timeframes
-        - Flag any items marked as high priority
-        
-        4. Follow-up Requirements:
-        - List any scheduled follow-up meetings
-        - Note any documents or resources that were requested
-        - Identify any pending decisions or unresolved issues
-        
-        5. Notable Quotes & Key Insights:
-        - Extract significant statements or important insights
-        - Include context for each notable point
-        - Highlight any strategic or innovative ideas proposed
-        
-        6. Additional Context:
-        - Note any important references to past meetings or decisions
-        - Capture any mentioned risks or concerns
-        - Highlight any budget or resource discussions
-        
-        Please organize this information in a clear, concise format while maintaining the natural flow of the discussion. Include approximate timestamps for major topic transitions.""",
-                
-        "Key Quotes": """Extract the most significant and impactful quotes from this audio.
-        For each quote, provide:
-        - The exact quote
-        - Who said it (if identifiable)
-        - Context around the quote""",
-        
-        "Content Analysis": """Perform a detailed content analysis of this audio, including:
-        - Tone and mood analysis
-        - Key themes and patterns
-        - Notable linguistic features
-        - Emotional content
-        - Professional vs casual language use""",
-        
-        "Action Items": """Extract all action items, next steps, and commitments mentioned in this audio.
-        Include:
-        - Who is responsible (if mentioned)
-        - Deadlines or timeframes (if specified)
-        - Priority level (if indicated)"""
-    }
-    return prompts.get(base_type)
+@st.cache_resource
+def get_results_store():
+    """Return the archive of past analyses shared by all sessions."""
+    return ResultsStore()
 
-def get_full_context_prompt(analysis_type):
-    """Get the full context prompt for combined transcripts."""
-    base_type = analysis_type.split(" - ")[0]
+def render_archive_search(store, user_id):
+    """Render the sidebar search over the user's previously archived analyses."""
+    st.sidebar.subheader("Search Past Analyses")
+    query = st.sidebar.text_input('Keywords or "exact phrase"', key="archive_query")
+    if not query:
+        return
+    
+    started = time.perf_counter()
+    matches = store.search(user_id, query)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    st.sidebar.caption(f"{len(matches)} match(es) in {elapsed_ms:.1f} ms")
     
-    prompts = {
-        "Transcript & Summary": """I will provide you with the combined transcripts from different segments of a long audio file. 
-        Please analyze all these transcripts together as a single continuous conversation.
-        
-        Focus ONLY on creating a COMPREHENSIVE SUMMARY with the following elements:
-        
-        1. Meeting Overview:
-        - Identify all participants and their roles
-        - Extract the main purpose/objective of the meeting
-        - Note the overall tone and engagement level
-        
-        2. Key Discussion Points:
-        - List and elaborate on the major topics discussed
-        - Highlight any decisions made or conclusions reached
-        - Capture important questions raised and their answers
-        
-        3. Action Items & Next Steps:
-        - Extract all tasks and assignments
-        - Include who is responsible for each item
-        - Note any mentioned deadlines or timeframes
-        - Flag any items marked as high priority
-        
-        4. Follow-up Requirements:
-        - List any scheduled follow-up meetings
-        - Note any documents or resources that were requested
-        - Identify any pending decisions or unresolved issues
-        
-        5. Notable Quotes & Key Insights:
-        - Extract significant statements or important insights
-        - Include context for each notable point
-        - Highlight any strategic or innovative ideas proposed
-        
-        6. Additional Context:
-        - Note any important references to past meetings or decisions
-        - Capture any mentioned risks or concerns
-        - Highlight any budget or resource discussions
-        
-        DO NOT include the transcript in your response - I will handle adding it separately.
-        Just focus on creating the best possible summary of the content.
-        
-        Here are the combined transcripts:
-        
-        """,
-        
-        "Transcription": """I will provide you with the combined transcripts from different segments of a long audio file. 
-        Please compile these into a single, clean, accurate transcript of the complete audio, maintaining the flow as if it were one continuous transcription:
-        
-        """,
-        
-        "Summary": """I will provide you with the combined transcripts from different segments of a long audio file.
-        Please analyze all these transcripts together and provide a comprehensive summary of the entire content, including:
-        - Main topics discussed across the entire recording
-        - Key points and takeaways
-        - Overall context and purpose
-        Keep the summary clear and concise while capturing all important information from the entire recording.
-        
-        Here are the combined transcripts:
-        
-        """,
-        
-        "Meeting Summary": """I will provide you with the combined transcripts from different segments of a long audio file.
-        Please analyze all these transcripts together as a single continuous meeting and provide a comprehensive meeting summary with the following elements:
+    for record in matches:
+        created = datetime.fromtimestamp(record["created_at"]).strftime("%Y-%m-%d %H:%M")
+        with st.sidebar.expander(f"{record['file_name']} · {record['analysis_type']} · {created}"):
+            st.write(record["snippet"])
+            if st.button("Open result", key=f"open_record_{record['id']}"):
+                st.session_state.analysis_result = record["result"]
+                st.session_state.result_file_name = record["file_name"]
+                st.session_state.result_record_id = record["id"]
 
-        1. Meeting Overview:
-        - Identify all participants and their roles
-        - Extract the main purpose/objective of the meeting
-        - Note the overall tone and engagement level
-        
-        2. Key Discussion Points:
-        - List and elaborate on the major topics discussed
-        - Highlight any decisions made or conclusions reached
-        - Capture important questions raised and their answers
-        
-        3. Action Items & Next Steps:
-        - Extract all tasks and assignments
-        - Include who is responsible for each item
-        - Note any mentioned deadlines or timeframes
-        - Flag any items marked as high priority
-        
-        4. Follow-up Requirements:
-        - List any scheduled follow-up meetings
-        - Note any documents or resources that were requested
-        - Identify any pending decisions or unresolved issues
-        
-        5. Notable Quotes & Key Insights:
-        - Extract significant statements or important insights
-        - Include context for each notable point
-        - Highlight any strategic or innovative ideas proposed
-        
-        6. Additional Context:
-        - Note any important references to past meetings or decisions
-        - Capture any mentioned risks or concerns
-        - Highlight any budget or resource discussions
-        
-        Here are the combined transcripts:
-        
-        """,
-                
-        "Key Quotes": """I will provide you with the combined transcripts from different segments of a long audio file.
-        Please analyze all these transcripts together and extract the most significant and impactful quotes from the entire recording.
-        For each quote, provide:
-        - The exact quote
-        - Who said it (if identifiable)
-        - Context around the quote
-        
-        Here are the combined transcripts:
-        
-        """,
-        
-        "Content Analysis": """I will provide you with the combined transcripts from different segments of a long audio file.
-        Please analyze all these transcripts together and perform a detailed content analysis of the entire recording, including:
-        - Tone and mood analysis
-        - Key themes and patterns
-        - Notable linguistic features
-        - Emotional content
-        - Professional vs casual language use
-        
-        Here are the combined transcripts:
-        
-        """,
-        
-        "Action Items": """I will provide you with the combined transcripts from different segments of a long audio file.
-        Please analyze all these transcripts together and extract all action items, next steps, and commitments mentioned throughout the entire recording.
-        Include:
-        - Who is responsible (if mentioned)
-        - Deadlines or timeframes (if specified)
-        - Priority level (if indicated)
-        
-        Here are the combined transcripts:
-        
-        """
-    }
-    return prompts.get(base_type, "")
+def rate_result(store, record_id, widget_key):
+    """Feedback callback storing the user's rating of a result against its route."""
+    rating = st.session_state.get(widget_key)
+    record = store.get(record_id)
+    if rating is None or record is None:
+        return
+    store.rate(record_id, rating)
+    metrics.RESULT_RATINGS.inc(route=routing.route_label(record["settings"].get("model", "")),
+                               rating="up" if rating else "down")
 
-def process_audio_segments(audio_file, analysis_type, model, num_segments=2):
-    """Process audio by sending it in segments to Gemini model."""
-    try:
-        # Create a progress bar and status text
-        progress = st.progress(0)
-        status_text = st.empty()
-        
-        # For longer audio, send in parts and collect transcripts
-        status_text.text("Processing audio in segments...")
-        
-        # Save audio to a temporary file to get direct file access
-        temp = tempfile.NamedTemporaryFile(delete=False, suffix='.' + audio_file.name.split('.')[-1])
-        temp.write(audio_file.getvalue())
-        temp.close()
-        
-        # Process in segments directly
-        transcripts = []
-        segment_texts = []
-        
-        for i in range(num_segments):
-            status_text.text(f"Processing segment {i+1}/{num_segments}...")
-            
-            # We're going to send the entire file, but with instructions to process a specific segment
-            segment_prompt = f"""Please transcribe only the {ordinal(i+1)} segment of this audio (approximately from {i/num_segments:.0%} to {(i+1)/num_segments:.0%} of the total duration).
-            Focus only on this portion of the audio and ignore the rest."""
-            
-            # Read file as bytes and create Part object
-            with open(temp.name, 'rb') as f:
-                audio_bytes = f.read()
-            
-            # Create audio part with inline data
-            file_ext = audio_file.name.split('.')[-1].lower()
-            mime_types = {
-                'mp3': 'audio/mpeg',
-                'wav': 'audio/wav',
-                'm4a': 'audio/mp4'
-            }
-            mime_type = mime_types.get(file_ext, 'audio/mpeg')
-            
-            audio_part = {
-                'mime_type': mime_type,
-                'data': audio_bytes
-            }
-            
-            response = model.generate_content([audio_part, segment_prompt])
-            
-            segment_text = response.text
-            segment_texts.append(segment_text)
-            transcripts.append(f"--- SEGMENT {i+1}/{num_segments} TRANSCRIPT ---\n{segment_text}")
-            progress.progress((i + 1) / (num_segments + 1))
-        
-        # Clean up the temporary file
-        try:
-            os.unlink(temp.name)
-        except:
-            st.warning(f"Could not remove temporary file: {temp.name}")
-        
-        # Build a clean full transcript
-        full_transcript = "\n\n".join(segment_texts)
-        
-        # Process all transcripts for the final analysis - but don't include transcript in the result
-        status_text.text("Generating final analysis from all segments...")
-        summary_result = process_transcripts(transcripts, analysis_type, model)
-        progress.progress(1.0)
-        status_text.text("Analysis complete!")
-        
-        if analysis_type.startswith("Transcript & Summary"):
-            # For transcript & summary type, manually combine transcript and summary
-            final_result = f"""# COMPLETE TRANSCRIPT
+def request_cancel():
+    """Button callback recording that the user stopped the running analysis."""
+    st.session_state.analysis_cancelled = True
 
-{full_transcript}
+def start_cancellable_run():
+    """Render the cancel control for the run about to start and return its token."""
+    st.button("⏹️ Cancel analysis", on_click=request_cancel, key="cancel_analysis")
+    elapsed_text = st.empty()
+    started = time.time()
+    return CancelToken(on_wait=lambda: elapsed_text.caption(f"⏱️ {time.time() - started:.0f}s elapsed"))
 
-# COMPREHENSIVE SUMMARY
+@st.cache_resource
+def get_fingerprint_index():
+    """Return the fingerprint index of previously analyzed audio."""
+    from fingerprint import FingerprintIndex
+    return FingerprintIndex()
 
-{summary_result}"""
-            return final_result
-        else:
-            # For other types, just return the LLM output
-            return summary_result
-    
-    except Exception as e:
-        st.error(f"Error processing audio: {str(e)}")
-        return f"Error processing audio: {str(e)}"
+@st.cache_resource
+def get_usage_ledger():
+    """Return the token usage ledger shared by all sessions."""
+    return usage.UsageLedger()
 
-def ordinal(n):
-    """Return the ordinal representation of a number."""
-    if 10 <= n % 100 <= 20:
-        suffix = 'th'
-    else:
-        suffix = {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
-    return f"{n}{suffix}"
+def render_usage(ledger, user_id):
+    """Show today's token usage and spend for the current API key in the sidebar."""
+    tokens, cost = ledger.spent_since(user_id, usage.start_of_day())
+    budget = usage.budget_for(user_id)
+    limits = []
+    if budget.get("daily_tokens") is not None:
+        limits.append(f"{budget['daily_tokens']:,} tokens")
+    if budget.get("daily_cost_usd") is not None:
+        limits.append(f"${budget['daily_cost_usd']:.2f}")
+    line = f"{tokens:,} tokens · ${cost:.2f}"
+    if limits:
+        line += " of " + " / ".join(limits)
+    st.sidebar.subheader("Usage Today")
+    st.sidebar.caption(line)
+
+def budgeted_run_settings(user_id, audio_file, model, num_segments, reused_segments=0, run_info=None):
+    """Apply the user's daily budget before dispatching a run.
 
-def process_transcripts(transcripts, analysis_type, model):
-    """Process the combined transcripts with the final analysis."""
+    reused_segments is how many segment transcripts are already memoized and
+    cost nothing. Returns the (model, num_segments) to run with, possibly
+    downgraded, or None when the run is refused. The reason is shown to the
+    user either way. The run's estimated spend is reserved in run_info until
+    its usage is recorded (see usage.check_budget).
+    """
+    planned = routing.stage_models(model, len(audio_file.getvalue()))
     try:
-        # Combine all transcripts with the full context prompt
-        full_prompt = get_full_context_prompt(analysis_type) + "\n".join(transcripts)
-        
-        # Send to Gemini for final analysis with appropriate configuration
-        response = model.generate_content(full_prompt, 
-                                          generation_config=genai.types.GenerationConfig(
-                                              temperature=0.2,  # Lower temperature for more precise output
-                                              max_output_tokens=16000  # Allow enough space for detailed summary
-                                          ))
-        return response.text
-    except Exception as e:
-        return f"Error processing combined transcripts: {str(e)}"
+        model_name, num_segments, note = usage.check_budget(
+            get_usage_ledger(), user_id, len(audio_file.getvalue()), planned, num_segments, reused_segments,
+            run_info=run_info)
+    except usage.BudgetExceeded as e:
+        st.error(str(e))
+        return None
+    if note:
+        # Downgraded runs send every stage to the lighter model
+        st.warning(note)
+        model = get_genai().GenerativeModel(model_name)
+    return model, num_segments
 
-def process_audio(audio_file, analysis_type, model, use_segmentation=False, num_segments=2):
-    """Process the audio file with or without segmentation based on user selection."""
-    if use_segmentation:
-        return process_audio_segments(audio_file, analysis_type, model, num_segments)
-    else:
+def run_analysis(store, user_id, audio_file, audio_hash, selected_type, model, num_segments,
+                 reuse_segments=None, trim_silence=False, trim=None):
+    """Run one analysis with budget checks, a cancel control, usage accounting and archiving.
+
+    audio_file is the audio to send and audio_hash identifies the original
+    upload. When silence was trimmed (trim, see silence.trim_silence), the
+    timestamps in the result and transcript are mapped back to the original
+    recording. num_segments is 0 for single-shot mode. Segments in reuse_segments
+    (index -> record) are not sent again; by default every segment memoized
+    for the same audio and segmentation plan is reused, so switching the
+    analysis type only redoes the reduce. Returns the result text, or None when
+    the budget refused the run.
+    """
+    audio_size = len(audio_file.getvalue())
+    
+    def plan_key_for(run_model, run_segments):
+        return segment_plan_key(audio_hash, routing.stage_model_name(run_model, "segment", audio_size), run_segments,
+                                trim is not None)
+    
+    memoized = reuse_segments is None and num_segments > 0
+    if memoized:
+        reuse_segments = store.load_segments(plan_key_for(model, num_segments))
+    run_info = {}
+    budgeted = budgeted_run_settings(user_id, audio_file, model, num_segments, len(reuse_segments or {}), run_info)
+    if not budgeted:
+        return None
+    
+    # A downgraded run is archived under the settings it actually used
+    run_model, run_segments = budgeted
+    if memoized and (run_model is not model or run_segments != num_segments):
+        reuse_segments = store.load_segments(plan_key_for(run_model, run_segments))
+    num_segments = run_segments
+    settings = {"model": routing.stage_models(run_model, audio_size), "num_segments": num_segments,
+                "trim_silence": trim_silence}
+    use_segmentation = num_segments > 0
+    plan_key = plan_key_for(run_model, num_segments)
+    if memoized:
+        metrics.CACHE_LOOKUPS.inc(cache="segment_memo", result="hit" if reuse_segments else "miss")
+        if len(reuse_segments) == num_segments:
+            st.info(f"All {num_segments} segment transcripts are already known: only the final analysis will run.")
+        elif reuse_segments:
+            st.info(f"Reusing {len(reuse_segments)} of {num_segments} segment transcript(s) from an earlier run of this file.")
+    
+    if trim is not None:
+        metrics.SILENCE_TRIMMED_SECONDS.inc(trim["removed_seconds"])
+        metrics.UPLOAD_BYTES_SAVED.inc(trim["bytes_saved"])
+    
+    # Profiling is opt-in per session; without a profiler the pipeline's hooks are no-ops
+    profiler = profiling.RunProfiler() if st.session_state.get("profile_runs") else None
+    if profiler:
+        run_info["profiler"] = profiler
+    cancel_token = start_cancellable_run()
+    finished = False
+    mode = "segmented" if use_segmentation else "single"
+    run, result = {}, ""
+    try:
+        with metrics.track_run(selected_type, mode) as run, st.spinner("Processing audio..."), \
+                (profiler or nullcontext()), profiling.span(run_info, "analysis", mode=mode):
+            result = process_audio(audio_file, selected_type, run_model, use_segmentation, num_segments,
+                                   run_info, cancel_token, reuse_segments,
+                                   singleflight.job_key(audio_hash, selected_type, settings, reuse_segments or {}))
+            finished = not is_error_result(result)
+            if not finished:
+                run["outcome"] = "error"
+        if finished and run_info.get("compaction", {}).get("level", "off") != "off":
+            st.caption(compaction.describe(run_info["compaction"]))
+    finally:
+        get_usage_ledger().record_run(user_id, selected_type, run_info)
+        analytics.record_run(user_id, audio_hash, audio_file.name, selected_type, settings, run, run_info, result,
+                             audio_size)
+        # Memoize every transcribed segment, so a retry or another analysis type skips them
+        transcribed = segments.completed(run_info.get("segments", []))
+        if transcribed:
+            store.save_segments(plan_key, transcribed)
+            if not finished:
+                st.session_state.kept_segments = len(transcribed)
+        if run_info.get("segments"):
+            st.session_state.segment_run = {"audio_hash": audio_hash, "records": run_info["segments"],
+                                            "offset_map": trim["offset_map"] if trim else None}
+        if profiler:
+            st.session_state.profile_artifact = {"file_name": audio_file.name, "data": profiler.artifact()}
+    
+    st.session_state.result_record_id = None
+    structured_data = run_info.get("structured")
+    if finished and trim is not None:
+        import silence
+        result = silence.remap_timestamps(result, trim["offset_map"])
+        run_info["transcript"] = silence.remap_timestamps(run_info.get("transcript", ""), trim["offset_map"])
+        if structured_data:
+            structured_data["transcript"] = run_info["transcript"]
+    if finished:
+        st.session_state.result_record_id = store.save(
+            user_id, audio_hash, audio_file.name, selected_type, settings, result, run_info.get("transcript", ""))
+        # Kept with the result it belongs to, so it is only offered while that result is shown
+        st.session_state.structured_result = {"result": result, "data": structured_data} if structured_data else None
+    return result
+
+def rerun_segments(store, user_id, audio_file, audio_hash, selected_type, model, records, indices,
+                   trim_silence=False, trim=None):
+    """Send only the chosen segments again, reuse every other finished one, and redo the reduce."""
+    keep = {i: r for i, r in segments.completed(records).items() if i not in indices}
+    return run_analysis(store, user_id, audio_file, audio_hash, selected_type, model, len(records), keep,
+                        trim_silence, trim)
+
+def render_segment_records(records, offset_map=None):
+    """Show the segments of the last long-audio run; return the indices chosen for a re-run.
+
+    With an offset_map from silence trimming, times are shown in original-recording time.
+    """
+    if offset_map:
+        import silence
+        records = [
+            dict(r, start_seconds=silence.to_original(r["start_seconds"], offset_map),
+                 end_seconds=silence.to_original(r["end_seconds"], offset_map))
+            if r["start_seconds"] is not None else r
+            for r in records
+        ]
+    failed = [r["index"] for r in records if r["status"] == segments.FAILED]
+    usable = len(segments.completed(records))
+    with st.expander(f"Segments: {usable}/{len(records)} transcribed", expanded=bool(failed)):
+        st.dataframe([
+            {
+                "Segment": r["index"] + 1,
+                "Time": segments.format_time_range(r),
+                "Status": r["status"],
+                "Seconds": round(r["seconds"], 1) if r["seconds"] is not None else None,
+                "Tokens in/out": f"{r['input_tokens']:,} / {r['output_tokens']:,}",
+                "Transcript": r["error"] or r["text"][:120],
+            }
+            for r in records
+        ], hide_index=True)
+        chosen = st.multiselect("Segments to re-run", [r["index"] for r in records], default=failed,
+                                format_func=lambda i: f"Segment {i + 1}")
+        if st.button("🔁 Re-run selected segments", disabled=not chosen):
+            return chosen
+    return None
+
+def prepare_upload(audio_file, audio_hash):
+    """Trim long silences from an upload once per session.
+
+    Returns (upload, trim): the audio to send, and the trim report with its
+    offset map, or None when nothing was cut or the audio cannot be decoded here.
+    """
+    from audio_io import AudioClip, AudioDecodeError
+    import silence
+    
+    trims = st.session_state.setdefault("silence_trims", {})
+    if audio_hash not in trims:
         try:
-            # Create a temporary file
-            tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.' + audio_file.name.split('.')[-1])
-            tmp_file_path = tmp_file.name
-            tmp_file.write(audio_file.getvalue())
-            tmp_file.close()  # Close the file handle immediately
+            trims[audio_hash] = silence.trim_silence(audio_file.getvalue(), audio_file.name, audio_hash=audio_hash)
+        except AudioDecodeError:
+            trims[audio_hash] = None
+    trim = trims[audio_hash]
+    if trim is None:
+        return audio_file, None
+    st.caption(silence.describe(trim))
+    return AudioClip(audio_file.name, trim["data"]), trim
 
+def find_similar_audio(user_id, audio_file, audio_hash, fingerprints):
+    """Fingerprint an upload once per session and return (fingerprint, the user's matches)."""
+    from audio_io import AudioDecodeError
+    from fingerprint import fingerprint_audio
+    
+    checks = st.session_state.setdefault("fingerprint_checks", {})
+    if (user_id, audio_hash) not in checks:
+        try:
+            fingerprint = fingerprint_audio(audio_file.getvalue(), audio_file.name, audio_hash)
+            matches = fingerprints.find_matches(user_id, fingerprint, exclude_hash=audio_hash)
+        except AudioDecodeError:
+            # Without a local decoder we simply fall back to exact-hash caching
+            fingerprint, matches = None, []
+        checks[(user_id, audio_hash)] = (fingerprint, matches)
+    return checks[(user_id, audio_hash)]
+
+def render_similar_audio(match, store, audio_file, audio_hash, selected_type, settings, model, user_id):
+    """Offer to reuse or extend the analysis of a near-duplicate recording.
+
+    Returns (result, transcript) when the user chose one of the offers, else None.
+    """
+    from fingerprint import new_portions
+    
+    prior_records = store.records_for_content(user_id, match["content_hash"])
+    if not prior_records:
+        return None
+    
+    if match["kind"] == "duplicate":
+        st.warning(f"🔁 This looks like another copy of **{match['file_name']}**, which was analyzed before.")
+    else:
+        st.warning(f"🔁 {match['coverage']:.0%} of this file overlaps **{match['file_name']}** "
+                   f"({match['overlap_start']:.0f}s to {match['overlap_end']:.0f}s), which was analyzed before.")
+    
+    same_type = [r for r in prior_records if r["analysis_type"] == base_analysis_type(selected_type)]
+    if same_type and st.button("♻️ Reuse previous result"):
+        return same_type[0]["result"], same_type[0]["transcript"]
+    
+    with_transcript = [r for r in prior_records if r["transcript"]]
+    if match["kind"] == "overlap" and with_transcript and new_portions(match):
+        if st.button("✂️ Analyze only the new portion"):
+            run_info = {}
+            budgeted = budgeted_run_settings(user_id, audio_file, model, 0, run_info=run_info)
+            if budgeted is None:
+                return None
+            model = budgeted[0]
+            run, result = {}, ""
+            cancel_token = start_cancellable_run()
             try:
-                # Read file as bytes and create Part object
-                with open(tmp_file_path, 'rb') as f:
-                    audio_bytes = f.read()
-                
-                # Create audio part with inline data
-                file_ext = audio_file.name.split('.')[-1].lower()
-                mime_types = {
-                    'mp3': 'audio/mpeg',
-                    'wav': 'audio/wav',
-                    'm4a': 'audio/mp4'
-                }
-                mime_type = mime_types.get(file_ext, 'audio/mpeg')
-                
-                audio_part = {
-                    'mime_type': mime_type,
-                    'data': audio_bytes
-                }
-                
-                prompt = get_analysis_prompt(analysis_type)
-                response = model.generate_content([audio_part, prompt])
-                result = response.text
-                
-                # For transcript & summary type without segmentation, we need to handle it specially
-                if analysis_type.startswith("Transcript & Summary"):
-                    # Extract parts
-                    result_parts = result.split("PART 2 - SUMMARY")
-                    if len(result_parts) == 2:
-                        transcript_part = result_parts[0].replace("PART 1 - TRANSCRIPT:", "").strip()
-                        summary_part = "PART 2 - SUMMARY" + result_parts[1].strip()
-                        result = f"""# COMPLETE TRANSCRIPT
+                with metrics.track_run(selected_type, "new_portion") as run, st.spinner("Processing new audio only..."):
+                    result = process_new_portions(audio_file, match, with_transcript[0]["transcript"],
+                                                  selected_type, model, run_info, cancel_token)
+                    if is_error_result(result):
+                        run["outcome"] = "error"
+            finally:
+                get_usage_ledger().record_run(user_id, selected_type, run_info)
+                audio_size = len(audio_file.getvalue())
+                # Recorded under the route actually used, which the budget may have downgraded
+                analytics.record_run(user_id, audio_hash, audio_file.name, selected_type,
+                                     dict(settings, model=routing.stage_models(model, audio_size)), run, run_info,
+                                     result, audio_size, mode="new_portion")
+            return result, run_info.get("transcript", "")
+    return None
 
-{transcript_part}
+def result_download_name(file_name):
+    """Return the download name for a result: the analyzed file's name plus a timestamp."""
+    current_time = datetime.now().strftime("%Y%m%d_%H%M")
+    
+    # Get the original filename without extension and replace spaces with underscores
+    original_filename = os.path.splitext(file_name or "analysis")[0]
+    original_filename = original_filename.replace(" ", "_")
+    
+    # Create new filename with original file name and timestamp
+    return f"{original_filename}_{current_time}.txt"
 
-# COMPREHENSIVE SUMMARY
+def run_batch(store, user_id, audio_files, selected_type, model, num_segments, trim_silence, reuse_archived):
+    """Analyze several uploads concurrently, drawing per-file progress and each result as it finishes."""
+    
+    # The cancel control's token redraws the page, so the workers get a plain token of their own
+    elapsed = start_cancellable_run()
+    cancel_token = CancelToken()
+    fingerprints = get_fingerprint_index()
+    scheduler = batch.get_scheduler()
+    jobs = [batch.new_job(audio_file.name) for audio_file in audio_files]
+    futures = [
+        scheduler.submit(user_id, batch.analyze_file, job, audio_file, content_hash(audio_file.getvalue()),
+                         selected_type, model, num_segments, trim_silence, reuse_archived, store,
+                         get_usage_ledger(), user_id, cancel_token, fingerprints)
+        for job, audio_file in zip(jobs, audio_files)
+    ]
+    
+    slots = [st.empty() for _ in jobs]
+    # Live view while the files run; replaced by render_batch_results() once all are finished
+    live_results = st.empty()
+    results_area = live_results.container()
+    shown = set()
+    try:
+        while True:
+            for i, (slot, job) in enumerate(zip(slots, jobs)):
+                slot.progress(job["fraction"], text=batch.status_line(job))
+                if job["status"] in batch.FINISHED and i not in shown:
+                    shown.add(i)
+                    render_batch_result(results_area, job, i, "batch_live")
+            if all(future.done() for future in futures):
+                break
+            wait(futures, timeout=0.5)
+            elapsed.on_wait()
+    except BaseException:
+        # Streamlit stops the script this way when the user clicks Cancel: stop the queued and running files
+        cancel_token.cancel()
+        for future in futures:
+            future.cancel()
+        raise
+    for slot in slots:
+        slot.empty()
+    live_results.empty()
+    st.session_state.batch_jobs = jobs
 
-{summary_part}"""
-                
-            finally:
-                # Add a small delay before trying to remove the file
-                time.sleep(0.5)
-                if os.path.exists(tmp_file_path):
-                    try:
-                        os.unlink(tmp_file_path)
-                    except Exception as cleanup_error:
-                        st.warning(f"Warning: Could not remove temporary file {tmp_file_path}: {cleanup_error}")
-            
-            return result
-            
-        except Exception as e:
-            return f"Error processing audio: {str(e)}"
+def render_batch_result(container, job, index, key_prefix="batch_result"):
+    """Show one finished file of a batch."""
+    icon = {"done": "✅", "failed": "❌", "cancelled": "⏹️"}[job["status"]]
+    with container.expander(f"{icon} {job['file_name']}", expanded=False):
+        if job["status"] == "done":
+            st.text_area("Output", job["result"], height=250, key=f"{key_prefix}_{index}")
+        else:
+            st.error(job["message"])
+
+def render_batch_results(jobs):
+    """Show the results of the last batch with a single zip download."""
+    st.subheader("Batch Results")
+    done = sum(job["status"] == batch.DONE for job in jobs)
+    started = [job["started_at"] for job in jobs if job["started_at"]]
+    finished = [job["finished_at"] for job in jobs if job["finished_at"]]
+    if started and finished:
+        st.caption(f"{done} of {len(jobs)} file(s) analyzed in {max(finished) - min(started):.0f}s.")
+    for i, job in enumerate(jobs):
+        render_batch_result(st, job, i)
+    if done:
+        current_time = datetime.now().strftime("%Y%m%d_%H%M")
+        st.download_button(
+            label=f"💾 Download {done} result(s) (.zip)",
+            data=batch.results_zip(jobs, result_download_name),
+            file_name=f"analysis_results_{current_time}.zip",
+            mime="application/zip"
+        )
 
 def main():
+    startup.before_render()
+    metrics.serve()
     st.title("Advanced Audio Analysis Tool")
     
     # Initialize session state for storing results
     if 'analysis_result' not in st.session_state:
         st.session_state.analysis_result = ""
+    if 'result_file_name' not in st.session_state:
+        st.session_state.result_file_name = ""
+    
+    store = get_results_store()
+    
+    if st.session_state.pop("analysis_cancelled", False):
+        kept = st.session_state.pop("kept_segments", 0)
+        note = f" {kept} finished segment(s) were kept and will be reused if you analyze this file again." if kept else ""
+        st.warning(f"Analysis cancelled.{note}")
     
     # Analysis options with descriptions included in the options
     analysis_options = [
@@ -457,10 +486,15 @@ def main():
     if api_key:
         try:
             model = initialize_genai(api_key)
+            user_id = usage.user_id_for_key(api_key)
+            # Only offered once a key is known, since every user sees only their own archive
+            render_archive_search(store, user_id)
             
-            # File uploader
-            st.subheader("Upload Audio File")
-            audio_file = st.file_uploader("Choose an audio file", type=['mp3', 'wav', 'm4a'])
+            # File uploader; several files are analyzed concurrently as a batch
+            st.subheader("Upload Audio Files")
+            audio_files = st.file_uploader("Choose one or more audio files", type=['mp3', 'wav', 'm4a'],
+                                           accept_multiple_files=True) or []
+            audio_file = audio_files[0] if len(audio_files) == 1 else None
             
             # Dropdown for analysis type
             selected_type = st.selectbox(
@@ -479,10 +513,90 @@ def main():
                                         help="More segments allows for longer audio, but may reduce context between segments")
                 st.info(f"📌 Long audio mode will process your file in {num_segments} equal segments, then combine results. This allows processing of much longer files than the model can handle directly.")
             
+            reuse_archived = st.checkbox("Reuse archived result for identical audio", value=True,
+                                         help="Skip the Gemini call when this exact file was already analyzed with the same settings")
+            
+            # Off by default: trimming decodes and re-encodes the upload, changing what the model hears
+            trim_silence = st.checkbox("Trim long silences before upload", value=False,
+                                       help="Cut dead air before the model sees it; [MM:SS] timestamps in the result still refer to the original recording")
+            
+            # The audio actually sent to Gemini, after optional silence trimming
+            upload, trim = audio_file, None
+            if audio_file:
+                audio_hash = content_hash(audio_file.getvalue())
+                if trim_silence:
+                    upload, trim = prepare_upload(audio_file, audio_hash)
+            
+            settings = {
+                "model": routing.stage_models(model, len(upload.getvalue()) if upload else 0),
+                "num_segments": num_segments if use_segmentation else 0,
+                "trim_silence": trim_silence
+            }
+            
+            # Look for re-encoded or overlapping copies before spending any model calls
+            if audio_file:
+                fingerprints = get_fingerprint_index()
+                fingerprint, similar = find_similar_audio(user_id, audio_file, audio_hash, fingerprints)
+                if similar:
+                    metrics.CACHE_LOOKUPS.inc(cache="near_duplicate", result="hit")
+                    reused = render_similar_audio(similar[0], store, audio_file, audio_hash, selected_type, settings,
+                                                  model, user_id)
+                    if reused:
+                        result, transcript = reused
+                        st.session_state.analysis_result = result
+                        st.session_state.result_file_name = audio_file.name
+                        st.session_state.result_record_id = None
+                        if not is_error_result(result):
+                            st.session_state.result_record_id = store.save(
+                                user_id, audio_hash, audio_file.name, selected_type, settings, result, transcript)
+                            if fingerprint is not None:
+                                fingerprints.add(user_id, audio_hash, audio_file.name, fingerprint)
+            
+            if len(audio_files) > 1:
+                st.info(f"📚 {len(audio_files)} files will be analyzed concurrently, "
+                        f"up to {batch.USER_MAX_FILES} at a time.")
+                if st.button(f"Analyze {len(audio_files)} Files"):
+                    run_batch(store, user_id, audio_files, selected_type, model, settings["num_segments"],
+                              trim_silence, reuse_archived)
+            
             # Process audio button
             if audio_file and st.button("Analyze Audio"):
-                with st.spinner("Processing audio..."):
-                    st.session_state.analysis_result = process_audio(audio_file, selected_type, model, use_segmentation, num_segments)
+                cached = store.lookup(user_id, audio_hash, selected_type, settings) if reuse_archived else None
+                if reuse_archived:
+                    metrics.CACHE_LOOKUPS.inc(cache="archive", result="hit" if cached else "miss")
+                
+                st.session_state.result_record_id = None
+                if cached:
+                    st.session_state.analysis_result = cached["result"]
+                    st.session_state.result_record_id = cached["id"]
+                    st.info("Loaded from archive: this file was already analyzed with the same settings.")
+                else:
+                    result = run_analysis(store, user_id, upload, audio_hash, selected_type, model,
+                                          settings["num_segments"], trim_silence=trim_silence, trim=trim)
+                    if result is not None:
+                        st.session_state.analysis_result = result
+                        if not is_error_result(result) and fingerprint is not None:
+                            fingerprints.add(user_id, audio_hash, audio_file.name, fingerprint)
+                st.session_state.result_file_name = audio_file.name
+            
+            # Per-segment status of the last long-audio run of this file, with selective re-runs
+            segment_run = st.session_state.get("segment_run")
+            if audio_file and segment_run and segment_run["audio_hash"] == audio_hash:
+                chosen = render_segment_records(segment_run["records"], segment_run["offset_map"])
+                if chosen:
+                    result = rerun_segments(store, user_id, upload, audio_hash, selected_type, model,
+                                            segment_run["records"], chosen, trim_silence, trim)
+                    if result is not None:
+                        st.session_state.analysis_result = result
+                        st.session_state.result_file_name = audio_file.name
+            
+            render_usage(get_usage_ledger(), user_id)
+            with st.sidebar.expander("Debug"):
+                st.checkbox("Profile analysis runs (CPU, memory, stage timeline)", key="profile_runs",
+                            help="Slows the run down; the profile can be downloaded next to the results")
+            
+            if st.session_state.get("batch_jobs"):
+                render_batch_results(st.session_state.batch_jobs)
             
             # Display results if available
             if st.session_state.analysis_result:
@@ -492,29 +606,55 @@ def main():
                 # Download button in a separate column
                 col1, col2 = st.columns([1, 4])
                 with col1:
-                    # Add download button that uses the uploaded file's name
-                    from datetime import datetime
-                    import os
-                    current_time = datetime.now().strftime("%Y%m%d_%H%M")
-                    
-                    # Get the original filename without extension and replace spaces with underscores
-                    original_filename = os.path.splitext(audio_file.name)[0]
-                    original_filename = original_filename.replace(" ", "_")
-                    
-                    # Create new filename with original file name and timestamp
-                    filename = f"{original_filename}_{current_time}.txt"
-                    
+                    # Add download button that uses the analyzed file's name
                     st.download_button(
                         label="💾 Download",
                         data=st.session_state.analysis_result,
-                        file_name=filename,
+                        file_name=result_download_name(st.session_state.result_file_name),
                         mime="text/plain"
                     )
                 
+                structured_result = st.session_state.get("structured_result")
+                if structured_result and structured_result["result"] == st.session_state.analysis_result:
+                    with col1:
+                        st.download_button(
+                            label="🧾 JSON",
+                            data=json.dumps(structured_result["data"], indent=2, ensure_ascii=False),
+                            file_name=result_download_name(st.session_state.result_file_name).replace(".txt", ".json"),
+                            mime="application/json",
+                            help="Transcript, summary sections, action items and quotes as structured data"
+                        )
+                
+                profile = st.session_state.get("profile_artifact")
+                if profile:
+                    with col1:
+                        st.download_button(
+                            label="🩺 Profile",
+                            data=profile["data"],
+                            file_name=result_download_name(profile["file_name"]).replace(".txt", "_profile.zip"),
+                            mime="application/zip",
+                            help="CPU hot spots, memory peaks and stage timeline of the last profiled run"
+                        )
+                
+                record_id = st.session_state.get("result_record_id")
+                if record_id:
+                    with col2:
+                        # Ratings are tracked per model route to weigh quality against latency
+                        widget_key = f"rating_{record_id}"
+                        st.feedback("thumbs", key=widget_key, on_change=rate_result,
+                                    args=(store, record_id, widget_key))
+                
         except Exception as e:
             st.error(f"Error initializing Gemini AI: {str(e)}")
     else:
         st.warning("Please enter your Gemini API key to proceed")
+    
+    first_render = startup.after_render()
+    metrics.FIRST_RENDER_SECONDS.set(first_render)
+    report = startup.startup_report()
+    imports = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in report["import_seconds"].items())
+    st.sidebar.caption(f"🚀 First render {first_render:.2f}s after process start ({report['mode']} imports)"
+                       + (f" · imported {imports}" if imports else ""))
 
 if __name__ == "__main__":
     main()
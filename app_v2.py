@@ -2,11 +2,12 @@ import streamlit as st
 import google.generativeai as genai
 from datetime import datetime
 import os
-import tempfile
 import time
 import io
 import base64
 
+import transport
+
 def initialize_genai(api_key):
     """Initialize the Gemini AI model."""
     genai.configure(api_key=api_key)
@@ -271,35 +272,30 @@ def process_audio_segments(audio_file, analysis_type, model, num_segments=2):
         # For longer audio, send in parts and collect transcripts
         status_text.text("Processing audio in segments...")
         
-        # Save audio to a temporary file to get direct file access
-        temp = tempfile.NamedTemporaryFile(delete=False, suffix='.' + audio_file.name.split('.')[-1])
-        temp.write(audio_file.getvalue())
-        temp.close()
+        # Every segment call carries the whole file: inline, or uploaded once and referenced
+        part = transport.prepare(audio_file.name, audio_file.getvalue(), uses=num_segments)
         
         # Process in segments directly
         transcripts = []
         segment_texts = []
         
-        for i in range(num_segments):
-            status_text.text(f"Processing segment {i+1}/{num_segments}...")
-            
-            # We're going to send the entire file, but with instructions to process a specific segment
-            segment_prompt = f"""Please transcribe only the {ordinal(i+1)} segment of this audio (approximately from {i/num_segments:.0%} to {(i+1)/num_segments:.0%} of the total duration).
-            Focus only on this portion of the audio and ignore the rest."""
-            
-            gemini_file = genai.upload_file(temp.name)
-            response = model.generate_content([gemini_file, segment_prompt])
-            
-            segment_text = response.text
-            segment_texts.append(segment_text)
-            transcripts.append(f"--- SEGMENT {i+1}/{num_segments} TRANSCRIPT ---\n{segment_text}")
-            progress.progress((i + 1) / (num_segments + 1))
-        
-        # Clean up the temporary file
         try:
-            os.unlink(temp.name)
-        except:
-            st.warning(f"Could not remove temporary file: {temp.name}")
+            for i in range(num_segments):
+                status_text.text(f"Processing segment {i+1}/{num_segments}...")
+                
+                # We're going to send the entire file, but with instructions to process a specific segment
+                segment_prompt = f"""Please transcribe only the {ordinal(i+1)} segment of this audio (approximately from {i/num_segments:.0%} to {(i+1)/num_segments:.0%} of the total duration).
+                Focus only on this portion of the audio and ignore the rest."""
+                
+                response = model.generate_content([part, segment_prompt])
+                
+                segment_text = response.text
+                segment_texts.append(segment_text)
+                transcripts.append(f"--- SEGMENT {i+1}/{num_segments} TRANSCRIPT ---\n{segment_text}")
+                progress.progress((i + 1) / (num_segments + 1))
+        finally:
+            # Delete the uploaded copy, if any, even when a segment failed
+            transport.release(part)
         
         # Build a clean full transcript
         full_transcript = "\n\n".join(segment_texts)
@@ -358,16 +354,9 @@ def process_audio(audio_file, analysis_type, model, use_segmentation=False, num_
         return process_audio_segments(audio_file, analysis_type, model, num_segments)
     else:
         try:
-            # Create a temporary file
-            tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.' + audio_file.name.split('.')[-1])
-            tmp_file_path = tmp_file.name
-            tmp_file.write(audio_file.getvalue())
-            tmp_file.close()  # Close the file handle immediately
-
-            try:
-                gemini_file = genai.upload_file(tmp_file_path)
+            with transport.audio_part(audio_file.name, audio_file.getvalue()) as part:
                 prompt = get_analysis_prompt(analysis_type)
-                response = model.generate_content([gemini_file, prompt])
+                response = model.generate_content([part, prompt])
                 result = response.text
                 
                 # For transcript & summary type without segmentation, we need to handle it specially
@@ -384,15 +373,6 @@ def process_audio(audio_file, analysis_type, model, use_segmentation=False, num_
 # COMPREHENSIVE SUMMARY
 
 {summary_part}"""
-                
-            finally:
-                # Add a small delay before trying to remove the file
-                time.sleep(0.5)
-                if os.path.exists(tmp_file_path):
-                    try:
-                        os.unlink(tmp_file_path)
-                    except Exception as cleanup_error:
-                        st.warning(f"Warning: Could not remove temporary file {tmp_file_path}: {cleanup_error}")
             
             return result
             
@@ -0,0 +1,231 @@
+"""Asyncio variant of the analysis pipeline, selected with AUDIO_ANALYSIS_PIPELINE=async.
+
+Every model call of every session runs as a coroutine (generate_content_async)
+on one background event loop, instead of holding a pool thread per blocking
+call. MAX_CONCURRENT_CALLS bounds the calls in flight per process,
+SEGMENT_CONCURRENCY bounds how many segments of one run are transcribed at
+once, and each call is abandoned after CALL_TIMEOUT_SECONDS.
+
+run_sync() is the blocking entry point for the Streamlit script thread; it
+polls the cancel token like call_cancellable() does, and cancelling really
+stops the pending calls instead of discarding their responses later.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import CancelledError as FutureCancelledError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import compaction
+import metrics
+import profiling
+import routing
+import segments
+import singleflight
+import structured
+import transport
+import usage
+from cancellation import AnalysisCancelled
+from results_store import content_hash
+from prompts import combine_transcript_and_summary, get_full_context_prompt, get_segment_prompt
+
+ENABLED = os.environ.get("AUDIO_ANALYSIS_PIPELINE", "threads") == "async"
+MAX_CONCURRENT_CALLS = int(os.environ.get("AUDIO_ANALYSIS_ASYNC_MAX_CALLS", "64"))
+SEGMENT_CONCURRENCY = int(os.environ.get("AUDIO_ANALYSIS_SEGMENT_CONCURRENCY", "4"))
+CALL_TIMEOUT_SECONDS = float(os.environ.get("AUDIO_ANALYSIS_CALL_TIMEOUT_SECONDS", "600"))
+
+_state = {"loop": None, "call_slots": None}
+_lock = threading.Lock()
+
+def get_loop():
+    """Return the process-wide event loop, starting its thread on first use."""
+    with _lock:
+        if _state["loop"] is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async-pipeline", daemon=True).start()
+            _state["loop"] = loop
+            _state["call_slots"] = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+        return _state["loop"]
+
+def run_sync(coroutine, cancel_token=None, on_poll=None, poll_interval=0.5):
+    """Run a pipeline coroutine on the shared loop and block until it finishes.
+
+    on_poll is called from the calling thread on every poll, e.g. to redraw
+    progress. Raises AnalysisCancelled once the token is cancelled.
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+    try:
+        while True:
+            try:
+                return future.result(timeout=poll_interval)
+            except FutureTimeoutError:
+                if cancel_token is not None and cancel_token.cancelled:
+                    future.cancel()
+                    raise AnalysisCancelled("Analysis was cancelled")
+                if on_poll is not None:
+                    on_poll()
+                if cancel_token is not None and cancel_token.on_wait is not None:
+                    cancel_token.on_wait()
+            except FutureCancelledError:
+                raise AnalysisCancelled("Analysis was cancelled")
+    except BaseException:
+        # Includes Streamlit stopping the script: don't leave the calls running
+        future.cancel()
+        raise
+
+async def generate_async(model, stage, contents, run_info=None, timeout=CALL_TIMEOUT_SECONDS, **kwargs):
+    """Async counterpart of pipeline.generate(): metrics, usage records and a per-call timeout."""
+    parts = contents if isinstance(contents, list) else [contents]
+    metrics.BYTES_UPLOADED.inc(sum(len(part['data']) for part in parts if isinstance(part, dict)))
+    audio_size = sum(transport.part_size(part) for part in parts if not isinstance(part, str))
+    if isinstance(model, routing.ModelRouter):
+        model = model.model_for(stage, audio_size)
+    model_label = usage.short_model_name(model.model_name)
+
+    async with _state["call_slots"]:
+        metrics.MODEL_CALLS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            with profiling.span(run_info, f"{stage} call", model=model_label, audio_bytes=audio_size):
+                response = await asyncio.wait_for(model.generate_content_async(contents, **kwargs), timeout)
+        except asyncio.CancelledError:
+            metrics.MODEL_CALLS.inc(stage=stage, model=model_label, outcome="cancelled")
+            raise
+        except asyncio.TimeoutError:
+            metrics.MODEL_CALLS.inc(stage=stage, model=model_label, outcome="timeout")
+            raise TimeoutError(f"{stage} call to {model_label} timed out after {timeout:.0f}s")
+        except Exception:
+            metrics.MODEL_CALLS.inc(stage=stage, model=model_label, outcome="error")
+            raise
+        finally:
+            metrics.MODEL_CALLS_IN_FLIGHT.dec()
+            metrics.MODEL_CALL_SECONDS.observe(time.perf_counter() - started, stage=stage, model=model_label)
+
+    metrics.MODEL_CALLS.inc(stage=stage, model=model_label, outcome="ok")
+    input_tokens, output_tokens = usage.usage_from_response(response)
+    metrics.TOKENS.inc(input_tokens, stage=stage, direction="input")
+    metrics.TOKENS.inc(output_tokens, stage=stage, direction="output")
+    if run_info is not None:
+        usage.add_call(run_info, {
+            "stage": stage,
+            "model": model.model_name,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "seconds": time.perf_counter() - started,
+            "finished_at": time.time()
+        })
+    return response
+
+async def process_transcripts_async(transcripts, analysis_type, model, run_info=None):
+    """Async counterpart of pipeline.process_transcripts()."""
+    import google.generativeai as genai
+    try:
+        with profiling.span(run_info, "compaction"):
+            transcripts, report = compaction.compact_transcripts(transcripts)
+        if run_info is not None:
+            run_info["compaction"] = report
+        full_prompt = get_full_context_prompt(analysis_type) + "\n".join(transcripts)
+        response, _ = await singleflight.REDUCES.do_async(
+            singleflight.call_key("reduce", routing.stage_model_name(model, "reduce", 0), full_prompt),
+            lambda state: generate_async(model, "reduce", full_prompt, run_info,
+                                         generation_config=genai.types.GenerationConfig(
+                                             temperature=0.2,
+                                             max_output_tokens=16000
+                                         ))
+        )
+        return response.text
+    except Exception as e:
+        return f"Error processing combined transcripts: {str(e)}"
+
+async def process_audio_segments_async(audio_file, analysis_type, model, num_segments=2, run_info=None,
+                                       completed_segments=None, progress=None, duration=None, cancel_token=None):
+    """Async counterpart of pipeline.process_audio_segments(), transcribing segments concurrently.
+
+    progress(fraction, message) is called as segments finish; duration (seconds)
+    gives the segment records their time ranges. An uploaded copy of the audio
+    is registered with cancel_token for deletion.
+    """
+    completed_segments = completed_segments or {}
+    audio_bytes = audio_file.getvalue()
+    records = segments.plan_segments(len(audio_bytes), num_segments, duration)
+    if run_info is not None:
+        run_info["segments"] = records
+    report = progress or (lambda fraction, message: None)
+    segment_slots = asyncio.Semaphore(SEGMENT_CONCURRENCY)
+    done = []
+
+    async def transcribe(record):
+        async with segment_slots:
+            segments.start(record)
+            contents = [part, get_segment_prompt(record["index"], num_segments)]
+            try:
+                response, _ = await singleflight.SEGMENTS.do_async(
+                    singleflight.call_key("segment", *segment_plan, record["index"]),
+                    lambda state: generate_async(model, "segment", contents, run_info)
+                )
+                segments.finish(record, response.text, *usage.usage_from_response(response))
+                metrics.SEGMENTS.inc(outcome="processed")
+            except Exception as e:
+                segments.fail(record, e)
+                metrics.SEGMENTS.inc(outcome="failed")
+        done.append(record["index"])
+        report(len(done) / (num_segments + 1), f"Transcribed {len(done)}/{num_segments} segments...")
+
+    pending = []
+    for record in records:
+        if record["index"] in completed_segments:
+            segments.reuse(record, completed_segments[record["index"]])
+            metrics.SEGMENTS.inc(outcome="reused")
+            done.append(record["index"])
+        else:
+            pending.append(record)
+    report(len(done) / (num_segments + 1), f"Processing {len(pending)} segment(s) concurrently...")
+    part = None
+    try:
+        if pending:
+            # Uploading blocks, so it runs off the loop
+            part = await asyncio.to_thread(transport.prepare, audio_file.name, audio_bytes, len(pending), cancel_token)
+            segment_plan = (content_hash(audio_bytes), routing.stage_model_name(model, "segment", len(audio_bytes)),
+                            num_segments)
+        await asyncio.gather(*(transcribe(record) for record in pending))
+    finally:
+        if part is not None:
+            await asyncio.to_thread(transport.release, part)
+
+    failed = [r for r in records if r["status"] == segments.FAILED]
+    if failed:
+        numbers = ", ".join(str(r["index"] + 1) for r in failed)
+        return f"Error processing audio: segment(s) {numbers} of {num_segments} failed. Re-run them from the segment list."
+
+    full_transcript = "\n\n".join(r["text"] for r in records)
+    if run_info is not None:
+        run_info["transcript"] = full_transcript
+
+    report(num_segments / (num_segments + 1), "Generating final analysis from all segments...")
+    summary_result = await process_transcripts_async(segments.transcript_headers(records), analysis_type,
+                                                     model, run_info)
+    report(1.0, "Analysis complete!")
+    if analysis_type.startswith("Transcript & Summary"):
+        return combine_transcript_and_summary(full_transcript, summary_result)
+    return summary_result
+
+async def process_audio_async(audio_file, analysis_type, model, use_segmentation=False, num_segments=2,
+                              run_info=None, completed_segments=None, progress=None, duration=None,
+                              cancel_token=None):
+    """Async counterpart of pipeline.process_audio(), without a temp file for inline audio."""
+    if use_segmentation:
+        return await process_audio_segments_async(audio_file, analysis_type, model, num_segments, run_info,
+                                                  completed_segments, progress, duration, cancel_token)
+    part = None
+    try:
+        part = await asyncio.to_thread(transport.prepare, audio_file.name, audio_file.getvalue(), 1, cancel_token)
+        import google.generativeai as genai
+        prompt, request = structured.single_shot_request(analysis_type, genai)
+        response = await generate_async(model, "single", [part, prompt], run_info, **request)
+        return structured.single_shot_result(response.text, analysis_type, run_info)
+    except Exception as e:
+        return f"Error processing audio: {str(e)}"
+    finally:
+        if part is not None:
+            await asyncio.to_thread(transport.release, part)
@@ -0,0 +1,162 @@
+"""Decoding and cutting of uploaded audio for the local preprocessing stages."""
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import wave
+
+import numpy as np
+
+# Source frames decoded per step when writing a WAV to the PCM cache
+DECODE_BLOCK_FRAMES = 1 << 18
+
+class AudioDecodeError(Exception):
+    """Raised when uploaded audio cannot be decoded locally."""
+
+class AudioClip:
+    """In-memory audio with the same name/getvalue interface as a Streamlit upload."""
+
+    def __init__(self, name, data):
+        self.name = name
+        self._data = data
+
+    def getvalue(self):
+        return self._data
+
+def file_extension(file_name):
+    """Return the lower-case extension of a file name without the dot."""
+    return file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+
+def is_wav(data):
+    """Return True when the bytes start with a RIFF/WAVE header."""
+    return data[:4] == b'RIFF' and data[8:12] == b'WAVE'
+
+def ffmpeg_available():
+    """Return True when the ffmpeg binary is on the PATH."""
+    return shutil.which("ffmpeg") is not None
+
+def pcm_bytes_to_float(raw, width, channels):
+    """Convert interleaved little-endian PCM frames to a mono float32 signal in [-1, 1)."""
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif width == 3:
+        # Sign-extend packed 24-bit samples into int32
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = packed[:, 0] | (packed[:, 1] << 8) | (packed[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float32) / 8388608
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise AudioDecodeError(f"Unsupported WAV sample width: {width} bytes")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+def _decode_wav_to_file(data, path, sample_rate):
+    """Decode and linearly resample a WAV to mono float32 one block at a time, appending to path."""
+    with wave.open(io.BytesIO(data), 'rb') as wav, open(path, 'wb') as out:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        source_rate = wav.getframerate()
+        step = source_rate / sample_rate
+        target_len = int(wav.getnframes() / source_rate * sample_rate)
+        # Source samples not yet interpolated past, and the source index of the first one
+        pending, offset = np.zeros(0, dtype=np.float32), 0
+        written = 0
+        while written < target_len:
+            raw = wav.readframes(DECODE_BLOCK_FRAMES)
+            samples = np.concatenate([pending, pcm_bytes_to_float(raw, width, channels)])
+            if len(samples) == 0:
+                # Header promised more frames than the file holds
+                break
+            end = offset + len(samples)
+            if source_rate == sample_rate:
+                block, pending, offset = samples, samples[:0], end
+            else:
+                # An output sample needs the source samples on both sides of its position,
+                # except at the very end, where np.interp holds the last value
+                limit = target_len if not raw else min(target_len, int(np.ceil((end - 1) / step)))
+                positions = np.arange(written, limit, dtype=np.float64) * step
+                block = np.interp(positions, np.arange(offset, end), samples).astype(np.float32)
+                pending, offset = samples[-1:], end - 1
+            block[:target_len - written].tofile(out)
+            written += min(len(block), target_len - written)
+            if not raw:
+                break
+
+def decode_pcm_to_file(data, file_name, path, sample_rate=8000):
+    """Decode audio bytes to raw mono float32 samples written to path.
+
+    WAV content is decoded with the standard library a block at a time; other
+    formats need ffmpeg, which writes straight to the file. Either way the
+    decoded signal is never held in memory as a whole.
+    """
+    if is_wav(data):
+        _decode_wav_to_file(data, path, sample_rate)
+        return
+    if not ffmpeg_available():
+        raise AudioDecodeError(f"ffmpeg is required to decode {file_name}")
+    try:
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-y", "-i", "pipe:0", "-f", "f32le",
+             "-ac", "1", "-ar", str(sample_rate), path],
+            input=data, capture_output=True, check=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise AudioDecodeError(f"ffmpeg could not decode audio: {e.stderr.decode(errors='replace').strip()}")
+
+def duration_seconds(data, file_name, audio_hash=None):
+    """Return the duration of audio bytes in seconds.
+
+    WAV durations come straight from the header; other formats are decoded
+    with ffmpeg through the PCM cache.
+    """
+    if is_wav(data):
+        try:
+            with wave.open(io.BytesIO(data), 'rb') as wav:
+                return wav.getnframes() / wav.getframerate()
+        except (wave.Error, EOFError) as e:
+            raise AudioDecodeError(f"Invalid WAV header in {file_name}: {e}")
+    import pcm_cache
+    return len(pcm_cache.decode(data, file_name, 8000, audio_hash)) / 8000
+
+def extract_range(data, file_name, start_seconds, end_seconds=None):
+    """Cut [start_seconds, end_seconds) out of an audio file, keeping its format."""
+    if is_wav(data):
+        with wave.open(io.BytesIO(data), 'rb') as wav:
+            params = wav.getparams()
+            start = int(start_seconds * params.framerate)
+            end = params.nframes if end_seconds is None else int(end_seconds * params.framerate)
+            wav.setpos(min(start, params.nframes))
+            frames = wav.readframes(max(0, end - start))
+        out = io.BytesIO()
+        with wave.open(out, 'wb') as clip:
+            clip.setparams(params)
+            clip.writeframes(frames)
+        return out.getvalue()
+
+    if not ffmpeg_available():
+        raise AudioDecodeError(f"ffmpeg is required to cut {file_name}")
+
+    # Containers like m4a need seekable output, so go through temporary files
+    suffix = '.' + file_extension(file_name)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, "source" + suffix)
+        target = os.path.join(tmp_dir, "clip" + suffix)
+        with open(source, 'wb') as f:
+            f.write(data)
+        command = ["ffmpeg", "-v", "error", "-y", "-ss", f"{start_seconds:.3f}"]
+        if end_seconds is not None:
+            command += ["-t", f"{end_seconds - start_seconds:.3f}"]
+        command += ["-i", source, "-c", "copy", target]
+        try:
+            subprocess.run(command, capture_output=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise AudioDecodeError(f"ffmpeg could not cut audio: {e.stderr.decode(errors='replace').strip()}")
+        with open(target, 'rb') as f:
+            return f.read()
@@ -0,0 +1,230 @@
+"""Analysis of several uploads at once on a worker pool shared by all sessions.
+
+AUDIO_ANALYSIS_BATCH_WORKERS (default 8) files are analyzed at a time across
+the process, and at most AUDIO_ANALYSIS_USER_MAX_FILES (default 3) of them
+for any one user; a user's further files wait in their own queue instead of
+holding a worker, so one large batch cannot starve other sessions.
+
+Each file is tracked as a job dict the page polls:
+
+    file_name, status        "queued", "running", "done", "failed" or "cancelled"
+    fraction, message        progress reported by the pipeline
+    result, record_id        the analysis and its archive id once done
+    started_at, finished_at
+"""
+import io
+import os
+import threading
+import time
+import zipfile
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import analytics
+import metrics
+import pipeline
+import routing
+import segments
+import singleflight
+import usage
+from cancellation import AnalysisCancelled
+from results_store import is_error_result, segment_plan_key
+
+BATCH_WORKERS = int(os.environ.get("AUDIO_ANALYSIS_BATCH_WORKERS", "8"))
+USER_MAX_FILES = int(os.environ.get("AUDIO_ANALYSIS_USER_MAX_FILES", "3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+class BatchScheduler:
+    """Runs jobs on a shared pool, starting at most per_user of one user's jobs at a time."""
+
+    def __init__(self, workers=BATCH_WORKERS, per_user=USER_MAX_FILES):
+        self.per_user = per_user
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+        self._lock = threading.Lock()
+        self._running = Counter()
+        self._pending = defaultdict(deque)
+
+    def submit(self, user_id, func, *args):
+        """Schedule func(*args) for a user and return a Future for its result."""
+        future = Future()
+        with self._lock:
+            start = self._running[user_id] < self.per_user
+            if start:
+                self._running[user_id] += 1
+            else:
+                self._pending[user_id].append((future, func, args))
+        if start:
+            self._start(user_id, future, func, args)
+        return future
+
+    def _start(self, user_id, future, func, args):
+        if not future.set_running_or_notify_cancel():
+            self._finished(user_id)
+            return
+        self._executor.submit(self._run, user_id, future, func, args)
+
+    def _run(self, user_id, future, func, args):
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self._finished(user_id)
+
+    def _finished(self, user_id):
+        # The user's slot passes straight to their next queued job
+        with self._lock:
+            if self._pending[user_id]:
+                next_job = self._pending[user_id].popleft()
+            else:
+                next_job = None
+                self._running[user_id] -= 1
+        if next_job:
+            self._start(user_id, *next_job)
+
+_scheduler = {}
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide batch scheduler."""
+    with _scheduler_lock:
+        if "scheduler" not in _scheduler:
+            _scheduler["scheduler"] = BatchScheduler()
+        return _scheduler["scheduler"]
+
+def new_job(file_name):
+    return {"file_name": file_name, "status": QUEUED, "fraction": 0.0, "message": "Waiting for a worker...",
+            "result": "", "record_id": None, "started_at": None, "finished_at": None}
+
+def analyze_file(job, audio_file, audio_hash, analysis_type, model, num_segments, trim_silence, reuse_archived,
+                 store, ledger, user_id, cancel_token, fingerprints=None):
+    """Analyze one file of a batch the way the single-file page does, updating job as it goes.
+
+    Covers silence trimming, the archive and segment memo, the user's budget,
+    usage accounting and archiving of the result.
+    """
+    from audio_io import AudioClip, AudioDecodeError
+    job.update(status=RUNNING, started_at=time.time(), message="Preparing audio...")
+    try:
+        upload, trim = audio_file, None
+        if trim_silence:
+            import silence
+            try:
+                trim = silence.trim_silence(audio_file.getvalue(), audio_file.name, audio_hash=audio_hash)
+            except AudioDecodeError:
+                trim = None
+            if trim is not None:
+                upload = AudioClip(audio_file.name, trim["data"])
+                metrics.SILENCE_TRIMMED_SECONDS.inc(trim["removed_seconds"])
+                metrics.UPLOAD_BYTES_SAVED.inc(trim["bytes_saved"])
+        audio_size = len(upload.getvalue())
+
+        settings = {"model": routing.stage_models(model, audio_size), "num_segments": num_segments,
+                    "trim_silence": trim_silence}
+        cached = store.lookup(user_id, audio_hash, analysis_type, settings) if reuse_archived else None
+        if reuse_archived:
+            metrics.CACHE_LOOKUPS.inc(cache="archive", result="hit" if cached else "miss")
+        if cached:
+            job.update(status=DONE, fraction=1.0, message="Loaded from archive", result=cached["result"],
+                       record_id=cached["id"], finished_at=time.time())
+            return job
+
+        def plan_key_for(run_model, run_segments):
+            return segment_plan_key(audio_hash, routing.stage_model_name(run_model, "segment", audio_size),
+                                    run_segments, trim is not None)
+
+        reuse_segments = store.load_segments(plan_key_for(model, num_segments)) if num_segments else {}
+        # Reserves the run's estimated spend, so files running side by side share the budget
+        run_info = {}
+        try:
+            model_name, run_segments, note = usage.check_budget(
+                ledger, user_id, audio_size, settings["model"], num_segments, len(reuse_segments),
+                run_info=run_info)
+        except usage.BudgetExceeded as e:
+            job.update(status=FAILED, message=str(e), result=f"Error processing audio: {e}", finished_at=time.time())
+            return job
+        if note:
+            # Downgraded runs send every stage to the lighter model and are archived as such
+            model = pipeline.get_genai().GenerativeModel(model_name)
+            num_segments = run_segments
+            reuse_segments = store.load_segments(plan_key_for(model, num_segments)) if num_segments else {}
+            settings = {"model": routing.stage_models(model, audio_size), "num_segments": num_segments,
+                        "trim_silence": trim_silence}
+
+        finished = False
+        run, result = {}, ""
+        job.update(message="Analyzing...")
+        try:
+            with metrics.track_run(analysis_type, "segmented" if num_segments else "single") as run:
+                result = pipeline.process_audio(
+                    upload, analysis_type, model, num_segments > 0, num_segments, run_info, cancel_token,
+                    reuse_segments, progress=lambda fraction, message: job.update(fraction=fraction, message=message),
+                    job_key=singleflight.job_key(audio_hash, analysis_type, settings, reuse_segments)
+                )
+                finished = not is_error_result(result)
+                if not finished:
+                    run["outcome"] = "error"
+        finally:
+            ledger.record_run(user_id, analysis_type, run_info)
+            analytics.record_run(user_id, audio_hash, audio_file.name, analysis_type, settings, run, run_info,
+                                 result, audio_size)
+            transcribed = segments.completed(run_info.get("segments", []))
+            if transcribed:
+                store.save_segments(plan_key_for(model, num_segments), transcribed)
+
+        if not finished:
+            job.update(status=FAILED, message=result, result=result, finished_at=time.time())
+            return job
+        transcript = run_info.get("transcript", "")
+        if trim is not None:
+            import silence
+            result = silence.remap_timestamps(result, trim["offset_map"])
+            transcript = silence.remap_timestamps(transcript, trim["offset_map"])
+        record_id = store.save(user_id, audio_hash, audio_file.name, analysis_type, settings, result, transcript)
+        if fingerprints is not None:
+            from fingerprint import fingerprint_audio
+            try:
+                fingerprints.add(user_id, audio_hash, audio_file.name,
+                                 fingerprint_audio(audio_file.getvalue(), audio_file.name, audio_hash))
+            except AudioDecodeError:
+                pass
+        job.update(status=DONE, fraction=1.0, message=note or "Analysis complete!", result=result,
+                   record_id=record_id, finished_at=time.time())
+    except AnalysisCancelled:
+        job.update(status=CANCELLED, message="Cancelled", finished_at=time.time())
+    except Exception as e:
+        job.update(status=FAILED, message=str(e), result=f"Error processing audio: {e}", finished_at=time.time())
+    finally:
+        metrics.BATCH_FILES.inc(outcome=job["status"])
+    return job
+
+def status_line(job):
+    """Return a one-line status of a job for its progress bar."""
+    if job["status"] in FINISHED and job["started_at"]:
+        return f"{job['file_name']}: {job['message']} ({job['finished_at'] - job['started_at']:.0f}s)"
+    return f"{job['file_name']}: {job['message']}"
+
+def results_zip(jobs, name_for):
+    """Return the finished results of a batch as zip bytes; name_for(file_name) names each entry."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        used = set()
+        for job in jobs:
+            if job["status"] != DONE:
+                continue
+            name = name_for(job["file_name"])
+            # Two uploads may share a name
+            stem, ext = os.path.splitext(name)
+            n = 2
+            while name in used:
+                name = f"{stem}_{n}{ext}"
+                n += 1
+            used.add(name)
+            archive.writestr(name, job["result"])
+    return buffer.getvalue()
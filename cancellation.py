@@ -0,0 +1,103 @@
+"""Cooperative cancellation for long-running analyses."""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Blocking SDK calls run here so the caller can stop waiting for them at any time
+MODEL_CALL_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="model-call")
+
+class AnalysisCancelled(Exception):
+    """Raised inside the pipeline once its cancel token has been triggered."""
+
+class CancelToken:
+    """Shared flag telling a running analysis to stop, plus the cleanups to run when it does.
+
+    on_wait, when set, is called periodically while a model call is pending. The
+    Streamlit page uses it to touch the UI, which is where Streamlit delivers a
+    click on the cancel button to the running script.
+    """
+
+    def __init__(self, on_wait=None):
+        self.on_wait = on_wait
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._cleanups = []
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise AnalysisCancelled("Analysis was cancelled")
+
+    def add_cleanup(self, func, *args):
+        """Register func(*args) to run if the analysis is cancelled."""
+        with self._lock:
+            self._cleanups.append((func, args))
+
+    def run_cleanups(self):
+        """Run registered cleanups once, newest first, ignoring their failures."""
+        with self._lock:
+            cleanups, self._cleanups = self._cleanups, []
+        for func, args in reversed(cleanups):
+            try:
+                func(*args)
+            except Exception:
+                pass
+
+def call_cancellable(cancel_token, func, *args, poll_interval=0.5, hedge=None, payload_bytes=0, **kwargs):
+    """Run a blocking call in the model-call pool and return its result.
+
+    Raises AnalysisCancelled as soon as the token is cancelled. A call that has
+    not started yet is dropped from the queue; one already in flight cannot be
+    interrupted, so its response is simply discarded.
+
+    With a hedge policy (see hedging.py), a call still running past the policy's
+    latency percentile for calls of its payload_bytes is issued once more and
+    the first successful response wins; the slower attempt is discarded the same way.
+    """
+    if cancel_token is None and hedge is None:
+        return func(*args, **kwargs)
+    cancel_token = cancel_token or CancelToken()
+
+    cancel_token.raise_if_cancelled()
+    hedge_delay = None
+    if hedge is not None:
+        hedge.start_call(payload_bytes)
+        hedge_delay = hedge.hedge_delay(payload_bytes)
+    primary = MODEL_CALL_EXECUTOR.submit(func, *args, **kwargs)
+    primary_started = time.monotonic()
+    started = {primary: primary_started}
+    hedged = False
+    while True:
+        timeout = poll_interval
+        if hedge_delay is not None and not hedged:
+            timeout = max(0, min(poll_interval, primary_started + hedge_delay - time.monotonic()))
+        done, pending = wait(started, timeout=timeout, return_when=FIRST_COMPLETED)
+        # Prefer a successful attempt; a failed one only counts once nothing else is running
+        for future in sorted(done, key=lambda f: f.exception() is not None):
+            if future.exception() is None or not pending:
+                for other in pending:
+                    other.cancel()
+                if hedge is not None and future.exception() is None:
+                    # The primary's time so far, even when the hedge won: recording the winner's
+                    # short time instead would cut the slow tail off the history
+                    hedge.record(payload_bytes, time.monotonic() - primary_started,
+                                 hedge_won=future is not primary)
+                return future.result()
+            del started[future]
+
+        if cancel_token.cancelled:
+            for future in started:
+                future.cancel()
+            raise AnalysisCancelled("Analysis was cancelled")
+        if (hedge_delay is not None and not hedged
+                and time.monotonic() - primary_started >= hedge_delay and hedge.try_hedge(payload_bytes)):
+            hedged = True
+            started[MODEL_CALL_EXECUTOR.submit(func, *args, **kwargs)] = time.monotonic()
+        if cancel_token.on_wait is not None:
+            cancel_token.on_wait()
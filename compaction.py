@@ -0,0 +1,174 @@
+"""Local compaction of segment transcripts before they go into the final reduce prompt.
+
+AUDIO_ANALYSIS_COMPACTION picks how much is removed:
+
+    off     send the transcripts verbatim
+    light   normalize whitespace, shorten segment headers, collapse repeated lines
+            (the default)
+    full    also strip filler words and stutters and drop sentences that
+            duplicate or nearly duplicate an earlier one by the same speaker
+
+Only the reduce input is compacted; the transcripts shown and archived stay
+as the model produced them.
+"""
+import hashlib
+import os
+import re
+import zlib
+from collections import Counter, defaultdict, deque
+
+import metrics
+
+COMPACTION_LEVEL = os.environ.get("AUDIO_ANALYSIS_COMPACTION", "light")
+LEVELS = ("off", "light", "full")
+
+# Rough token estimate for text; Gemini averages about four characters per token
+CHARS_PER_TOKEN = 4
+
+# Sentences shorter than this ("Yes.", "Thanks.") are never treated as duplicates
+MIN_DUPLICATE_WORDS = 4
+# A sentence is a near-duplicate when its word pairs overlap this much (Jaccard) with
+# one of the NEAR_DUPLICATE_WINDOW preceding sentences of the same speaker, e.g. the
+# same line with a leading "So,"
+NEAR_DUPLICATE_WINDOW = 200
+NEAR_DUPLICATE_MIN_WORDS = 8
+NEAR_DUPLICATE_SIMILARITY = 0.9
+
+SEGMENT_HEADER = re.compile(r"^--- SEGMENT (\d+/\d+) TRANSCRIPT \((.+)\) ---$", re.MULTILINE)
+# A filler with the commas around it: "we should, uh, start" -> "we should start"
+FILLERS = re.compile(r",?\s*(?<![\w'])(?:u+m+|u+h+|e+r+m+|u+h+m+|h+m+|a+h+)(?![\w'])\s*,?", re.IGNORECASE)
+# Punctuation a removed filler leaves stranded: "bad. ." -> "bad.", "issue ." -> "issue."
+STRANDED_STOP = re.compile(r"([.!?…])\s+[.!?…]+")
+SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+(?=[,.!?…;:])")
+LEADING_PUNCTUATION = re.compile(r"^[\s,.!?…;:]+")
+# "I I think" -> "I think", "the the the" -> "the"; a word said twice is kept, since
+# "no, no", "very very", "bye bye" and "had had" are usually meant
+STUTTER = re.compile(r"\b(\w+)(?:[\s,]+\1\b){2,}|\b([^\W\d_])(?:[\s,]+\2\b)+", re.IGNORECASE)
+# Speaker labels and timestamps opening a line, e.g. "[00:12] Speaker 1:"
+LINE_PREFIX = re.compile(r"^((?:\[[\d:]+\]\s*)?(?:([\w .'-]{1,40}):\s+)?)")
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+WORD = re.compile(r"\w+")
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+def _fingerprint(words):
+    return hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=8).digest()
+
+def shingles(words, speaker=""):
+    """Return the CRC32 hashes of a sentence's adjacent word pairs, salted with its speaker."""
+    return {zlib.crc32(f"{speaker}\0{a} {b}".encode("utf-8")) for a, b in zip(words, words[1:])}
+
+class _Deduplicator:
+    """Remembers the sentences kept so far across all segments, by speaker.
+
+    The same sentence from two speakers is kept twice: who said it matters to
+    summaries and action items.
+    """
+
+    def __init__(self):
+        self.exact = set()
+        self.recent = deque()
+        # shingle -> ids of recent sentences containing it, so only overlapping sentences are compared
+        self.index = defaultdict(set)
+        self.shingles = {}
+        self.next_id = 0
+
+    def is_duplicate(self, sentence, speaker=""):
+        words = WORD.findall(sentence.lower())
+        if len(words) < MIN_DUPLICATE_WORDS:
+            return False
+        key = _fingerprint([speaker] + words)
+        if key in self.exact:
+            return True
+        self.exact.add(key)
+        if len(words) < NEAR_DUPLICATE_MIN_WORDS:
+            return False
+        hashes = shingles(words, speaker)
+        overlaps = Counter(other for h in hashes for other in self.index.get(h, ()))
+        for other, shared in overlaps.items():
+            if shared / (len(hashes) + len(self.shingles[other]) - shared) >= NEAR_DUPLICATE_SIMILARITY:
+                return True
+        self._remember(hashes)
+        return False
+
+    def _remember(self, hashes):
+        sentence_id, self.next_id = self.next_id, self.next_id + 1
+        self.recent.append(sentence_id)
+        self.shingles[sentence_id] = hashes
+        for h in hashes:
+            self.index[h].add(sentence_id)
+        if len(self.recent) > NEAR_DUPLICATE_WINDOW:
+            oldest = self.recent.popleft()
+            for h in self.shingles.pop(oldest):
+                self.index[h].discard(oldest)
+                if not self.index[h]:
+                    del self.index[h]
+
+def _compact_line(line, level, dedup, removed):
+    match = LINE_PREFIX.match(line)
+    prefix = match.group(1)
+    speaker = (match.group(2) or "").strip().lower()
+    body = line[len(prefix):]
+    if level == "full":
+        cleaned, fillers = FILLERS.subn(" ", body)
+        if fillers:
+            cleaned = STRANDED_STOP.sub(r"\1", cleaned)
+            cleaned = SPACE_BEFORE_PUNCTUATION.sub("", cleaned)
+            cleaned = " ".join(LEADING_PUNCTUATION.sub("", cleaned).split())
+        cleaned, stutters = STUTTER.subn(lambda m: m.group(1) or m.group(2), cleaned)
+        removed["disfluencies"] += fillers + stutters
+        kept = []
+        for sentence in SENTENCE_END.split(cleaned.strip()):
+            if dedup.is_duplicate(sentence, speaker):
+                removed["duplicate_sentences"] += 1
+            else:
+                kept.append(sentence)
+        body = " ".join(kept)
+        if body:
+            body = body[0].upper() + body[1:]
+    if not body.strip():
+        return ""
+    return prefix + body
+
+def compact_transcript(text, level, dedup, removed):
+    text = SEGMENT_HEADER.sub(r"[Segment \1, \2]", text)
+    lines = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if line.startswith("[Segment ") or line.startswith("--- "):
+            lines.append(line)
+            continue
+        line = _compact_line(line, level, dedup, removed)
+        if not line:
+            continue
+        if lines and line.lower() == lines[-1].lower():
+            removed["repeated_lines"] += 1
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+def compact_transcripts(transcripts, level=None):
+    """Compact the labelled segment transcripts for the reduce prompt.
+
+    Returns (transcripts, report); the report holds the estimated tokens
+    before and after and what was removed.
+    """
+    level = level or COMPACTION_LEVEL
+    before = sum(estimate_tokens(t) for t in transcripts)
+    removed = {"disfluencies": 0, "repeated_lines": 0, "duplicate_sentences": 0}
+    if level != "off":
+        dedup = _Deduplicator()
+        transcripts = [compact_transcript(t, level, dedup, removed) for t in transcripts]
+    after = sum(estimate_tokens(t) for t in transcripts)
+    metrics.COMPACTION_TOKENS_SAVED.inc(before - after)
+    return transcripts, {"level": level, "tokens_before": before, "tokens_after": after, "removed": removed}
+
+def describe(report):
+    """Return a one-line report of what compaction saved."""
+    before, after = report["tokens_before"], report["tokens_after"]
+    share = (before - after) / before if before else 0
+    removed = report["removed"]
+    return (f"🗜️ Compacted the transcripts for the final analysis from ~{before:,} to ~{after:,} tokens ({share:.0%} saved): "
+            f"{removed['disfluencies']} filler words, {removed['repeated_lines']} repeated lines, "
+            f"{removed['duplicate_sentences']} duplicate sentences removed.")
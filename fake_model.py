@@ -0,0 +1,139 @@
+"""Stand-in for genai.GenerativeModel with realistic latency, for load tests and benchmarks.
+
+Latency is base + size-dependent transfer time, scaled by lognormal jitter, and
+can be tuned with FAKE_MODEL_BASE_SECONDS, FAKE_MODEL_SECONDS_PER_MB and
+FAKE_MODEL_JITTER_SIGMA.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from types import SimpleNamespace
+
+BASE_SECONDS = float(os.environ.get("FAKE_MODEL_BASE_SECONDS", "2.0"))
+SECONDS_PER_MB = float(os.environ.get("FAKE_MODEL_SECONDS_PER_MB", "1.5"))
+JITTER_SIGMA = float(os.environ.get("FAKE_MODEL_JITTER_SIGMA", "0.35"))
+
+# Gemini bills audio at 32 tokens per second; assume ~128 kbit/s uploads
+AUDIO_BYTES_PER_TOKEN = 500
+CHARS_PER_TOKEN = 4
+
+FAKE_TRANSCRIPT = """Speaker 1: Good morning everyone, thanks for joining.
+Speaker 2: Morning. Shall we start with the Q3 budget?
+Speaker 1: Yes. We are slightly over on travel, so I'd like to freeze it until October.
+Speaker 3: I'll send the revised forecast by Friday."""
+
+FAKE_SUMMARY = """1. Meeting Overview: weekly planning call with three participants.
+2. Key Discussion Points: Q3 budget, travel spend.
+3. Action Items & Next Steps: Speaker 3 sends the revised forecast by Friday.
+4. Follow-up Requirements: none scheduled.
+5. Notable Quotes & Key Insights: "freeze it until October".
+6. Additional Context: travel is over budget."""
+
+FAKE_STRUCTURED = {
+    "transcript": FAKE_TRANSCRIPT,
+    "summary": {
+        "overview": "Weekly planning call with three participants.",
+        "participants": ["Speaker 1", "Speaker 2", "Speaker 3"],
+        "key_points": ["Q3 budget", "Travel spend is slightly over budget"],
+        "decisions": ["Travel is frozen until October"],
+        "follow_ups": [],
+        "context": ["Travel is over budget"],
+    },
+    "action_items": [{"task": "Send the revised forecast", "owner": "Speaker 3", "deadline": "Friday"}],
+    "quotes": [{"quote": "freeze it until October", "speaker": "Speaker 1"}],
+}
+
+class FakeUsageMetadata:
+    """Mirrors the token counts carried by real responses."""
+
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens):
+        self.text = text
+        self.usage_metadata = FakeUsageMetadata(prompt_tokens, len(text) // CHARS_PER_TOKEN)
+
+def _payload_size(contents):
+    """Return (audio_bytes, prompt_text) for the contents of a generate_content call."""
+    parts = contents if isinstance(contents, list) else [contents]
+    audio_bytes = 0
+    prompt = []
+    for part in parts:
+        if isinstance(part, str):
+            prompt.append(part)
+        elif isinstance(part, dict):
+            audio_bytes += len(part.get('data', b''))
+        else:
+            # Uploaded File API handles only travel by reference
+            audio_bytes += getattr(part, 'size_bytes', 0) // 100
+    return audio_bytes, "\n".join(prompt)
+
+class FakeGenerativeModel:
+    """Answers every call with canned text after a simulated model latency."""
+
+    def __init__(self, model_name="gemini-2.5-flash", **kwargs):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+
+    def _reply(self, prompt, generation_config=None):
+        if getattr(generation_config, "response_mime_type", None) == "application/json":
+            return json.dumps(FAKE_STRUCTURED)
+        if "PART 2 - SUMMARY" in prompt:
+            return f"PART 1 - TRANSCRIPT:\n{FAKE_TRANSCRIPT}\n\nPART 2 - SUMMARY:\n{FAKE_SUMMARY}"
+        if "transcribe" in prompt.lower() or "transcript of this audio" in prompt:
+            return FAKE_TRANSCRIPT
+        return FAKE_SUMMARY
+
+    def latency(self, audio_bytes, prompt):
+        size_mb = (audio_bytes + len(prompt)) / 1e6
+        return (BASE_SECONDS + SECONDS_PER_MB * size_mb) * random.lognormvariate(0, JITTER_SIGMA)
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        audio_bytes, prompt = _payload_size(contents)
+        time.sleep(self.latency(audio_bytes, prompt))
+        prompt_tokens = audio_bytes // AUDIO_BYTES_PER_TOKEN + len(prompt) // CHARS_PER_TOKEN
+        return FakeResponse(self._reply(prompt, generation_config), prompt_tokens)
+
+    async def generate_content_async(self, contents, generation_config=None, **kwargs):
+        audio_bytes, prompt = _payload_size(contents)
+        await asyncio.sleep(self.latency(audio_bytes, prompt))
+        prompt_tokens = audio_bytes // AUDIO_BYTES_PER_TOKEN + len(prompt) // CHARS_PER_TOKEN
+        return FakeResponse(self._reply(prompt, generation_config), prompt_tokens)
+
+class FakeFile:
+    """Mirrors the File API handle returned by genai.upload_file."""
+
+    def __init__(self, path, mime_type=None, display_name=None):
+        self.name = f"files/{uuid.uuid4().hex[:12]}"
+        self.display_name = display_name
+        self.mime_type = mime_type
+        self.size_bytes = os.path.getsize(path)
+        self.state = SimpleNamespace(name="ACTIVE")
+
+_files = {}
+
+def upload_file(path, mime_type=None, display_name=None, **kwargs):
+    uploaded = FakeFile(path, mime_type, display_name)
+    time.sleep((BASE_SECONDS / 2 + SECONDS_PER_MB * uploaded.size_bytes / 1e6) * random.lognormvariate(0, JITTER_SIGMA))
+    _files[uploaded.name] = uploaded
+    return uploaded
+
+def get_file(name):
+    return _files[name]
+
+def delete_file(name):
+    del _files[getattr(name, "name", name)]
+
+def install():
+    """Point genai.GenerativeModel and the File API at the fakes so the real page runs without an API key."""
+    import google.generativeai as genai
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.configure = lambda **kwargs: None
+    genai.upload_file = upload_file
+    genai.get_file = get_file
+    genai.delete_file = delete_file
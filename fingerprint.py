@@ -0,0 +1,218 @@
+"""Compact spectral fingerprints for spotting re-encoded, trimmed or extended duplicates."""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+import pcm_cache
+from results_store import DATA_DIR
+
+SAMPLE_RATE = 8000
+FRAME_SIZE = 2048                 # 256 ms analysis window
+HOP_SIZE = 256                    # one 32-bit sub-fingerprint every 32 ms
+INDEX_STRIDE = 4                  # only every 4th frame goes into the lookup table
+NUM_BANDS = 33                    # 33 bands give 32 energy-difference bits
+MIN_FREQ, MAX_FREQ = 300, 2000
+
+SILENT_HASH = 0                   # digital silence yields all-zero bits and matches everything
+MIN_VOTES = 8                     # aligned exact sub-fingerprint hits needed for a candidate
+MAX_BIT_ERROR_RATE = 0.35         # above this the aligned frames are unrelated audio
+DUPLICATE_COVERAGE = 0.95
+OVERLAP_COVERAGE = 0.3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    file_name TEXT,
+    num_frames INTEGER NOT NULL,
+    frames BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (user_id, content_hash)
+);
+CREATE TABLE IF NOT EXISTS fingerprint_hashes (
+    hash INTEGER NOT NULL,
+    fingerprint_id INTEGER NOT NULL,
+    frame INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fingerprint_hashes_hash ON fingerprint_hashes(hash);
+"""
+
+def _band_matrix():
+    """Return the (fft_bins, NUM_BANDS) matrix summing power into log-spaced bands."""
+    freqs = np.fft.rfftfreq(FRAME_SIZE, d=1.0 / SAMPLE_RATE)
+    edges = np.geomspace(MIN_FREQ, MAX_FREQ, NUM_BANDS + 1)
+    band_of_bin = np.searchsorted(edges, freqs, side='right') - 1
+    matrix = np.zeros((len(freqs), NUM_BANDS), dtype=np.float32)
+    in_range = (band_of_bin >= 0) & (band_of_bin < NUM_BANDS)
+    matrix[np.nonzero(in_range)[0], band_of_bin[in_range]] = 1.0
+    return matrix
+
+_BANDS = _band_matrix()
+_WINDOW = np.hanning(FRAME_SIZE).astype(np.float32)
+_BIT_WEIGHTS = (1 << np.arange(NUM_BANDS - 1, dtype=np.uint64)).astype(np.uint64)
+
+def compute_fingerprint(samples, block_frames=4096):
+    """Return one uint32 sub-fingerprint per hop for a mono signal at SAMPLE_RATE.
+
+    Each bit records whether the energy difference between two adjacent bands
+    grew or shrank since the previous frame, which survives re-encoding and
+    bitrate changes far better than the raw bytes do. The overlapping frames
+    are read and windowed block_frames at a time as views of the samples, so
+    only band energies are kept for the whole signal.
+    """
+    if len(samples) < FRAME_SIZE + HOP_SIZE:
+        return np.zeros(0, dtype=np.uint32)
+    count = (len(samples) - FRAME_SIZE) // HOP_SIZE + 1
+    band_diff = np.empty((count, NUM_BANDS - 1), dtype=np.float32)
+    for start in range(0, count, block_frames):
+        end = min(start + block_frames, count)
+        block = pcm_cache.frames(samples, start * HOP_SIZE / SAMPLE_RATE,
+                                 ((end - 1) * HOP_SIZE + FRAME_SIZE) / SAMPLE_RATE, SAMPLE_RATE)
+        frames = np.lib.stride_tricks.sliding_window_view(block, FRAME_SIZE)[::HOP_SIZE]
+        power = np.abs(np.fft.rfft(frames * _WINDOW, axis=1)) ** 2
+        energy = power @ _BANDS
+        band_diff[start:end] = energy[:, :-1] - energy[:, 1:]
+    bits = (band_diff[1:] - band_diff[:-1]) > 0
+    return (bits.astype(np.uint64) @ _BIT_WEIGHTS).astype(np.uint32)
+
+def fingerprint_audio(data, file_name, audio_hash=None):
+    """Decode audio bytes (through the PCM cache) and return their fingerprint."""
+    return compute_fingerprint(pcm_cache.decode(data, file_name, SAMPLE_RATE, audio_hash))
+
+def frames_to_seconds(frames):
+    """Convert a sub-fingerprint count or index to seconds."""
+    return frames * HOP_SIZE / SAMPLE_RATE
+
+def bit_error_rate(query, reference, offset):
+    """Return the fraction of differing bits where query[i] aligns with reference[i + offset]."""
+    start = max(0, -offset)
+    end = min(len(query), len(reference) - offset)
+    if end <= start:
+        return 1.0, start, start
+    diff = np.bitwise_xor(query[start:end], reference[start + offset:end + offset])
+    errors = np.unpackbits(diff.view(np.uint8)).sum()
+    return errors / (32 * (end - start)), start, end
+
+class FingerprintIndex:
+    """SQLite index from sub-fingerprint values to the files and frames they occur in.
+
+    Fingerprints are kept per user, and a user's uploads only ever match their own files.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "fingerprints.sqlite3")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(fingerprints)")}
+            if columns and "user_id" not in columns:
+                # Indexes built before fingerprints were kept per user have no owner to match
+                # against, and their UNIQUE content_hash cannot be widened in place
+                self._conn.executescript("DROP TABLE fingerprint_hashes; DROP TABLE fingerprints;")
+            self._conn.executescript(SCHEMA)
+
+    def add(self, user_id, audio_hash, file_name, fingerprint):
+        """Index a user's fingerprint under its audio content hash; re-adding is a no-op."""
+        if len(fingerprint) == 0:
+            return
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO fingerprints (user_id, content_hash, file_name, num_frames, frames, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, audio_hash, file_name, len(fingerprint),
+                 zlib.compress(fingerprint.astype('<u4').tobytes()), time.time())
+            )
+            if cursor.rowcount == 0:
+                return
+            fingerprint_id = cursor.lastrowid
+            # Queries look up every frame, so a sparse table still sees every alignment
+            self._conn.executemany(
+                "INSERT INTO fingerprint_hashes (hash, fingerprint_id, frame) VALUES (?, ?, ?)",
+                ((int(fingerprint[frame]), fingerprint_id, frame)
+                 for frame in range(0, len(fingerprint), INDEX_STRIDE)
+                 if fingerprint[frame] != SILENT_HASH)
+            )
+
+    def _load(self, fingerprint_id):
+        row = self._conn.execute(
+            "SELECT content_hash, file_name, frames FROM fingerprints WHERE id = ?",
+            (fingerprint_id,)
+        ).fetchone()
+        frames = np.frombuffer(zlib.decompress(row[2]), dtype='<u4').astype(np.uint32)
+        return row[0], row[1], frames
+
+    def find_matches(self, user_id, fingerprint, exclude_hash=None, max_candidates=5):
+        """Return the user's indexed files that overlap the fingerprinted audio, best coverage first.
+
+        Candidates are found by voting on the frame offset of exact sub-fingerprint
+        hits and then confirmed with the bit error rate over the aligned overlap.
+        """
+        if len(fingerprint) == 0:
+            return []
+
+        positions = {}
+        for frame, value in enumerate(fingerprint.tolist()):
+            if value != SILENT_HASH:
+                positions.setdefault(value, []).append(frame)
+
+        votes = Counter()
+        values = list(positions)
+        with self._lock:
+            for i in range(0, len(values), 500):
+                batch = values[i:i + 500]
+                rows = self._conn.execute(
+                    "SELECT hash, fingerprint_id, frame FROM fingerprint_hashes "
+                    "JOIN fingerprints ON fingerprints.id = fingerprint_id "
+                    f"WHERE user_id = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [user_id] + batch
+                ).fetchall()
+                for value, fingerprint_id, frame in rows:
+                    for query_frame in positions[value]:
+                        votes[(fingerprint_id, frame - query_frame)] += 1
+
+            matches = []
+            seen = set()
+            for (fingerprint_id, offset), count in votes.most_common():
+                if count < MIN_VOTES or len(matches) >= max_candidates:
+                    break
+                if fingerprint_id in seen:
+                    continue
+                audio_hash, file_name, reference = self._load(fingerprint_id)
+                if audio_hash == exclude_hash:
+                    continue
+                ber, start, end = bit_error_rate(fingerprint, reference, offset)
+                if ber > MAX_BIT_ERROR_RATE:
+                    continue
+                seen.add(fingerprint_id)
+                coverage = (end - start) / len(fingerprint)
+                matches.append({
+                    "content_hash": audio_hash,
+                    "file_name": file_name,
+                    "bit_error_rate": float(ber),
+                    "offset_seconds": frames_to_seconds(offset),
+                    "overlap_start": frames_to_seconds(start),
+                    "overlap_end": frames_to_seconds(end),
+                    "duration": frames_to_seconds(len(fingerprint)),
+                    "coverage": coverage,
+                    "kind": "duplicate" if coverage >= DUPLICATE_COVERAGE else "overlap",
+                })
+
+        matches = [m for m in matches if m["coverage"] >= OVERLAP_COVERAGE]
+        return sorted(matches, key=lambda m: m["coverage"], reverse=True)
+
+def new_portions(match, min_seconds=5.0):
+    """Return the (start, end) ranges of the new audio not covered by a match."""
+    ranges = []
+    if match["overlap_start"] >= min_seconds:
+        ranges.append((0.0, match["overlap_start"]))
+    if match["duration"] - match["overlap_end"] >= min_seconds:
+        ranges.append((match["overlap_end"], None))
+    return ranges
@@ -0,0 +1,93 @@
+"""Hedged model calls: re-issue a slow call and keep whichever response lands first.
+
+Hedging is off unless AUDIO_ANALYSIS_HEDGE_PERCENTILE is set (e.g. 95). A call
+still running past that percentile of recent latencies of calls of a similar
+payload size gets one duplicate. AUDIO_ANALYSIS_HEDGE_MAX_EXTRA caps the bytes
+sent again as a fraction of all bytes sent (default 0.1, i.e. at most 10% extra
+spend, since audio tokens scale with the payload), and no call is hedged until
+AUDIO_ANALYSIS_HEDGE_MIN_SAMPLES latencies have been seen for its size.
+"""
+import bisect
+import os
+import threading
+from collections import deque
+
+import metrics
+
+HEDGE_PERCENTILE = float(os.environ.get("AUDIO_ANALYSIS_HEDGE_PERCENTILE", "0"))
+HEDGE_MAX_EXTRA = float(os.environ.get("AUDIO_ANALYSIS_HEDGE_MAX_EXTRA", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("AUDIO_ANALYSIS_HEDGE_MIN_SAMPLES", "20"))
+
+# Only per-segment transcription is hedged; the reduce call is a single long request
+HEDGED_STAGES = ("segment",)
+
+# Payload sizes in MB separating the latency histories, so large files are only compared with large files
+SIZE_BUCKETS_MB = (1, 4, 16)
+
+def size_bucket(payload_bytes):
+    """Return the index of the latency history a payload of this size belongs to."""
+    return bisect.bisect_right(SIZE_BUCKETS_MB, payload_bytes / (1024 * 1024))
+
+class HedgePolicy:
+    """Latency histories per payload size and the spend cap for one pipeline stage."""
+
+    def __init__(self, stage, percentile=HEDGE_PERCENTILE, max_extra=HEDGE_MAX_EXTRA,
+                 min_samples=HEDGE_MIN_SAMPLES, history_size=200):
+        self.stage = stage
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.history_size = history_size
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self.sent_bytes = 0
+        self.hedged_bytes = 0
+
+    def hedge_delay(self, payload_bytes):
+        """Return the seconds after which a call of this size gets hedged, or None while there is too little history."""
+        with self._lock:
+            latencies = self._latencies.get(size_bucket(payload_bytes), ())
+            if len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index]
+
+    def start_call(self, payload_bytes):
+        with self._lock:
+            self.sent_bytes += payload_bytes
+
+    def try_hedge(self, payload_bytes):
+        """Reserve one duplicate of a call if the spend cap allows sending its payload again."""
+        with self._lock:
+            if self.hedged_bytes + payload_bytes > self.max_extra * self.sent_bytes:
+                return False
+            self.hedged_bytes += payload_bytes
+            self.sent_bytes += payload_bytes
+        metrics.HEDGES.inc(stage=self.stage, outcome="issued")
+        return True
+
+    def record(self, payload_bytes, seconds, hedge_won=False):
+        """Record how long the primary attempt had run when its call was decided.
+
+        When the hedge wins, that is a lower bound on the primary's latency.
+        """
+        with self._lock:
+            bucket = size_bucket(payload_bytes)
+            if bucket not in self._latencies:
+                self._latencies[bucket] = deque(maxlen=self.history_size)
+            self._latencies[bucket].append(seconds)
+        if hedge_won:
+            metrics.HEDGES.inc(stage=self.stage, outcome="won")
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+def policy_for(stage):
+    """Return the process-wide hedge policy for a stage, or None when it is not hedged."""
+    if HEDGE_PERCENTILE <= 0 or stage not in HEDGED_STAGES:
+        return None
+    with _policies_lock:
+        if stage not in _policies:
+            _policies[stage] = HedgePolicy(stage)
+        return _policies[stage]
@@ -0,0 +1,484 @@
+"""Live transcription of a recording that is still in progress.
+
+Audio arrives in pieces, from a file that keeps growing on disk or from a
+local TCP socket, and is cut into chunks of AUDIO_ANALYSIS_LIVE_CHUNK_SECONDS
+(default 300) at the quietest moment near each boundary. Every chunk is
+transcribed as soon as it is complete, and every AUDIO_ANALYSIS_LIVE_SUMMARY_EVERY
+chunks (default 1, 0 disables it) the rolling summary is refreshed from the
+previous summary and the chunks transcribed since, so a refresh costs about
+the same an hour into the recording as at its start. When the recording ends
+only the last partial chunk and the final reduce remain.
+
+A chunk that fails is tried once more; if it fails again, the session goes
+on without it and its time range is marked in the transcript and listed at
+the end of the result.
+
+Timestamps in chunk transcripts are shifted to session time. The final result
+is archived and its usage recorded like any other analysis.
+
+    python live.py --file workshop.wav --type "Summary" --out live/
+    python live.py --listen 127.0.0.1:5055 --format s16le --rate 16000 --out live/
+
+The API key is read from GEMINI_API_KEY. A growing file is considered finished
+when <file>.done appears or it has not grown for --idle-seconds.
+"""
+import argparse
+import hashlib
+import io
+import os
+import socket
+import subprocess
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import analytics
+import metrics
+import pipeline
+import routing
+import silence
+import usage
+from audio_io import AudioClip, AudioDecodeError, ffmpeg_available, file_extension, pcm_bytes_to_float
+from cancellation import CancelToken
+from prompts import combine_transcript_and_summary
+from results_store import ResultsStore, is_error_result
+
+CHUNK_SECONDS = float(os.environ.get("AUDIO_ANALYSIS_LIVE_CHUNK_SECONDS", "300"))
+SUMMARY_EVERY = int(os.environ.get("AUDIO_ANALYSIS_LIVE_SUMMARY_EVERY", "1"))
+# A chunk boundary may move back this far (and at most this share of a chunk) to land
+# in a pause rather than mid-word
+CUT_SEARCH_SECONDS = 10.0
+CUT_SEARCH_SHARE = 0.1
+CHUNK_ATTEMPTS = 2
+FFMPEG_SAMPLE_RATE = 16000
+
+def follow_file(path, poll_interval=1.0, idle_seconds=30.0, cancel_token=None, read_bytes=1 << 20):
+    """Yield the bytes of a file as they are written, until it is finished.
+
+    The file is finished when path + ".done" exists, or when it has not grown
+    for idle_seconds.
+    """
+    cancel_token = cancel_token or CancelToken()
+    while not os.path.exists(path):
+        cancel_token.raise_if_cancelled()
+        time.sleep(poll_interval)
+    last_growth = time.monotonic()
+    with open(path, 'rb') as f:
+        while True:
+            cancel_token.raise_if_cancelled()
+            data = f.read(read_bytes)
+            if data:
+                last_growth = time.monotonic()
+                yield data
+                continue
+            if os.path.exists(path + ".done"):
+                # Drain whatever was written before the marker appeared
+                rest = f.read()
+                if rest:
+                    yield rest
+                return
+            if time.monotonic() - last_growth >= idle_seconds:
+                return
+            time.sleep(poll_interval)
+
+def listen_socket(host, port, cancel_token=None, read_bytes=1 << 16):
+    """Accept one TCP connection and yield its bytes until the sender closes it."""
+    cancel_token = cancel_token or CancelToken()
+    with socket.create_server((host, port)) as server:
+        server.settimeout(1.0)
+        while True:
+            cancel_token.raise_if_cancelled()
+            try:
+                connection, _ = server.accept()
+                break
+            except socket.timeout:
+                continue
+    with connection:
+        connection.settimeout(1.0)
+        while True:
+            cancel_token.raise_if_cancelled()
+            try:
+                data = connection.recv(read_bytes)
+            except socket.timeout:
+                continue
+            if not data:
+                return
+            yield data
+
+class RawPcmDecoder:
+    """Decodes a headerless little-endian PCM stream piece by piece."""
+
+    def __init__(self, sample_rate, channels=1, width=2):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.width = width
+        self._pending = b""
+
+    def feed(self, data):
+        """Return the samples completed by data; an incomplete frame waits for the next piece."""
+        data = self._pending + data
+        usable = len(data) - len(data) % (self.width * self.channels)
+        self._pending = data[usable:]
+        return pcm_bytes_to_float(data[:usable], self.width, self.channels)
+
+    def close(self):
+        return np.zeros(0, dtype=np.float32)
+
+class WavStreamDecoder(RawPcmDecoder):
+    """Decodes a WAV file that is still being written; its header sizes are not trusted."""
+
+    def __init__(self):
+        super().__init__(sample_rate=None)
+        self._header = b""
+
+    def feed(self, data):
+        if self.sample_rate is not None:
+            return super().feed(data)
+        self._header += data
+        body = self._parse_header()
+        if body is None:
+            return np.zeros(0, dtype=np.float32)
+        self._header = b""
+        return super().feed(body)
+
+    def _parse_header(self):
+        """Read the fmt chunk and return the bytes after the data chunk header, or None if incomplete."""
+        header = self._header
+        if len(header) >= 12 and (header[:4] != b'RIFF' or header[8:12] != b'WAVE'):
+            raise AudioDecodeError("The live stream is not a WAV file")
+        position = 12
+        while len(header) >= position + 8:
+            chunk_id, size = header[position:position + 4], int.from_bytes(header[position + 4:position + 8], "little")
+            if chunk_id == b'data':
+                if self.sample_rate is None:
+                    raise AudioDecodeError("WAV stream has no fmt chunk before its data")
+                return header[position + 8:]
+            if len(header) < position + 8 + size:
+                return None
+            if chunk_id == b'fmt ':
+                fmt = header[position + 8:position + 8 + size]
+                self.channels = int.from_bytes(fmt[2:4], "little")
+                self.sample_rate = int.from_bytes(fmt[4:8], "little")
+                self.width = int.from_bytes(fmt[14:16], "little") // 8
+            position += 8 + size + size % 2
+        return None
+
+class FfmpegStreamDecoder:
+    """Decodes any format ffmpeg reads from a stream, e.g. MP3 written by a recorder."""
+
+    def __init__(self, sample_rate=FFMPEG_SAMPLE_RATE):
+        if not ffmpeg_available():
+            raise AudioDecodeError("ffmpeg is required for live audio that is not WAV or raw PCM")
+        self.sample_rate = sample_rate
+        self._process = subprocess.Popen(
+            ["ffmpeg", "-v", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self._lock = threading.Lock()
+        self._output = bytearray()
+        self._reader = threading.Thread(target=self._read, name="live-ffmpeg", daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            data = self._process.stdout.read1(1 << 16)
+            if not data:
+                return
+            with self._lock:
+                self._output += data
+
+    def _take(self):
+        with self._lock:
+            usable = len(self._output) - len(self._output) % 2
+            data = bytes(self._output[:usable])
+            del self._output[:usable]
+        return pcm_bytes_to_float(data, 2, 1)
+
+    def feed(self, data):
+        self._process.stdin.write(data)
+        self._process.stdin.flush()
+        return self._take()
+
+    def close(self):
+        self._process.stdin.close()
+        self._reader.join()
+        self._process.wait()
+        return self._take()
+
+def stream_decoder(stream_format, sample_rate=None, channels=1):
+    """Return a decoder for a live stream: "wav", "s16le" (raw PCM) or anything ffmpeg reads."""
+    if stream_format == "wav":
+        return WavStreamDecoder()
+    if stream_format == "s16le":
+        return RawPcmDecoder(sample_rate or FFMPEG_SAMPLE_RATE, channels)
+    return FfmpegStreamDecoder()
+
+def encode_wav(samples, sample_rate):
+    """Return mono float samples as 16-bit WAV bytes."""
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes((np.clip(samples, -1, 1 - 1 / 32768) * 32768).astype('<i2').tobytes())
+    return out.getvalue()
+
+def format_time_range(chunk):
+    """Return "mm:ss–mm:ss" for a chunk's place in the session."""
+    return "–".join(silence.format_timestamp(chunk[k]) for k in ("start_seconds", "end_seconds"))
+
+def quiet_cut(samples, target, sample_rate, search_seconds=CUT_SEARCH_SECONDS):
+    """Return the sample index of the quietest frame in the search window before target.
+
+    The window is also capped at CUT_SEARCH_SHARE of target, so short chunks stay close to their length.
+    """
+    search = int(min(search_seconds * sample_rate, target * CUT_SEARCH_SHARE))
+    window = samples[max(0, target - search):target]
+    levels = silence.frame_levels(window, sample_rate)
+    if len(levels) == 0:
+        return target
+    frame = int(sample_rate * silence.FRAME_SECONDS)
+    return max(0, target - search) + int(np.argmin(levels)) * frame + frame // 2
+
+class LiveSession:
+    """Cuts incoming audio into chunks and keeps a rolling transcript and summary.
+
+    feed() and finish() are called by the ingest loop; chunks are transcribed
+    on a small pool meanwhile. on_update(session), when given, is called from
+    those worker threads whenever the transcript or summary changes.
+    """
+
+    def __init__(self, model, analysis_type, decoder, name="live.wav", chunk_seconds=CHUNK_SECONDS,
+                 summary_every=SUMMARY_EVERY, on_update=None, cancel_token=None):
+        self.model = model
+        self.analysis_type = analysis_type
+        self.decoder = decoder
+        self.name = name
+        self.chunk_seconds = chunk_seconds
+        self.summary_every = summary_every
+        self.on_update = on_update or (lambda session: None)
+        self.cancel_token = cancel_token or CancelToken()
+        self.run_info = {}
+        self.audio_hash = hashlib.sha256()
+        self.received_bytes = 0
+        self.summary = ""
+        # Consecutive chunks the rolling summary covers
+        self._summarized = 0
+        self.chunks = []
+        self._buffer = []
+        self._buffered = 0
+        self._position = 0
+        self._lock = threading.Lock()
+        self._transcribers = ThreadPoolExecutor(max_workers=2, thread_name_prefix="live-chunk")
+        self._summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="live-summary")
+        self._futures = []
+        self._summary_pending = False
+        self._finishing = False
+
+    def feed(self, data):
+        """Take the next piece of the recording, starting a chunk whenever enough audio has arrived."""
+        self.audio_hash.update(data)
+        self.received_bytes += len(data)
+        samples = self.decoder.feed(data)
+        if len(samples):
+            self._buffer.append(samples)
+            self._buffered += len(samples)
+        rate = self.decoder.sample_rate
+        while rate and self._buffered >= self.chunk_seconds * rate:
+            audio = np.concatenate(self._buffer)
+            cut = quiet_cut(audio, int(self.chunk_seconds * rate), rate)
+            self._start_chunk(audio[:cut])
+            self._buffer, self._buffered = [audio[cut:]], len(audio) - cut
+
+    def _start_chunk(self, samples):
+        rate = self.decoder.sample_rate
+        chunk = {"index": len(self.chunks), "start_seconds": self._position / rate,
+                 "end_seconds": (self._position + len(samples)) / rate, "text": None, "error": None}
+        self._position += len(samples)
+        self.chunks.append(chunk)
+        self._futures.append(self._transcribers.submit(self._transcribe, chunk, encode_wav(samples, rate)))
+
+    def _transcribe(self, chunk, wav_bytes):
+        stem = os.path.splitext(self.name)[0]
+        clip = AudioClip(f"{stem}-{chunk['index'] + 1}.wav", wav_bytes)
+        for _ in range(CHUNK_ATTEMPTS):
+            text = pipeline.process_audio(clip, "Transcription", self.model, run_info=self.run_info,
+                                          cancel_token=self.cancel_token)
+            if not is_error_result(text) or self.cancel_token.cancelled:
+                break
+        if is_error_result(text):
+            # Go on without this chunk, leaving a marker where its transcript would be
+            chunk["error"] = text
+            chunk["text"] = f"[{format_time_range(chunk)}: this part of the recording could not be transcribed]"
+        else:
+            # The chunk's own timestamps start at zero; shift them to session time
+            length = chunk["end_seconds"] - chunk["start_seconds"]
+            chunk["text"] = silence.remap_timestamps(text, [(0.0, chunk["start_seconds"], length)])
+        self.on_update(self)
+        transcribed = sum(c["text"] is not None for c in self.chunks)
+        if self.summary_every and transcribed % self.summary_every == 0:
+            self._schedule_summary()
+
+    def _schedule_summary(self):
+        # Only the newest summary matters: skip a refresh while one is still waiting to run
+        with self._lock:
+            if self._summary_pending:
+                return
+            self._summary_pending = True
+        self._summarizer.submit(self._refresh_summary)
+
+    def _refresh_summary(self):
+        with self._lock:
+            self._summary_pending = False
+        # Only the chunks since the last refresh are sent, with the summary so far in place of the
+        # earlier ones; the final reduce still reads every chunk
+        labelled = self.labelled_transcripts()
+        covered = self._summarized
+        if len(labelled) <= covered:
+            return
+        earlier = [f"--- ROLLING SUMMARY OF LIVE CHUNKS 1–{covered} ---\n{self.summary}"] if covered else []
+        summary = pipeline.process_transcripts(earlier + labelled[covered:], self.analysis_type, self.model,
+                                               self.cancel_token, self.run_info)
+        # A refresh still running when the recording ends must not replace the final summary
+        if not is_error_result(summary) and not self._finishing:
+            self.summary = summary
+            self._summarized = len(labelled)
+            self.on_update(self)
+
+    def labelled_transcripts(self):
+        """Return the consecutive transcribed chunks, labelled for the reduce prompt."""
+        labelled = []
+        for chunk in self.chunks:
+            if chunk["text"] is None:
+                break
+            labelled.append(f"--- LIVE CHUNK {chunk['index'] + 1} TRANSCRIPT ({format_time_range(chunk)}) ---\n"
+                            f"{chunk['text']}")
+        return labelled
+
+    @property
+    def transcript(self):
+        """The rolling transcript of the consecutive chunks transcribed so far."""
+        return "\n\n".join(t.split("\n", 1)[1] for t in self.labelled_transcripts())
+
+    def finish(self):
+        """Transcribe what is left once the recording has ended and return the final analysis."""
+        tail = self.decoder.close()
+        if len(tail):
+            self._buffer.append(tail)
+        audio = np.concatenate(self._buffer) if self._buffer else np.zeros(0, dtype=np.float32)
+        if len(audio) and self.decoder.sample_rate:
+            self._start_chunk(audio)
+        self._buffer, self._buffered = [], 0
+        try:
+            for future in self._futures:
+                future.result()
+        except Exception as e:
+            return f"Error processing audio: {e}"
+        finally:
+            self._finishing = True
+            self._transcribers.shutdown(wait=False, cancel_futures=True)
+            self._summarizer.shutdown(wait=False, cancel_futures=True)
+        if not self.chunks:
+            return "Error processing audio: no audio was received"
+        failed = self.failed_chunks()
+        if len(failed) == len(self.chunks):
+            return failed[0]["error"]
+
+        result = pipeline.process_transcripts(self.labelled_transcripts(), self.analysis_type, self.model,
+                                              self.cancel_token, self.run_info)
+        self.run_info["transcript"] = self.transcript
+        if not is_error_result(result):
+            self.summary = result
+            if self.analysis_type.startswith("Transcript & Summary"):
+                result = combine_transcript_and_summary(self.transcript, result)
+            if failed:
+                gaps = "\n".join(f"- {format_time_range(c)}: {c['error']}" for c in failed)
+                result += f"\n\n# NOT TRANSCRIBED\n\n{gaps}"
+        return result
+
+    def failed_chunks(self):
+        """Return the chunks left out after failing every attempt."""
+        return [c for c in self.chunks if c["error"]]
+
+def write_outputs(session, out_dir):
+    """Write the rolling transcript and summary to files another tool can watch."""
+    os.makedirs(out_dir, exist_ok=True)
+    for name, text in (("transcript.txt", session.transcript), ("summary.txt", session.summary)):
+        partial = os.path.join(out_dir, name + ".partial")
+        with open(partial, 'w') as f:
+            f.write(text)
+        os.replace(partial, os.path.join(out_dir, name))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="recording that is still being written")
+    source.add_argument("--listen", help="HOST:PORT to receive the audio on")
+    parser.add_argument("--format", help="wav, s16le (raw PCM) or any format ffmpeg reads "
+                                         "(default: the file's extension, or wav for --listen)")
+    parser.add_argument("--rate", type=int, help="sample rate of raw s16le input")
+    parser.add_argument("--channels", type=int, default=1, help="channels of raw s16le input")
+    parser.add_argument("--type", default="Transcript & Summary", help="analysis type of the rolling and final result")
+    parser.add_argument("--chunk-seconds", type=float, default=CHUNK_SECONDS)
+    parser.add_argument("--idle-seconds", type=float, default=30.0)
+    parser.add_argument("--out", default="live", help="directory for transcript.txt, summary.txt and result.txt")
+    return parser.parse_args(argv)
+
+def main(args):
+    api_key = os.environ["GEMINI_API_KEY"]
+    model = pipeline.initialize_genai(api_key)
+    cancel_token = CancelToken()
+    if args.file:
+        name = os.path.basename(args.file)
+        stream_format = args.format or file_extension(args.file)
+        pieces = follow_file(args.file, idle_seconds=args.idle_seconds, cancel_token=cancel_token)
+    else:
+        host, port = args.listen.rsplit(":", 1)
+        name = f"live-{time.strftime('%Y%m%d_%H%M')}.wav"
+        stream_format = args.format or "wav"
+        pieces = listen_socket(host, int(port), cancel_token)
+
+    def report(session):
+        write_outputs(session, args.out)
+        done = sum(c["text"] is not None and not c["error"] for c in session.chunks)
+        failed = len(session.failed_chunks())
+        status = f"{done}/{len(session.chunks)} chunk(s) transcribed" + (f", {failed} failed" if failed else "")
+        print(f"{time.strftime('%H:%M:%S')} {status}, summary {'updated' if session.summary else 'pending'}",
+              flush=True)
+
+    session = LiveSession(model, args.type, stream_decoder(stream_format, args.rate, args.channels), name,
+                          args.chunk_seconds, on_update=report, cancel_token=cancel_token)
+    run, result = {}, ""
+    try:
+        with metrics.track_run(args.type, "live") as run:
+            for data in pieces:
+                session.feed(data)
+            started = time.perf_counter()
+            result = session.finish()
+            if is_error_result(result):
+                run["outcome"] = "error"
+    except KeyboardInterrupt:
+        cancel_token.cancel()
+        raise
+    finally:
+        user_id = usage.user_id_for_key(api_key)
+        usage.UsageLedger().record_run(user_id, args.type, session.run_info)
+        settings = {"model": routing.stage_models(session.model, session.received_bytes),
+                    "live_chunk_seconds": args.chunk_seconds}
+        analytics.record_run(user_id, session.audio_hash.hexdigest(), name, args.type, settings, run,
+                             session.run_info, result, session.received_bytes, mode="live")
+
+    write_outputs(session, args.out)
+    with open(os.path.join(args.out, "result.txt"), 'w') as f:
+        f.write(result)
+    if not is_error_result(result):
+        ResultsStore().save(user_id, session.audio_hash.hexdigest(), name, args.type, settings, result,
+                            session.run_info.get("transcript", ""))
+    print(f"Final analysis ready {time.perf_counter() - started:.1f}s after the recording ended: "
+          f"{os.path.join(args.out, 'result.txt')}")
+
+if __name__ == "__main__":
+    main(parse_args())
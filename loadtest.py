@@ -0,0 +1,349 @@
+"""Load test the page with many simulated browser sessions against the fake model.
+
+Starts `streamlit run loadtest_app.py` locally, then drives each session over
+Streamlit's websocket protocol through the same steps a user takes: enter a key,
+upload a file, click "Analyze Audio" and fetch the download. Server CPU and
+memory are sampled from /proc, so the numbers describe one instance (Linux only).
+
+    python loadtest.py --audio meeting.mp3 --levels 1,2,4,8,16 --slo-seconds 60
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+import wave
+
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.websocket import websocket_connect
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ClientState_pb2 import ClientState
+from streamlit.proto.Common_pb2 import FileUploaderState, FileURLsRequest, UploadedFileInfo
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState, WidgetStates
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+WIDGET_TYPES = ("button", "checkbox", "download_button", "file_uploader", "selectbox", "slider", "text_input")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+class SessionError(Exception):
+    """Raised when a simulated session cannot complete the flow."""
+
+def synthetic_wav(seconds=60, sample_rate=16000):
+    """Return a mono 16-bit WAV of low-level noise, for runs without a real recording."""
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(os.urandom(seconds * sample_rate * 2))
+    return out.getvalue()
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+class SimulatedSession:
+    """One browser tab speaking Streamlit's websocket protocol."""
+
+    def __init__(self, host, port, file_name, audio_bytes, api_key="load-test-key"):
+        self.base_url = f"http://{host}:{port}"
+        self.ws_url = f"ws://{host}:{port}/_stcore/stream"
+        self.file_name = file_name
+        self.audio_bytes = audio_bytes
+        self.api_key = api_key
+        self.ws = None
+        self.session_id = None
+        self.widgets = {}
+        self.states = {}
+        self.download_url = None
+        self.errors = []
+        self._cache = {}
+
+    async def _read(self):
+        raw = await self.ws.read_message()
+        if raw is None:
+            raise SessionError("Server closed the websocket")
+        msg = ForwardMsg.FromString(raw)
+        if msg.WhichOneof("type") == "ref_hash":
+            msg = self._cache[msg.ref_hash]
+        elif msg.metadata.cacheable:
+            self._cache[msg.hash] = msg
+        return msg
+
+    def _record_element(self, msg):
+        element = msg.delta.new_element
+        kind = element.WhichOneof("type")
+        if kind in WIDGET_TYPES:
+            widget = getattr(element, kind)
+            self.widgets[widget.label] = widget.id
+            if kind == "download_button":
+                self.download_url = widget.url
+        elif kind == "exception":
+            self.errors.append(element.exception.message)
+
+    async def _rerun(self, trigger_id=None):
+        """Send the current widget states and wait for the script run to finish."""
+        widgets = list(self.states.values())
+        if trigger_id is not None:
+            widgets.append(WidgetState(id=trigger_id, trigger_value=True))
+        back = BackMsg(rerun_script=ClientState(widget_states=WidgetStates(widgets=widgets)))
+        await self.ws.write_message(back.SerializeToString(), binary=True)
+
+        self.widgets, self.download_url, self.errors = {}, None, []
+        while True:
+            msg = await self._read()
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.session_id = msg.new_session.initialize.session_id
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._record_element(msg)
+            elif kind == "script_finished":
+                if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return
+
+    def _widget_id(self, label):
+        if label not in self.widgets:
+            raise SessionError(f"Widget {label!r} not rendered; errors: {self.errors}")
+        return self.widgets[label]
+
+    async def _upload(self, uploader_id):
+        request_id = uuid.uuid4().hex
+        back = BackMsg(file_urls_request=FileURLsRequest(
+            request_id=request_id, file_names=[self.file_name], session_id=self.session_id))
+        await self.ws.write_message(back.SerializeToString(), binary=True)
+        while True:
+            msg = await self._read()
+            if msg.WhichOneof("type") == "file_urls_response" and msg.file_urls_response.response_id == request_id:
+                file_urls = msg.file_urls_response.file_urls[0]
+                break
+
+        boundary = uuid.uuid4().hex
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{self.file_name}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + self.audio_bytes + f"\r\n--{boundary}--\r\n".encode()
+        await AsyncHTTPClient().fetch(HTTPRequest(
+            self.base_url + file_urls.upload_url, method="PUT", body=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+            request_timeout=600
+        ))
+
+        info = UploadedFileInfo(id=1, name=self.file_name, size=len(self.audio_bytes),
+                                file_id=file_urls.file_id, file_urls=file_urls)
+        # The uploader accepts several files; a one-file list takes the single-file analysis path
+        self.states[uploader_id] = WidgetState(
+            id=uploader_id,
+            file_uploader_state_value=FileUploaderState(max_file_id=1, uploaded_file_info=[info])
+        )
+
+    async def run(self):
+        """Run the full flow and return its timings in seconds."""
+        started = time.perf_counter()
+        self.ws = await websocket_connect(self.ws_url, subprotocols=["streamlit"])
+        try:
+            await self._rerun()
+            key_id = self._widget_id("Enter your Gemini API Key")
+            self.states[key_id] = WidgetState(id=key_id, string_value=self.api_key)
+            await self._rerun()
+
+            upload_started = time.perf_counter()
+            await self._upload(self._widget_id("Choose one or more audio files"))
+            await self._rerun()
+            upload_seconds = time.perf_counter() - upload_started
+
+            analyze_started = time.perf_counter()
+            await self._rerun(trigger_id=self._widget_id("Analyze Audio"))
+            if self.download_url is None:
+                raise SessionError(f"No download offered; errors: {self.errors}")
+            response = await AsyncHTTPClient().fetch(self.base_url + self.download_url, request_timeout=60)
+            if response.body.startswith(b"Error processing"):
+                raise SessionError(response.body[:200].decode(errors="replace"))
+            analyze_seconds = time.perf_counter() - analyze_started
+        finally:
+            self.ws.close()
+
+        return {
+            "total": time.perf_counter() - started,
+            "upload": upload_seconds,
+            "analyze": analyze_seconds,
+        }
+
+class ProcessSampler:
+    """Samples CPU time and resident memory of one process from /proc."""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._task = None
+
+    def cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime are fields 14 and 15 of the full line
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    def rss_bytes(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    async def _sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak_rss = self.rss_bytes()
+        self._task = asyncio.ensure_future(self._sample())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+def start_server(port, data_dir, extra_env):
+    """Start the page on the fake model and wait until it is healthy."""
+    env = dict(os.environ, AUDIO_ANALYSIS_DATA_DIR=data_dir, **extra_env)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", "loadtest_app.py",
+         "--server.port", str(port), "--server.headless", "true",
+         "--server.enableXsrfProtection", "false", "--server.fileWatcherType", "none",
+         "--browser.gatherUsageStats", "false"],
+        cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Streamlit server did not become healthy within 60s")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def run_level(port, concurrency, sessions, file_name, audio_bytes, sampler, session_timeout):
+    """Run `sessions` sessions, at most `concurrency` at a time, and summarize them."""
+    semaphore = asyncio.Semaphore(concurrency)
+    timings, failures = [], []
+
+    async def one(index):
+        # A few trailing bytes make every upload a distinct file, so the archive cache never hits
+        data = audio_bytes + index.to_bytes(8, "little") + os.urandom(8)
+        async with semaphore:
+            session = SimulatedSession("127.0.0.1", port, file_name, data)
+            try:
+                timings.append(await asyncio.wait_for(session.run(), session_timeout))
+            except Exception as e:
+                failures.append(f"{type(e).__name__}: {e}")
+
+    cpu_before = sampler.cpu_seconds()
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(sessions)))
+    wall = time.perf_counter() - started
+    await sampler.stop()
+    cpu_used = sampler.cpu_seconds() - cpu_before
+
+    analyze = [t["analyze"] for t in timings]
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "completed": len(timings),
+        "failed": len(failures),
+        "p50": percentile(analyze, 0.50) if analyze else None,
+        "p95": percentile(analyze, 0.95) if analyze else None,
+        "p99": percentile(analyze, 0.99) if analyze else None,
+        "upload_p50": percentile([t["upload"] for t in timings], 0.50) if timings else None,
+        "throughput_per_min": 60 * len(timings) / wall,
+        "cpu_cores": cpu_used / wall,
+        "peak_rss_mb": sampler.peak_rss / 2**20,
+        "errors": failures[:5],
+    }
+
+def print_report(rows, slo_seconds=None):
+    header = f"{'conc':>5} {'ok':>5} {'fail':>5} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'runs/min':>9} {'cpu':>6} {'rss MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        fmt = lambda v: f"{v:8.2f}" if v is not None else f"{'-':>8}"
+        print(f"{row['concurrency']:>5} {row['completed']:>5} {row['failed']:>5} {fmt(row['p50'])} {fmt(row['p95'])} "
+              f"{fmt(row['p99'])} {row['throughput_per_min']:9.1f} {row['cpu_cores']:6.2f} {row['peak_rss_mb']:8.0f}")
+        for error in row["errors"]:
+            print(f"      ! {error}")
+    if slo_seconds:
+        within = [r["concurrency"] for r in rows if not r["failed"] and r["p95"] is not None and r["p95"] <= slo_seconds]
+        if within:
+            print(f"\nHighest tested concurrency with p95 <= {slo_seconds}s: {max(within)}")
+        else:
+            print(f"\nNo tested concurrency kept p95 <= {slo_seconds}s")
+
+async def main_async(args):
+    if args.audio:
+        with open(args.audio, 'rb') as f:
+            audio_bytes = f.read()
+        file_name = os.path.basename(args.audio)
+    else:
+        audio_bytes, file_name = synthetic_wav(args.synthetic_seconds), "synthetic.wav"
+
+    port = free_port()
+    extra_env = {
+        "FAKE_MODEL_BASE_SECONDS": str(args.model_base_seconds),
+        "FAKE_MODEL_SECONDS_PER_MB": str(args.model_seconds_per_mb),
+    }
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = start_server(port, data_dir, extra_env)
+        try:
+            sampler = ProcessSampler(server.pid)
+            rows = []
+            for level in args.levels:
+                sessions = max(level, args.rounds * level)
+                print(f"Running {sessions} sessions at concurrency {level}...", file=sys.stderr)
+                rows.append(await run_level(port, level, sessions, file_name, audio_bytes,
+                                            sampler, args.session_timeout))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print_report(rows, args.slo_seconds)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio", help="audio file to upload (default: synthetic WAV)")
+    parser.add_argument("--synthetic-seconds", type=int, default=60)
+    parser.add_argument("--levels", type=lambda s: [int(v) for v in s.split(",")], default=[1, 2, 4, 8, 16],
+                        help="comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=3, help="sessions per level = rounds x concurrency")
+    parser.add_argument("--model-base-seconds", type=float, default=2.0)
+    parser.add_argument("--model-seconds-per-mb", type=float, default=1.5)
+    parser.add_argument("--session-timeout", type=float, default=900)
+    parser.add_argument("--slo-seconds", type=float, help="report the highest concurrency meeting this p95")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(main_async(parse_args()))
@@ -0,0 +1,8 @@
+"""Serve the real page against the fake model: streamlit run loadtest_app.py"""
+import fake_model
+
+fake_model.install()
+
+import app
+
+app.main()
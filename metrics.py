@@ -0,0 +1,239 @@
+"""In-process counters, gauges and histograms exposed in Prometheus text format.
+
+serve() starts a small HTTP endpoint (AUDIO_ANALYSIS_METRICS_PORT, default 9464,
+"0" disables it) answering GET /metrics. On Cloud Run it is scraped from inside
+the instance, e.g. by the Managed Service for Prometheus sidecar.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cancellation import MODEL_CALL_EXECUTOR, AnalysisCancelled
+
+METRICS_PORT = int(os.environ.get("AUDIO_ANALYSIS_METRICS_PORT", "9464"))
+
+LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, float("inf"))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Compute the (unlabelled) value at scrape time instead of storing it."""
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            self.set(self._function())
+        return super().render()
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+RUNS = Counter("audio_analysis_runs_total", "Analyses finished, by outcome.",
+               ["analysis_type", "mode", "outcome"])
+RUNS_IN_PROGRESS = Gauge("audio_analysis_runs_in_progress", "Analyses currently running.")
+RUN_SECONDS = Histogram("audio_analysis_run_seconds", "Wall time of a whole analysis.", ["mode"])
+SEGMENTS = Counter("audio_analysis_segments_total", "Segments handled in long-audio mode.", ["outcome"])
+MODEL_CALLS = Counter("audio_analysis_model_calls_total", "Gemini generate_content calls.",
+                      ["stage", "model", "outcome"])
+MODEL_CALL_SECONDS = Histogram("audio_analysis_model_call_seconds", "Latency of Gemini calls.", ["stage", "model"])
+MODEL_CALLS_IN_FLIGHT = Gauge("audio_analysis_model_calls_in_flight", "Gemini calls currently executing.")
+MODEL_CALL_QUEUE_DEPTH = Gauge("audio_analysis_model_call_queue_depth", "Gemini calls waiting for a worker thread.")
+HEDGES = Counter("audio_analysis_hedges_total", "Duplicate calls issued for slow requests, and how many won.",
+                 ["stage", "outcome"])
+TOKENS = Counter("audio_analysis_tokens_total", "Tokens reported by Gemini usage metadata.", ["stage", "direction"])
+BYTES_UPLOADED = Counter("audio_analysis_bytes_uploaded_total", "Audio bytes sent to Gemini.")
+AUDIO_PARTS = Counter("audio_analysis_audio_parts_total", "Audio payloads prepared for Gemini, by transport.", ["mode"])
+SILENCE_TRIMMED_SECONDS = Counter("audio_analysis_silence_trimmed_seconds_total", "Seconds of dead air cut before upload.")
+UPLOAD_BYTES_SAVED = Counter("audio_analysis_upload_bytes_saved_total", "Upload bytes saved by silence trimming.")
+COMPACTION_TOKENS_SAVED = Counter("audio_analysis_compaction_tokens_saved_total",
+                                  "Estimated reduce-prompt tokens saved by transcript compaction.")
+CACHE_LOOKUPS = Counter("audio_analysis_cache_lookups_total", "Reuse checks before calling Gemini.",
+                        ["cache", "result"])
+RESULT_RATINGS = Counter("audio_analysis_result_ratings_total", "User ratings of results, by route.",
+                         ["route", "rating"])
+COALESCED = Counter("audio_analysis_coalesced_total", "Work joined to an identical request already in flight.",
+                    ["stage"])
+BATCH_FILES = Counter("audio_analysis_batch_files_total", "Files analyzed from multi-file uploads.", ["outcome"])
+FIRST_RENDER_SECONDS = Gauge("audio_analysis_first_render_seconds", "Seconds from process start to first render.")
+
+# ThreadPoolExecutor keeps no public queue length; its work queue is a plain SimpleQueue
+MODEL_CALL_QUEUE_DEPTH.set_function(lambda: MODEL_CALL_EXECUTOR._work_queue.qsize())
+
+@contextmanager
+def track_run(analysis_type, mode):
+    """Count one analysis; the caller may set run["outcome"] (default "success").
+
+    run["seconds"] holds the wall time once the block has exited.
+    """
+    run = {"outcome": "success"}
+    RUNS_IN_PROGRESS.inc()
+    started = time.perf_counter()
+    try:
+        yield run
+    except (AnalysisCancelled, KeyboardInterrupt):
+        run["outcome"] = "cancelled"
+        raise
+    except Exception:
+        run["outcome"] = "error"
+        raise
+    except BaseException:
+        # Streamlit interrupts a script this way when the user cancels
+        run["outcome"] = "cancelled"
+        raise
+    finally:
+        run["seconds"] = time.perf_counter() - started
+        RUNS_IN_PROGRESS.dec()
+        RUNS.inc(analysis_type=analysis_type.split(" - ")[0], mode=mode, outcome=run["outcome"])
+        RUN_SECONDS.observe(run["seconds"], mode=mode)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = {"started": False}
+_server_lock = threading.Lock()
+
+def serve(port=METRICS_PORT):
+    """Start the /metrics endpoint once per process; a busy port only logs a warning."""
+    with _server_lock:
+        if _server["started"] or not port:
+            return
+        _server["started"] = True
+    try:
+        httpd = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint not started on port {port}: {e}", flush=True)
+        return
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
@@ -0,0 +1,111 @@
+"""Decoded-audio cache: each upload is decoded to PCM once and memory-mapped from disk.
+
+Silence detection, fingerprinting and duration checks all need the decoded
+signal; instead of decoding the upload in memory for each of them, decode()
+writes mono float32 samples to PCM_CACHE_DIR/<content hash>_<rate>.f32 and
+returns a read-only array memory-mapped from that file. frames() slices it into
+views without copying, so multi-hour recordings only page in what is read.
+
+Files are evicted least-recently-used once the cache exceeds
+AUDIO_ANALYSIS_PCM_CACHE_MB (default 2048).
+"""
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+import metrics
+from audio_io import decode_pcm_to_file
+from results_store import DATA_DIR, content_hash
+
+PCM_CACHE_DIR = os.path.join(DATA_DIR, "pcm_cache")
+PCM_CACHE_BYTES = int(float(os.environ.get("AUDIO_ANALYSIS_PCM_CACHE_MB", "2048")) * 1e6)
+SAMPLE_RATE = 8000
+
+class PcmCache:
+    """Content-addressed directory of decoded float32 PCM files with an LRU size cap."""
+
+    def __init__(self, directory=PCM_CACHE_DIR, max_bytes=PCM_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, audio_hash, sample_rate):
+        return os.path.join(self.directory, f"{audio_hash}_{sample_rate}.f32")
+
+    def decode(self, data, file_name, sample_rate=SAMPLE_RATE, audio_hash=None):
+        """Return the upload as read-only memory-mapped float32 samples, decoding it on the first request.
+
+        Raises AudioDecodeError when the audio cannot be decoded here.
+        """
+        path = self.path_for(audio_hash or content_hash(data), sample_rate)
+        if os.path.exists(path):
+            metrics.CACHE_LOOKUPS.inc(cache="pcm", result="hit")
+            # The modification time doubles as the LRU clock
+            os.utime(path)
+        else:
+            metrics.CACHE_LOOKUPS.inc(cache="pcm", result="miss")
+            # Decode next to the final path and rename, so readers never see a partial file
+            fd, partial = tempfile.mkstemp(dir=self.directory, suffix=".partial")
+            os.close(fd)
+            try:
+                decode_pcm_to_file(data, file_name, partial, sample_rate)
+                os.replace(partial, path)
+            finally:
+                if os.path.exists(partial):
+                    os.unlink(partial)
+            self.evict()
+        return self._open(path)
+
+    def _open(self, path):
+        if os.path.getsize(path) == 0:
+            # np.memmap refuses empty files
+            return np.zeros(0, dtype=np.float32)
+        # A plain ndarray view of the map; np.memmap would leak into every derived array
+        return np.memmap(path, dtype=np.float32, mode='r').view(np.ndarray)
+
+    def evict(self):
+        """Delete least-recently-used files until the cache fits its size cap."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".f32"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            # Keep the newest file even when it alone exceeds the cap
+            for _, size, name in sorted(entries)[:-1]:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    # Open memmaps keep working on Linux after the file is unlinked
+                    os.unlink(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the process-wide PCM cache."""
+    with _cache_lock:
+        if "cache" not in _cache:
+            _cache["cache"] = PcmCache()
+        return _cache["cache"]
+
+def decode(data, file_name, sample_rate=SAMPLE_RATE, audio_hash=None):
+    """Decode through the process-wide cache, see PcmCache.decode()."""
+    return get_cache().decode(data, file_name, sample_rate, audio_hash)
+
+def frames(samples, start_seconds, end_seconds=None, sample_rate=SAMPLE_RATE):
+    """Return the samples between two times as a view, without copying."""
+    start = round(start_seconds * sample_rate)
+    end = len(samples) if end_seconds is None else round(end_seconds * sample_rate)
+    return samples[start:end]
@@ -0,0 +1,414 @@
+"""The analysis engine, free of Streamlit so it can run in workers, batch jobs and benchmarks.
+
+Long-running functions take two optional callbacks:
+
+    progress(fraction, message)   fraction of the run done (0..1) and a status line
+    log(level, message)           level is "info", "warning" or "error"
+
+Both are always called from the thread that called the function, also when
+AUDIO_ANALYSIS_PIPELINE=async runs the model calls on the shared event loop.
+app.py is the Streamlit client of this module.
+"""
+import copy
+import os
+import tempfile
+import time
+
+import async_pipeline
+import compaction
+import hedging
+import metrics
+import profiling
+import routing
+import segments
+import singleflight
+import structured
+import transport
+import usage
+from cancellation import AnalysisCancelled, CancelToken, call_cancellable
+from prompts import combine_transcript_and_summary, get_full_context_prompt, get_segment_prompt
+from results_store import content_hash, is_error_result
+
+def _ignore(*args):
+    pass
+
+def get_genai():
+    """Return the Gemini SDK module, importing it on first use."""
+    import google.generativeai as genai
+    return genai
+
+def initialize_genai(api_key):
+    """Initialize the Gemini AI model router, which picks a model per pipeline stage."""
+    genai = get_genai()
+    genai.configure(api_key=api_key)
+    return routing.ModelRouter(genai)
+
+def generate(model, stage, contents, cancel_token=None, run_info=None, **kwargs):
+    """Call model.generate_content through the cancellable pool, recording call metrics.
+
+    A ModelRouter is resolved to the model serving this stage and payload size.
+    When a run_info dict is given, the call's token usage is appended to
+    run_info["calls"] for usage accounting, including that of hedged duplicates
+    and of calls that finish after the run was cancelled (see usage.add_call).
+    """
+    parts = contents if isinstance(contents, list) else [contents]
+    # Uploaded parts were counted when uploaded but still size the payload for routing
+    metrics.BYTES_UPLOADED.inc(sum(len(part['data']) for part in parts if isinstance(part, dict)))
+    audio_size = sum(transport.part_size(part) for part in parts if not isinstance(part, str))
+    if isinstance(model, routing.ModelRouter):
+        model = model.model_for(stage, audio_size)
+    model_label = usage.short_model_name(model.model_name)
+    profiler = profiling.profiler_for(run_info)
+
+    def timed_call():
+        metrics.MODEL_CALLS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            with metrics.MODEL_CALL_SECONDS.time(stage=stage, model=model_label), \
+                    profiling.span(run_info, f"{stage} call", model=model_label, audio_bytes=audio_size):
+                response = model.generate_content(contents, **kwargs)
+        finally:
+            metrics.MODEL_CALLS_IN_FLIGHT.dec()
+
+        # Recorded per attempt: a discarded hedge still costs tokens
+        input_tokens, output_tokens = usage.usage_from_response(response)
+        metrics.TOKENS.inc(input_tokens, stage=stage, direction="input")
+        metrics.TOKENS.inc(output_tokens, stage=stage, direction="output")
+        if run_info is not None:
+            usage.add_call(run_info, {
+                "stage": stage,
+                "model": model.model_name,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "seconds": time.perf_counter() - started,
+                "finished_at": time.time()
+            })
+        return response
+
+    try:
+        # A profiled run also profiles its calls on the pool threads
+        call = profiler.wrap(timed_call) if profiler else timed_call
+        response = call_cancellable(cancel_token, call, hedge=hedging.policy_for(stage), payload_bytes=audio_size)
+    except AnalysisCancelled:
+        metrics.MODEL_CALLS.inc(stage=stage, model=model_label, outcome="cancelled")
+        raise
+    except Exception:
+        metrics.MODEL_CALLS.inc(stage=stage, model=model_label, outcome="error")
+        raise
+    metrics.MODEL_CALLS.inc(stage=stage, model=model_label, outcome="ok")
+    return response
+
+def audio_duration(audio_file):
+    """Return the duration of an upload in seconds, or None when it cannot be decoded here."""
+    from audio_io import AudioDecodeError, duration_seconds
+    try:
+        return duration_seconds(audio_file.getvalue(), audio_file.name)
+    except AudioDecodeError:
+        return None
+
+def _report_failed_segments(records, log):
+    failed = [r for r in records if r["status"] == segments.FAILED]
+    if not failed:
+        return None
+    numbers = ", ".join(str(r["index"] + 1) for r in failed)
+    log("error", f"Segment(s) {numbers} failed: {failed[0]['error']}")
+    return f"Error processing audio: segment(s) {numbers} of {len(records)} failed. Re-run them from the segment list."
+
+def process_audio_segments(audio_file, analysis_type, model, num_segments=2, run_info=None,
+                           cancel_token=None, completed_segments=None, progress=None, log=None):
+    """Process audio by sending it in segments to Gemini model.
+
+    Each segment is tracked as a record (see segments.py) in run_info["segments"].
+    Segments listed in completed_segments (index -> record or transcript) are
+    reused instead of being sent again. A failing segment does not stop the
+    others; the run then returns an error and the failed segments can be re-run
+    on their own.
+    """
+    progress = progress or _ignore
+    log = log or _ignore
+    cancel_token = cancel_token or CancelToken()
+    completed_segments = completed_segments or {}
+    # With every segment memoized only the reduce runs: skip decoding and the temp file
+    to_transcribe = [i for i in range(num_segments) if i not in completed_segments]
+    duration = audio_duration(audio_file) if to_transcribe else None
+    records = segments.plan_segments(len(audio_file.getvalue()), num_segments, duration)
+    if run_info is not None:
+        run_info["segments"] = records
+    part = None
+
+    try:
+        # For longer audio, send in parts and collect transcripts
+        progress(0, "Processing audio in segments...")
+
+        # Every segment call carries the whole file: upload it once when that beats re-sending it inline
+        if to_transcribe:
+            part = transport.prepare(audio_file.name, audio_file.getvalue(), len(to_transcribe), cancel_token)
+            # Identical segment calls of concurrent runs on the same audio are made once
+            audio_size = len(audio_file.getvalue())
+            segment_plan = (content_hash(audio_file.getvalue()), routing.stage_model_name(model, "segment", audio_size),
+                            num_segments)
+
+        # Process in segments directly
+        for record in records:
+            i = record["index"]
+            if i in completed_segments:
+                segments.reuse(record, completed_segments[i])
+                progress((i + 1) / (num_segments + 1), f"Reused segment {i+1}/{num_segments}")
+                metrics.SEGMENTS.inc(outcome="reused")
+                continue
+
+            cancel_token.raise_if_cancelled()
+            progress(i / (num_segments + 1), f"Processing segment {i+1}/{num_segments}...")
+
+            # We're going to send the entire file, but with instructions to process a specific segment
+            segment_prompt = get_segment_prompt(i, num_segments)
+
+            segments.start(record)
+            try:
+                response, _ = singleflight.SEGMENTS.do(
+                    singleflight.call_key("segment", *segment_plan, i),
+                    lambda state: generate(model, "segment", [part, segment_prompt], cancel_token, run_info),
+                    cancel_token
+                )
+                segments.finish(record, response.text, *usage.usage_from_response(response))
+                metrics.SEGMENTS.inc(outcome="processed")
+            except AnalysisCancelled:
+                raise
+            except Exception as e:
+                segments.fail(record, e)
+                metrics.SEGMENTS.inc(outcome="failed")
+            progress((i + 1) / (num_segments + 1), f"Processed segment {i+1}/{num_segments}")
+
+        failed_result = _report_failed_segments(records, log)
+        if failed_result:
+            return failed_result
+
+        # Build a clean full transcript
+        full_transcript = "\n\n".join(r["text"] for r in records)
+        if run_info is not None:
+            run_info["transcript"] = full_transcript
+
+        transcripts = segments.transcript_headers(records)
+
+        # Process all transcripts for the final analysis - but don't include transcript in the result
+        progress(num_segments / (num_segments + 1), "Generating final analysis from all segments...")
+        summary_result = process_transcripts(transcripts, analysis_type, model, cancel_token, run_info)
+        progress(1.0, "Analysis complete!")
+
+        if analysis_type.startswith("Transcript & Summary"):
+            # For transcript & summary type, manually combine transcript and summary
+            return combine_transcript_and_summary(full_transcript, summary_result)
+        else:
+            # For other types, just return the LLM output
+            return summary_result
+
+    except AnalysisCancelled:
+        raise
+    except Exception as e:
+        log("error", f"Error processing audio: {str(e)}")
+        return f"Error processing audio: {str(e)}"
+    except BaseException:
+        # The caller is being torn down (e.g. Streamlit stopping the script): stop the calls too
+        cancel_token.cancel()
+        raise
+    finally:
+        if part is not None:
+            transport.release(part)
+        if cancel_token.cancelled:
+            cancel_token.run_cleanups()
+
+def process_transcripts(transcripts, analysis_type, model, cancel_token=None, run_info=None):
+    """Process the combined transcripts with the final analysis.
+
+    The transcripts are compacted first (see compaction.py); the savings are
+    reported in run_info["compaction"].
+    """
+    try:
+        with profiling.span(run_info, "compaction"):
+            transcripts, report = compaction.compact_transcripts(transcripts)
+        if run_info is not None:
+            run_info["compaction"] = report
+
+        # Combine all transcripts with the full context prompt
+        full_prompt = get_full_context_prompt(analysis_type) + "\n".join(transcripts)
+
+        # Send to Gemini for final analysis with appropriate configuration; a concurrent
+        # run that reached the same prompt shares the call
+        response, _ = singleflight.REDUCES.do(
+            singleflight.call_key("reduce", routing.stage_model_name(model, "reduce", 0), full_prompt),
+            lambda state: generate(model, "reduce", full_prompt, cancel_token, run_info,
+                                   generation_config=get_genai().types.GenerationConfig(
+                                       temperature=0.2,  # Lower temperature for more precise output
+                                       max_output_tokens=16000  # Allow enough space for detailed summary
+                                   )),
+            cancel_token
+        )
+        return response.text
+    except AnalysisCancelled:
+        raise
+    except Exception as e:
+        return f"Error processing combined transcripts: {str(e)}"
+
+def process_audio(audio_file, analysis_type, model, use_segmentation=False, num_segments=2, run_info=None,
+                  cancel_token=None, completed_segments=None, progress=None, log=None, job_key=None):
+    """Process the audio file with or without segmentation based on user selection.
+
+    When a run_info dict is given, the transcript produced along the way is stored
+    under run_info["transcript"] so callers can archive it with the result.
+    Cancelling cancel_token makes the call raise AnalysisCancelled. With a
+    job_key (see singleflight.job_key), a run with the same key already in
+    flight is joined instead of starting another.
+    """
+    log = log or _ignore
+    if job_key is not None:
+        return _process_audio_joined(job_key, audio_file, analysis_type, model, use_segmentation, num_segments,
+                                     run_info, cancel_token, completed_segments, progress, log)
+    if async_pipeline.ENABLED:
+        return process_audio_async(audio_file, analysis_type, model, use_segmentation, num_segments, run_info,
+                                   cancel_token, completed_segments, progress, log)
+    if use_segmentation:
+        return process_audio_segments(audio_file, analysis_type, model, num_segments, run_info,
+                                      cancel_token, completed_segments, progress, log)
+    else:
+        try:
+            # Create a temporary file
+            tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.' + audio_file.name.split('.')[-1])
+            tmp_file_path = tmp_file.name
+            tmp_file.write(audio_file.getvalue())
+            tmp_file.close()  # Close the file handle immediately
+
+            try:
+                # Read file as bytes and create Part object
+                with open(tmp_file_path, 'rb') as f:
+                    audio_bytes = f.read()
+
+                prompt, request = structured.single_shot_request(analysis_type, get_genai())
+                with transport.audio_part(audio_file.name, audio_bytes, cancel_token=cancel_token) as part:
+                    response = generate(model, "single", [part, prompt], cancel_token, run_info, **request)
+
+                # Transcript & Summary comes back as JSON (see structured.py) and is rendered as text here
+                result = structured.single_shot_result(response.text, analysis_type, run_info)
+
+            finally:
+                # Add a small delay before trying to remove the file
+                time.sleep(0.5)
+                if os.path.exists(tmp_file_path):
+                    try:
+                        os.unlink(tmp_file_path)
+                    except Exception as cleanup_error:
+                        log("warning", f"Warning: Could not remove temporary file {tmp_file_path}: {cleanup_error}")
+
+            return result
+
+        except AnalysisCancelled:
+            raise
+        except Exception as e:
+            return f"Error processing audio: {str(e)}"
+        except BaseException:
+            if cancel_token is not None:
+                cancel_token.cancel()
+            raise
+
+# What a joining caller copies from the leading run's run_info; the calls stay billed to the leader
+SHARED_RUN_INFO = ("transcript", "segments", "compaction", "structured")
+
+def _process_audio_joined(job_key, audio_file, analysis_type, model, use_segmentation, num_segments, run_info,
+                          cancel_token, completed_segments, progress, log):
+    """process_audio() through singleflight.JOBS, relaying the leader's progress to joining callers."""
+    progress = progress or _ignore
+    shown = {}
+
+    def lead(state):
+        def shared_progress(fraction, message):
+            state["progress"] = (fraction, message)
+            progress(fraction, message)
+        leader_info = run_info if run_info is not None else {}
+        result = process_audio(audio_file, analysis_type, model, use_segmentation, num_segments, leader_info,
+                               cancel_token, completed_segments, shared_progress, log)
+        return result, {k: copy.deepcopy(leader_info[k]) for k in SHARED_RUN_INFO if k in leader_info}
+
+    def follow(state):
+        update = state.get("progress")
+        if update is not None and update != shown.get("progress"):
+            shown["progress"] = update
+            progress(*update)
+
+    (result, shared), joined = singleflight.JOBS.do(job_key, lead, cancel_token, on_poll=follow)
+    if joined:
+        log("info", "The same analysis of this recording was already running: its result is shared "
+                    "instead of analyzing again.")
+        if run_info is not None:
+            run_info.update(copy.deepcopy(shared))
+    return result
+
+def process_audio_async(audio_file, analysis_type, model, use_segmentation=False, num_segments=2,
+                        run_info=None, cancel_token=None, completed_segments=None, progress=None, log=None):
+    """Run process_audio on the asyncio pipeline (AUDIO_ANALYSIS_PIPELINE=async), blocking until done.
+
+    Segments are transcribed concurrently on the shared event loop; their
+    progress is handed back to this thread and reported while it waits.
+    """
+    progress = progress or _ignore
+    latest = {"update": None}
+    duration = None
+    if use_segmentation:
+        to_transcribe = [i for i in range(num_segments) if i not in (completed_segments or {})]
+        duration = audio_duration(audio_file) if to_transcribe else None
+
+    def forward():
+        update, latest["update"] = latest["update"], None
+        if update is not None:
+            progress(*update)
+
+    coroutine = async_pipeline.process_audio_async(
+        audio_file, analysis_type, model, use_segmentation, num_segments, run_info, completed_segments,
+        progress=lambda fraction, message: latest.update(update=(fraction, message)),
+        duration=duration, cancel_token=cancel_token
+    )
+    try:
+        result = async_pipeline.run_sync(coroutine, cancel_token, on_poll=forward)
+    finally:
+        if cancel_token is not None and cancel_token.cancelled:
+            cancel_token.run_cleanups()
+    forward()
+    if use_segmentation and is_error_result(result) and run_info is not None:
+        _report_failed_segments(run_info.get("segments", []), log or _ignore)
+    return result
+
+def process_new_portions(audio_file, match, prior_transcript, analysis_type, model, run_info=None,
+                         cancel_token=None, log=None):
+    """Transcribe only the audio not covered by a previously analyzed recording.
+
+    The new pieces are transcribed on their own and combined with the archived
+    transcript of the overlapping recording for the final analysis.
+    """
+    from audio_io import AudioClip, AudioDecodeError, extract_range
+    from fingerprint import new_portions
+
+    try:
+        before, after = [], []
+        for start, end in new_portions(match):
+            clip = AudioClip(audio_file.name, extract_range(audio_file.getvalue(), audio_file.name, start, end))
+            text = process_audio(clip, "Transcription", model, run_info=run_info, cancel_token=cancel_token,
+                                 log=log)
+            if is_error_result(text):
+                return text
+            (before if start == 0 else after).append(text)
+
+        full_transcript = "\n\n".join(before + [prior_transcript] + after)
+        if run_info is not None:
+            run_info["transcript"] = full_transcript
+
+        transcripts = (
+            [f"--- NEW AUDIO BEFORE THE PREVIOUS RECORDING ---\n{text}" for text in before]
+            + [f"--- PREVIOUSLY ANALYZED RECORDING ---\n{prior_transcript}"]
+            + [f"--- NEW AUDIO AFTER THE PREVIOUS RECORDING ---\n{text}" for text in after]
+        )
+        summary_result = process_transcripts(transcripts, analysis_type, model, cancel_token, run_info)
+
+        if analysis_type.startswith("Transcript & Summary"):
+            return combine_transcript_and_summary(full_transcript, summary_result)
+        return summary_result
+
+    except AudioDecodeError as e:
+        return f"Error processing audio: {str(e)}"
@@ -0,0 +1,229 @@
+"""Opt-in profiling of a single analysis run: CPU hot spots, memory peaks and a stage timeline.
+
+A RunProfiler is put in the run's run_info dict under "profiler"; pipeline
+code only looks it up, so runs without one pay nothing. While the run is
+active, the calling thread and every model call it makes on the pool threads
+run under cProfile, tracemalloc traces allocations, and each call is recorded
+as a span on the timeline. artifact() packs the results into a zip:
+
+    summary.txt         wall time, peak traced memory, slowest spans
+    hot_functions.txt   top functions by cumulative and own time
+    profile.pstats      raw cProfile data (pstats, snakeviz)
+    memory_peaks.txt    lines holding the most memory at the traced peak
+    timeline.json       spans in Chrome trace format (chrome://tracing, Perfetto)
+
+tracemalloc is process-wide, so allocations of other sessions running at the
+same time are included in the memory report. With AUDIO_ANALYSIS_PIPELINE=async
+the calls on the event loop are on the timeline but not in the CPU profile.
+
+From Python 3.12 cProfile runs on sys.monitoring: one profiler sees every
+thread of the process (so other sessions' work shows up in the CPU profile
+too) and only one can be active at a time. A run started while another
+session is being profiled gets the timeline and memory report only, and its
+summary says so.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from contextlib import contextmanager, nullcontext
+
+_tracing_lock = threading.Lock()
+# Profiled runs in progress, and whether this module started tracemalloc for them
+_tracing = {"runs": 0, "started_here": False}
+# One enabled cProfile covers all threads and excludes any other (see above)
+PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+
+def _start_cprofile():
+    """Return an enabled cProfile.Profile, or None when another profiler is already active."""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return None
+    return profile
+
+def profiler_for(run_info):
+    """Return the RunProfiler of a run, or None when it is not being profiled."""
+    return run_info.get("profiler") if run_info else None
+
+def span(run_info, name, **attrs):
+    """Return a context manager recording a timeline span when the run is profiled."""
+    profiler = profiler_for(run_info)
+    return profiler.span(name, **attrs) if profiler else nullcontext()
+
+class RunProfiler:
+    """Collects CPU, memory and timeline data for one run; use as a context manager."""
+
+    def __init__(self, top=40):
+        self.top = top
+        self._lock = threading.Lock()
+        self._stats = None
+        self._spans = []
+        self._peak_snapshot = None
+        self._peak_bytes = 0
+        self._started = None
+        self._seconds = None
+        self._profile = None
+        self._cpu_note = None
+
+    def __enter__(self):
+        with _tracing_lock:
+            if _tracing["runs"] == 0 and not tracemalloc.is_tracing():
+                # One frame per allocation is all the by-line report needs, and keeps tracing cheap
+                tracemalloc.start()
+                _tracing["started_here"] = True
+            _tracing["runs"] += 1
+        self._started = time.perf_counter()
+        self._profile = _start_cprofile()
+        if self._profile is None:
+            self._cpu_note = ("No CPU profile: another profiler (e.g. a run of another session) "
+                              "was active in this process; timeline and memory only.")
+        return self
+
+    def __exit__(self, *exc_info):
+        self._seconds = time.perf_counter() - self._started
+        if self._profile is not None:
+            self._profile.disable()
+            self._add_stats(self._profile)
+        self._check_memory()
+        with _tracing_lock:
+            _tracing["runs"] -= 1
+            # Tracing someone else started is left running
+            if _tracing["runs"] == 0 and _tracing["started_here"]:
+                tracemalloc.stop()
+                _tracing["started_here"] = False
+        return False
+
+    def _add_stats(self, profile):
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def _check_memory(self):
+        # Snapshots are taken at span ends; the one holding the most memory is reported
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            self._peak_bytes = max(self._peak_bytes, peak)
+            keep = self._peak_snapshot is None or current > self._peak_snapshot[0]
+        if keep:
+            snapshot = tracemalloc.take_snapshot()
+            with self._lock:
+                if self._peak_snapshot is None or current > self._peak_snapshot[0]:
+                    self._peak_snapshot = (current, snapshot)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Record a named span of the run on the timeline."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            with self._lock:
+                self._spans.append({"name": name, "thread": threading.current_thread().name,
+                                    "start": started - self._started, "end": ended - self._started,
+                                    **attrs})
+            self._check_memory()
+
+    def wrap(self, func):
+        """Return func profiled with its own cProfile on whatever thread runs it.
+
+        Where the run's profiler already covers every thread, func is returned as is.
+        """
+        if PROCESS_WIDE_CPROFILE:
+            return func
+
+        def profiled(*args, **kwargs):
+            profile = _start_cprofile()
+            if profile is None:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._add_stats(profile)
+        return profiled
+
+    def hot_functions(self):
+        if self._stats is None:
+            return (self._cpu_note or "") + "\n"
+        out = io.StringIO()
+        self._stats.stream = out
+        self._stats.sort_stats("cumulative").print_stats(self.top)
+        self._stats.sort_stats("tottime").print_stats(self.top)
+        return out.getvalue()
+
+    def memory_peaks(self):
+        lines = [f"Peak traced memory: {self._peak_bytes / 1e6:.1f} MB (process-wide)"]
+        if self._peak_snapshot is None:
+            return "\n".join(lines) + "\n"
+        current, snapshot = self._peak_snapshot
+        # Leave out the profiler's own bookkeeping
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, pstats.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        lines.append(f"Largest snapshot: {current / 1e6:.1f} MB held; top lines by size:")
+        lines.append("")
+        for stat in snapshot.statistics("lineno")[:self.top]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size / 1e6:10.2f} MB {stat.count:9,} blocks  {frame.filename}:{frame.lineno}")
+        return "\n".join(lines) + "\n"
+
+    def timeline(self):
+        """Return the spans as Chrome trace events."""
+        threads = {}
+        events = []
+        for s in sorted(self._spans, key=lambda s: s["start"]):
+            tid = threads.setdefault(s["thread"], len(threads) + 1)
+            args = {k: v for k, v in s.items() if k not in ("name", "thread", "start", "end")}
+            events.append({"name": s["name"], "ph": "X", "pid": 1, "tid": tid, "ts": round(s["start"] * 1e6),
+                           "dur": round((s["end"] - s["start"]) * 1e6), "args": args})
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+                   for name, tid in threads.items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self):
+        lines = [f"Wall time: {self._seconds or 0:.2f}s",
+                 f"Peak traced memory: {self._peak_bytes / 1e6:.1f} MB",
+                 f"Spans: {len(self._spans)}"]
+        if self._cpu_note:
+            lines.append(self._cpu_note)
+        lines += ["", "Slowest spans:"]
+        for s in sorted(self._spans, key=lambda s: s["start"] - s["end"])[:10]:
+            lines.append(f"  {s['end'] - s['start']:8.2f}s  {s['name']}  (at {s['start']:.2f}s on {s['thread']})")
+        return "\n".join(lines) + "\n"
+
+    def artifact(self):
+        """Return the profile as zip bytes."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("summary.txt", self.summary())
+            archive.writestr("hot_functions.txt", self.hot_functions())
+            archive.writestr("memory_peaks.txt", self.memory_peaks())
+            archive.writestr("timeline.json", json.dumps(self.timeline(), indent=1))
+            if self._stats is not None:
+                # pstats only dumps to a path
+                fd, path = tempfile.mkstemp(suffix=".pstats")
+                os.close(fd)
+                self._stats.dump_stats(path)
+                try:
+                    with open(path, "rb") as f:
+                        archive.writestr("profile.pstats", f.read())
+                finally:
+                    os.unlink(path)
+        return buffer.getvalue()
@@ -0,0 +1,282 @@
+"""Prompts and response formatting shared by the threaded and asyncio pipelines."""
+
+def get_analysis_prompt(analysis_type):
+    """Return a specific prompt based on the selected analysis type."""
+    base_type = analysis_type.split(" - ")[0]
+    
+    prompts = {
+        "Transcript & Summary": """Please provide both a clean, accurate transcript of this audio file AND a comprehensive summary of the content.
+
+        PART 1 - TRANSCRIPT:
+        Please provide a clean, accurate transcript of this audio file. Do not try to associate names that may be mentioned in the audio to piece of text in the transcript.
+
+        PART 2 - SUMMARY:
+        Please provide a comprehensive meeting summary with the following elements:
+
+        1. Meeting Overview:
+        - Identify all participants and their roles
+        - Extract the main purpose/objective of the meeting
+        - Note the overall tone and engagement level
+        
+        2. Key Discussion Points:
+        - List and elaborate on the major topics discussed
+        - Highlight any decisions made or conclusions reached
+        - Capture important questions raised and their answers
+        
+        3. Action Items & Next Steps:
+        - Extract all tasks and assignments
+        - Include who is responsible for each item
+        - Note any mentioned deadlines or timeframes
+        - Flag any items marked as high priority
+        
+        4. Follow-up Requirements:
+        - List any scheduled follow-up meetings
+        - Note any documents or resources that were requested
+        - Identify any pending decisions or unresolved issues
+        
+        5. Notable Quotes & Key Insights:
+        - Extract significant statements or important insights
+        - Include context for each notable point
+        - Highlight any strategic or innovative ideas proposed
+        
+        6. Additional Context:
+        - Note any important references to past meetings or decisions
+        - Capture any mentioned risks or concerns
+        - Highlight any budget or resource discussions
+        
+        Please organize this information in a clear, concise format while maintaining the natural flow of the discussion.
+        Format your response with clear headings separating the transcript and summary sections.""",
+        
+        "Transcription": "Please provide a clean, accurate transcript of this audio file.",
+        
+        "Summary": """Please provide a comprehensive summary of this audio content, including:
+        - Main topics discussed
+        - Key points and takeaways
+        - Overall context and purpose
+        Keep the summary clear and concise while capturing all important information.""",
+        
+        "Meeting Summary": """Please provide a comprehensive meeting summary with the following elements:
+
+        1. Meeting Overview:
+        - Identify all participants and their roles
+        - Extract the main purpose/objective of the meeting
+        - Note the overall tone and engagement level
+        
+        2. Key Discussion Points:
+        - List and elaborate on the major topics discussed
+        - Highlight any decisions made or conclusions reached
+        - Capture important questions raised and their answers
+        
+        3. Action Items & Next Steps:
+        - Extract all tasks and assignments
+        - Include who is responsible for each item
+        - Note any mentioned deadlines or timeframes
+        - Flag any items marked as high priority
+        
+        4. Follow-up Requirements:
+        - List any scheduled follow-up meetings
+        - Note any documents or resources that were requested
+        - Identify any pending decisions or unresolved issues
+        
+        5. Notable Quotes & Key Insights:
+        - Extract significant statements or important insights
+        - Include context for each notable point
+        - Highlight any strategic or innovative ideas proposed
+        
+        6. Additional Context:
+        - Note any important references to past meetings or decisions
+        - Capture any mentioned risks or concerns
+        - Highlight any budget or resource discussions
+        
+        Please organize this information in a clear, concise format while maintaining the natural flow of the discussion. Include approximate timestamps for major topic transitions, written as [MM:SS].""",
+                
+        "Key Quotes": """Extract the most significant and impactful quotes from this audio.
+        For each quote, provide:
+        - The exact quote
+        - Who said it (if identifiable)
+        - Context around the quote""",
+        
+        "Content Analysis": """Perform a detailed content analysis of this audio, including:
+        - Tone and mood analysis
+        - Key themes and patterns
+        - Notable linguistic features
+        - Emotional content
+        - Professional vs casual language use""",
+        
+        "Action Items": """Extract all action items, next steps, and commitments mentioned in this audio.
+        Include:
+        - Who is responsible (if mentioned)
+        - Deadlines or timeframes (if specified)
+        - Priority level (if indicated)"""
+    }
+    return prompts.get(base_type)
+
+def get_full_context_prompt(analysis_type):
+    """Get the full context prompt for combined transcripts."""
+    base_type = analysis_type.split(" - ")[0]
+    
+    prompts = {
+        "Transcript & Summary": """I will provide you with the combined transcripts from different segments of a long audio file. 
+        Please analyze all these transcripts together as a single continuous conversation.
+        
+        Focus ONLY on creating a COMPREHENSIVE SUMMARY with the following elements:
+        
+        1. Meeting Overview:
+        - Identify all participants and their roles
+        - Extract the main purpose/objective of the meeting
+        - Note the overall tone and engagement level
+        
+        2. Key Discussion Points:
+        - List and elaborate on the major topics discussed
+        - Highlight any decisions made or conclusions reached
+        - Capture important questions raised and their answers
+        
+        3. Action Items & Next Steps:
+        - Extract all tasks and assignments
+        - Include who is responsible for each item
+        - Note any mentioned deadlines or timeframes
+        - Flag any items marked as high priority
+        
+        4. Follow-up Requirements:
+        - List any scheduled follow-up meetings
+        - Note any documents or resources that were requested
+        - Identify any pending decisions or unresolved issues
+        
+        5. Notable Quotes & Key Insights:
+        - Extract significant statements or important insights
+        - Include context for each notable point
+        - Highlight any strategic or innovative ideas proposed
+        
+        6. Additional Context:
+        - Note any important references to past meetings or decisions
+        - Capture any mentioned risks or concerns
+        - Highlight any budget or resource discussions
+        
+        DO NOT include the transcript in your response - I will handle adding it separately.
+        Just focus on creating the best possible summary of the content.
+        
+        Here are the combined transcripts:
+        
+        """,
+        
+        "Transcription": """I will provide you with the combined transcripts from different segments of a long audio file. 
+        Please compile these into a single, clean, accurate transcript of the complete audio, maintaining the flow as if it were one continuous transcription:
+        
+        """,
+        
+        "Summary": """I will provide you with the combined transcripts from different segments of a long audio file.
+        Please analyze all these transcripts together and provide a comprehensive summary of the entire content, including:
+        - Main topics discussed across the entire recording
+        - Key points and takeaways
+        - Overall context and purpose
+        Keep the summary clear and concise while capturing all important information from the entire recording.
+        
+        Here are the combined transcripts:
+        
+        """,
+        
+        "Meeting Summary": """I will provide you with the combined transcripts from different segments of a long audio file.
+        Please analyze all these transcripts together as a single continuous meeting and provide a comprehensive meeting summary with the following elements:
+
+        1. Meeting Overview:
+        - Identify all participants and their roles
+        - Extract the main purpose/objective of the meeting
+        - Note the overall tone and engagement level
+        
+        2. Key Discussion Points:
+        - List and elaborate on the major topics discussed
+        - Highlight any decisions made or conclusions reached
+        - Capture important questions raised and their answers
+        
+        3. Action Items & Next Steps:
+        - Extract all tasks and assignments
+        - Include who is responsible for each item
+        - Note any mentioned deadlines or timeframes
+        - Flag any items marked as high priority
+        
+        4. Follow-up Requirements:
+        - List any scheduled follow-up meetings
+        - Note any documents or resources that were requested
+        - Identify any pending decisions or unresolved issues
+        
+        5. Notable Quotes & Key Insights:
+        - Extract significant statements or important insights
+        - Include context for each notable point
+        - Highlight any strategic or innovative ideas proposed
+        
+        6. Additional Context:
+        - Note any important references to past meetings or decisions
+        - Capture any mentioned risks or concerns
+        - Highlight any budget or resource discussions
+        
+        Here are the combined transcripts:
+        
+        """,
+                
+        "Key Quotes": """I will provide you with the combined transcripts from different segments of a long audio file.
+        Please analyze all these transcripts together and extract the most significant and impactful quotes from the entire recording.
+        For each quote, provide:
+        - The exact quote
+        - Who said it (if identifiable)
+        - Context around the quote
+        
+        Here are the combined transcripts:
+        
+        """,
+        
+        "Content Analysis": """I will provide you with the combined transcripts from different segments of a long audio file.
+        Please analyze all these transcripts together and perform a detailed content analysis of the entire recording, including:
+        - Tone and mood analysis
+        - Key themes and patterns
+        - Notable linguistic features
+        - Emotional content
+        - Professional vs casual language use
+        
+        Here are the combined transcripts:
+        
+        """,
+        
+        "Action Items": """I will provide you with the combined transcripts from different segments of a long audio file.
+        Please analyze all these transcripts together and extract all action items, next steps, and commitments mentioned throughout the entire recording.
+        Include:
+        - Who is responsible (if mentioned)
+        - Deadlines or timeframes (if specified)
+        - Priority level (if indicated)
+        
+        Here are the combined transcripts:
+        
+        """
+    }
+    return prompts.get(base_type, "")
+
+def ordinal(n):
+    """Return the ordinal representation of a number."""
+    if 10 <= n % 100 <= 20:
+        suffix = 'th'
+    else:
+        suffix = {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+    return f"{n}{suffix}"
+
+def get_segment_prompt(index, num_segments):
+    """Prompt asking for the transcript of one segment while the whole file is sent."""
+    return f"""Please transcribe only the {ordinal(index+1)} segment of this audio (approximately from {index/num_segments:.0%} to {(index+1)/num_segments:.0%} of the total duration).
+            Focus only on this portion of the audio and ignore the rest."""
+
+def combine_transcript_and_summary(transcript, summary):
+    """Format the "Transcript & Summary" result."""
+    return f"""# COMPLETE TRANSCRIPT
+
+{transcript}
+
+# COMPREHENSIVE SUMMARY
+
+{summary}"""
+
+def split_transcript_and_summary(result):
+    """Split a single-shot "Transcript & Summary" response; returns (transcript, summary) or None."""
+    result_parts = result.split("PART 2 - SUMMARY")
+    if len(result_parts) != 2:
+        return None
+    transcript_part = result_parts[0].replace("PART 1 - TRANSCRIPT:", "").strip()
+    summary_part = "PART 2 - SUMMARY" + result_parts[1].strip()
+    return transcript_part, summary_part
@@ -0,0 +1,273 @@
+"""Local archive of past analyses with full-text search over transcripts.
+
+Every record belongs to the user (see usage.user_id_for_key) who produced it;
+lookups, searches and reuse only ever see that user's records.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+DATA_DIR = os.environ.get(
+    "AUDIO_ANALYSIS_DATA_DIR",
+    os.path.join(os.path.expanduser("~"), ".audio_analysis")
+)
+
+# Memoized segment transcripts older than this are dropped
+SEGMENT_MEMO_DAYS = float(os.environ.get("AUDIO_ANALYSIS_SEGMENT_MEMO_DAYS", "30"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    cache_key TEXT UNIQUE NOT NULL,
+    user_id TEXT,
+    content_hash TEXT NOT NULL,
+    file_name TEXT,
+    analysis_type TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    transcript BLOB,
+    result BLOB,
+    rating INTEGER
+);
+CREATE INDEX IF NOT EXISTS records_content_hash ON records(content_hash);
+CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+    file_name, transcript, result, content=''
+);
+-- Segment transcripts memoized per plan; named from when only unfinished runs were kept
+CREATE TABLE IF NOT EXISTS partial_segments (
+    plan_key TEXT NOT NULL,
+    segment_index INTEGER NOT NULL,
+    transcript BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    meta TEXT,
+    PRIMARY KEY (plan_key, segment_index)
+);
+"""
+
+def content_hash(data):
+    """Return the SHA-256 hex digest identifying a piece of audio content."""
+    return hashlib.sha256(data).hexdigest()
+
+def base_analysis_type(analysis_type):
+    """Strip the UI description from an analysis option."""
+    return analysis_type.split(" - ")[0]
+
+def cache_key(audio_hash, analysis_type, settings):
+    """Build the key under which an analysis result is cached."""
+    payload = json.dumps(
+        [audio_hash, base_analysis_type(analysis_type), settings],
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _record_key(user_id, key):
+    """Key a user's archived copy of a cached analysis; users never share records."""
+    return hashlib.sha256(f"{user_id}\0{key}".encode("utf-8")).hexdigest()
+
+def segment_plan_key(audio_hash, segment_model, num_segments, trimmed=False):
+    """Build the key for segment transcripts.
+
+    They depend only on the audio (and whether its silences were trimmed), the
+    model transcribing the segments and how the file is split, not on the
+    analysis type or the model doing the reduce.
+    """
+    plan = [audio_hash, segment_model, num_segments] + (["trimmed"] if trimmed else [])
+    payload = json.dumps(plan)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def is_error_result(text):
+    """Return True when a pipeline result is an error message rather than an analysis."""
+    return not text or text.startswith("Error processing")
+
+def _compress(text):
+    return zlib.compress((text or "").encode("utf-8"), 6)
+
+def _decompress(blob):
+    return zlib.decompress(blob).decode("utf-8") if blob else ""
+
+def _fts_query(query):
+    """Turn free text into an FTS5 query: quoted phrases stay phrases, other words are ANDed."""
+    terms = []
+    for phrase, word in re.findall(r'"([^"]+)"|(\S+)', query):
+        term = (phrase or word).replace('"', '""')
+        if term.strip():
+            terms.append(f'"{term}"')
+    return " ".join(terms)
+
+def _snippet(text, query, width=80):
+    """Return a short excerpt of text around the first match of any query term."""
+    lowered = text.lower()
+    for phrase, word in re.findall(r'"([^"]+)"|(\S+)', query):
+        pos = lowered.find((phrase or word).lower())
+        if pos >= 0:
+            start = max(0, pos - width)
+            end = min(len(text), pos + len(phrase or word) + width)
+            prefix = "…" if start > 0 else ""
+            suffix = "…" if end < len(text) else ""
+            return prefix + " ".join(text[start:end].split()) + suffix
+    return " ".join(text[:2 * width].split())
+
+class ResultsStore:
+    """SQLite archive of compressed transcripts and results with an FTS5 index."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "results.sqlite3")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(records)")]
+            if "rating" not in columns:
+                # Archives created before results could be rated
+                self._conn.execute("ALTER TABLE records ADD COLUMN rating INTEGER")
+            if "user_id" not in columns:
+                # Archives created before records were kept per user; their records match no user
+                self._conn.execute("ALTER TABLE records ADD COLUMN user_id TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS records_user_content ON records(user_id, content_hash)")
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(partial_segments)")]
+            if "meta" not in columns:
+                # Archives created before segments were kept as structured records
+                self._conn.execute("ALTER TABLE partial_segments ADD COLUMN meta TEXT")
+
+    def _row_to_record(self, row, include_text=True):
+        record = {
+            "id": row["id"],
+            "content_hash": row["content_hash"],
+            "file_name": row["file_name"],
+            "analysis_type": row["analysis_type"],
+            "settings": json.loads(row["settings"]),
+            "created_at": row["created_at"],
+        }
+        if include_text:
+            record["transcript"] = _decompress(row["transcript"])
+            record["result"] = _decompress(row["result"])
+        return record
+
+    def save(self, user_id, audio_hash, file_name, analysis_type, settings, result, transcript=""):
+        """Archive a user's finished analysis, replacing their earlier run with the same key."""
+        key = _record_key(user_id, cache_key(audio_hash, analysis_type, settings))
+        with self._lock, self._conn:
+            old = self._conn.execute(
+                "SELECT id, file_name, transcript, result FROM records WHERE cache_key = ?",
+                (key,)
+            ).fetchone()
+            if old is not None:
+                # Contentless FTS tables need the original values to remove a row
+                self._conn.execute(
+                    "INSERT INTO records_fts(records_fts, rowid, file_name, transcript, result) "
+                    "VALUES('delete', ?, ?, ?, ?)",
+                    (old["id"], old["file_name"] or "",
+                     _decompress(old["transcript"]), _decompress(old["result"]))
+                )
+                self._conn.execute("DELETE FROM records WHERE id = ?", (old["id"],))
+            cursor = self._conn.execute(
+                "INSERT INTO records (cache_key, user_id, content_hash, file_name, analysis_type, "
+                "settings, created_at, transcript, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, user_id, audio_hash, file_name, base_analysis_type(analysis_type),
+                 json.dumps(settings, sort_keys=True), time.time(),
+                 _compress(transcript), _compress(result))
+            )
+            record_id = cursor.lastrowid
+            self._conn.execute(
+                "INSERT INTO records_fts(rowid, file_name, transcript, result) VALUES (?, ?, ?, ?)",
+                (record_id, file_name or "", transcript or "", result or "")
+            )
+        return record_id
+
+    def lookup(self, user_id, audio_hash, analysis_type, settings):
+        """Return the user's archived record for an identical earlier run, or None."""
+        key = _record_key(user_id, cache_key(audio_hash, analysis_type, settings))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM records WHERE cache_key = ?", (key,)
+            ).fetchone()
+        return self._row_to_record(row) if row is not None else None
+
+    def get(self, record_id):
+        """Return a single archived record by id, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM records WHERE id = ?", (record_id,)
+            ).fetchone()
+        return self._row_to_record(row) if row is not None else None
+
+    def records_for_content(self, user_id, audio_hash):
+        """Return every analysis the user archived of the given audio, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM records WHERE user_id = ? AND content_hash = ? ORDER BY created_at DESC",
+                (user_id, audio_hash)
+            ).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def save_segments(self, plan_key, segments):
+        """Memoize segment records (index -> record, see segments.py) for later runs of the same plan."""
+        rows = []
+        for index, record in segments.items():
+            meta = {key: value for key, value in record.items() if key != "text"}
+            rows.append((plan_key, index, _compress(record["text"]), time.time(), json.dumps(meta)))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO partial_segments (plan_key, segment_index, transcript, created_at, meta) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.execute(
+                "DELETE FROM partial_segments WHERE created_at < ?",
+                (time.time() - SEGMENT_MEMO_DAYS * 86400,)
+            )
+
+    def load_segments(self, plan_key):
+        """Return {segment_index: record} memoized from earlier runs of this plan."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT segment_index, transcript, meta FROM partial_segments WHERE plan_key = ?",
+                (plan_key,)
+            ).fetchall()
+        segments = {}
+        for row in rows:
+            record = json.loads(row["meta"]) if row["meta"] else {"index": row["segment_index"]}
+            record["text"] = _decompress(row["transcript"])
+            segments[row["segment_index"]] = record
+        return segments
+
+    def search(self, user_id, query, limit=20):
+        """Search the user's archived transcripts and results, best matches first."""
+        match = _fts_query(query)
+        if not match:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT records.* FROM records_fts JOIN records ON records.id = records_fts.rowid "
+                "WHERE records_fts MATCH ? AND records.user_id = ? ORDER BY bm25(records_fts) LIMIT ?",
+                (match, user_id, limit)
+            ).fetchall()
+        results = []
+        for row in rows:
+            record = self._row_to_record(row)
+            record["snippet"] = _snippet(record["transcript"] + "\n" + record["result"], query)
+            results.append(record)
+        return results
+
+    def rate(self, record_id, rating):
+        """Store a user's rating of a result: 1 for useful, 0 for not useful."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE records SET rating = ? WHERE id = ?", (rating, record_id))
+
+    def ratings_by_route(self):
+        """Return how results were rated, grouped by the models that produced them."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT json_extract(settings, '$.model') AS route, COUNT(*) AS rated, "
+                "AVG(rating) AS positive_share FROM records WHERE rating IS NOT NULL "
+                "GROUP BY route ORDER BY rated DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,84 @@
+"""Per-stage model routing.
+
+AUDIO_ANALYSIS_MODEL_ROUTES maps pipeline stages ("segment", "reduce", "single")
+to a tier or a model name as JSON, e.g. {"segment": "fast", "reduce": "strong"}.
+Audio smaller than AUDIO_ANALYSIS_SHORT_FILE_MB (default 5, roughly five minutes
+at 128 kbit/s; 0 disables the rule) goes to the fast tier whatever its stage.
+
+Latency and error rates per route are exported by metrics.py with a "model"
+label; user ratings per route are kept in the results archive, see
+`python routing.py`.
+"""
+import json
+import os
+
+TIERS = {
+    "fast": "gemini-2.5-flash-lite",
+    "balanced": "gemini-2.5-flash",
+    "strong": "gemini-2.5-pro",
+}
+
+DEFAULT_ROUTES = {"segment": "fast", "reduce": "strong", "single": "balanced"}
+STAGES = ("segment", "reduce", "single")
+# Stages whose calls carry the audio itself; only these follow the short-file rule
+AUDIO_STAGES = ("segment", "single")
+
+SHORT_FILE_BYTES = int(float(os.environ.get("AUDIO_ANALYSIS_SHORT_FILE_MB", "5")) * 1e6)
+
+def load_routes():
+    """Return {stage: model name} from the defaults and AUDIO_ANALYSIS_MODEL_ROUTES."""
+    routes = dict(DEFAULT_ROUTES)
+    routes.update(json.loads(os.environ.get("AUDIO_ANALYSIS_MODEL_ROUTES", "{}")))
+    return {stage: TIERS.get(name, name) for stage, name in routes.items()}
+
+class ModelRouter:
+    """Stands in for a single GenerativeModel and picks the model for each call."""
+
+    def __init__(self, genai, routes=None, short_file_bytes=SHORT_FILE_BYTES):
+        self.genai = genai
+        self.routes = routes or load_routes()
+        self.short_file_bytes = short_file_bytes
+        self._models = {}
+
+    def model_name_for(self, stage, audio_size=0):
+        if stage in AUDIO_STAGES and 0 < audio_size < self.short_file_bytes:
+            return TIERS["fast"]
+        return self.routes.get(stage, TIERS["balanced"])
+
+    def model_for(self, stage, audio_size=0):
+        """Return the GenerativeModel serving a stage for audio of the given size."""
+        name = self.model_name_for(stage, audio_size)
+        if name not in self._models:
+            self._models[name] = self.genai.GenerativeModel(name)
+        return self._models[name]
+
+def stage_model_name(model, stage, audio_size):
+    """Return the name of the model serving one stage, for a router or a plain model."""
+    if isinstance(model, ModelRouter):
+        return model.model_name_for(stage, audio_size)
+    return model.model_name
+
+def stage_models(model, audio_size):
+    """Return what serves each stage: a model name, or {stage: model name} for a router.
+
+    Used in the run settings, so results produced by different routes are cached
+    and rated separately.
+    """
+    if isinstance(model, ModelRouter):
+        return {stage: model.model_name_for(stage, audio_size) for stage in STAGES}
+    return model.model_name
+
+def route_label(models):
+    """Return a short text label for a stage_models() value."""
+    if isinstance(models, dict):
+        return ",".join(f"{stage}={name}" for stage, name in sorted(models.items()))
+    return models
+
+if __name__ == "__main__":
+    from results_store import ResultsStore
+    print(f"{'route':<70} {'rated':>6} {'👍 share':>9}")
+    for row in ResultsStore().ratings_by_route():
+        route = row["route"]
+        if route.startswith("{"):
+            route = route_label(json.loads(route))
+        print(f"{route:<70} {row['rated']:>6} {row['positive_share']:>9.0%}")
@@ -0,0 +1,85 @@
+"""Structured records for the segments of a long-audio run.
+
+Each segment is a plain dict:
+
+    index, start_seconds, end_seconds   position in the audio (times are None when
+                                        the duration could not be determined)
+    start_byte, end_byte                matching share of the uploaded bytes
+    status                              "pending", "done", "reused" or "failed"
+    text, error                         transcript, or why the segment failed
+    started_at, finished_at, seconds    timing of the model call
+    input_tokens, output_tokens         usage reported by the model
+"""
+import time
+
+PENDING = "pending"
+DONE = "done"
+REUSED = "reused"
+FAILED = "failed"
+
+def plan_segments(audio_size, num_segments, duration=None):
+    """Return the pending records for splitting audio into equal segments."""
+    records = []
+    for i in range(num_segments):
+        records.append({
+            "index": i,
+            "start_seconds": duration * i / num_segments if duration else None,
+            "end_seconds": duration * (i + 1) / num_segments if duration else None,
+            "start_byte": audio_size * i // num_segments,
+            "end_byte": audio_size * (i + 1) // num_segments,
+            "status": PENDING,
+            "text": "",
+            "error": "",
+            "started_at": None,
+            "finished_at": None,
+            "seconds": None,
+            "input_tokens": 0,
+            "output_tokens": 0,
+        })
+    return records
+
+def start(record):
+    record["started_at"] = time.time()
+
+def finish(record, text, input_tokens=0, output_tokens=0):
+    """Mark a segment as transcribed."""
+    record["finished_at"] = time.time()
+    record["seconds"] = record["finished_at"] - record["started_at"]
+    record.update(status=DONE, text=text, error="", input_tokens=input_tokens, output_tokens=output_tokens)
+
+def fail(record, error):
+    """Mark a segment as failed, keeping the error for display."""
+    record["finished_at"] = time.time()
+    record["seconds"] = record["finished_at"] - record["started_at"]
+    record.update(status=FAILED, text="", error=str(error))
+
+def reuse(record, previous):
+    """Fill a planned segment from an earlier run's record (or bare transcript)."""
+    if isinstance(previous, str):
+        previous = {"text": previous}
+    for key in ("text", "started_at", "finished_at", "seconds", "input_tokens", "output_tokens"):
+        if key in previous:
+            record[key] = previous[key]
+    # Times are only planned when the audio was decoded; otherwise keep the earlier run's
+    for key in ("start_seconds", "end_seconds"):
+        if record[key] is None and previous.get(key) is not None:
+            record[key] = previous[key]
+    record.update(status=REUSED, error="")
+
+def format_time_range(record):
+    """Return "mm:ss–mm:ss" for a segment, or its share of the file when times are unknown."""
+    if record["start_seconds"] is None:
+        return f"bytes {record['start_byte']:,}–{record['end_byte']:,}"
+    start_s, end_s = int(record["start_seconds"]), int(record["end_seconds"])
+    return f"{start_s // 60:02d}:{start_s % 60:02d}–{end_s // 60:02d}:{end_s % 60:02d}"
+
+def transcript_headers(records):
+    """Return the segment transcripts labelled for the reduce prompt."""
+    return [
+        f"--- SEGMENT {r['index']+1}/{len(records)} TRANSCRIPT ({format_time_range(r)}) ---\n{r['text']}"
+        for r in records
+    ]
+
+def completed(records):
+    """Return {index: record} of the segments that hold a usable transcript."""
+    return {r["index"]: r for r in records if r["status"] in (DONE, REUSED)}
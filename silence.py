@@ -0,0 +1,185 @@
+"""Dead-air trimming before upload, with a map back to original-recording time.
+
+Long silent spans are found from per-frame RMS energy and cut out, leaving
+SILENCE_PADDING_SECONDS of silence on each side so speech is never clipped.
+The offset map lists the kept spans as (trimmed_start, original_start, length)
+rows; remap_timestamps() rewrites timestamps the model reports in trimmed time.
+"""
+import io
+import os
+import re
+import subprocess
+import tempfile
+import wave
+
+import numpy as np
+
+import pcm_cache
+from audio_io import AudioDecodeError, duration_seconds, ffmpeg_available, file_extension, is_wav
+
+SAMPLE_RATE = 8000
+FRAME_SECONDS = 0.05
+MIN_SILENCE_SECONDS = float(os.environ.get("AUDIO_ANALYSIS_SILENCE_MIN_SECONDS", "3"))
+SILENCE_PADDING_SECONDS = 0.5
+CUT_BLOCK_FRAMES = 1 << 18
+# The threshold sits 10 dB above the noise floor, clamped to this range (dBFS)
+MIN_THRESHOLD_DB = -60.0
+MAX_THRESHOLD_DB = -40.0
+
+def frame_levels(samples, sample_rate=SAMPLE_RATE, frame_seconds=FRAME_SECONDS, block_frames=12000):
+    """Return the RMS level of each frame in dBFS.
+
+    Frames are read block_frames at a time (10 minutes by default) as views of
+    the samples, so a memory-mapped recording is never copied as a whole.
+    """
+    frame = int(sample_rate * frame_seconds)
+    count = len(samples) // frame
+    levels = np.empty(count, dtype=np.float64)
+    for start in range(0, count, block_frames):
+        end = min(start + block_frames, count)
+        block = pcm_cache.frames(samples, start * frame / sample_rate, end * frame / sample_rate, sample_rate)
+        block = block.reshape(end - start, frame).astype(np.float64)
+        rms = np.sqrt(np.mean(block * block, axis=1))
+        levels[start:start + block_frames] = 20 * np.log10(np.maximum(rms, 1e-10))
+    return levels
+
+def find_silences(samples, sample_rate=SAMPLE_RATE, min_seconds=MIN_SILENCE_SECONDS,
+                  padding=SILENCE_PADDING_SECONDS):
+    """Return the (start, end) seconds of silent spans worth removing."""
+    levels = frame_levels(samples, sample_rate)
+    if len(levels) == 0:
+        return []
+    noise_floor = np.percentile(levels, 5)
+    threshold = min(MAX_THRESHOLD_DB, max(MIN_THRESHOLD_DB, noise_floor + 10))
+    silent = np.concatenate(([False], levels < threshold, [False]))
+    # Rising and falling edges of the silent mask delimit each run of silent frames
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    starts, ends = edges[::2] * FRAME_SECONDS, edges[1::2] * FRAME_SECONDS
+    duration = len(samples) / sample_rate
+    spans = []
+    for start, end in zip(starts, ends):
+        if end - start < min_seconds:
+            continue
+        # Leading and trailing silence need no padding on the outer side
+        cut_start = start + padding if start > 0 else 0.0
+        cut_end = end - padding if end < len(levels) * FRAME_SECONDS else duration
+        if cut_end > cut_start:
+            spans.append((float(cut_start), float(cut_end)))
+    return spans
+
+def offset_map_for(duration, silences):
+    """Return the kept spans as (trimmed_start, original_start, length) rows."""
+    rows = []
+    position = 0.0
+    trimmed = 0.0
+    for start, end in silences + [(duration, duration)]:
+        if start > position:
+            rows.append((trimmed, position, start - position))
+            trimmed += start - position
+        position = end
+    return rows
+
+def to_original(seconds, offset_map):
+    """Map a time in the trimmed audio back to the original recording."""
+    for trimmed_start, original_start, length in offset_map:
+        if seconds < trimmed_start + length:
+            return original_start + max(0.0, seconds - trimmed_start)
+    if not offset_map:
+        return seconds
+    trimmed_start, original_start, length = offset_map[-1]
+    return original_start + seconds - trimmed_start
+
+def _cut_wav(data, offset_map, block_frames=CUT_BLOCK_FRAMES):
+    # Kept spans are copied block_frames at a time, never holding the whole recording as frames
+    out = io.BytesIO()
+    with wave.open(io.BytesIO(data), 'rb') as wav, wave.open(out, 'wb') as trimmed:
+        trimmed.setparams(wav.getparams())
+        for _, original_start, length in offset_map:
+            start = min(int(original_start * wav.getframerate()), wav.getnframes())
+            end = min(int((original_start + length) * wav.getframerate()), wav.getnframes())
+            wav.setpos(start)
+            for position in range(start, end, block_frames):
+                trimmed.writeframes(wav.readframes(min(block_frames, end - position)))
+    return out.getvalue()
+
+def _cut_ffmpeg(data, file_name, offset_map):
+    # Compressed formats are re-encoded; aselect keeps the wanted spans in one pass
+    keep = "+".join(f"between(t,{start:.3f},{start + length:.3f})" for _, start, length in offset_map)
+    suffix = '.' + file_extension(file_name)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, "source" + suffix)
+        target = os.path.join(tmp_dir, "trimmed" + suffix)
+        with open(source, 'wb') as f:
+            f.write(data)
+        try:
+            subprocess.run(
+                ["ffmpeg", "-v", "error", "-y", "-i", source,
+                 "-af", f"aselect='{keep}',asetpts=N/SR/TB", target],
+                capture_output=True, check=True
+            )
+        except subprocess.CalledProcessError as e:
+            raise AudioDecodeError(f"ffmpeg could not trim audio: {e.stderr.decode(errors='replace').strip()}")
+        with open(target, 'rb') as f:
+            return f.read()
+
+def trim_silence(data, file_name, min_seconds=MIN_SILENCE_SECONDS, audio_hash=None):
+    """Remove long silences from audio bytes, keeping the original format.
+
+    Returns None when there is nothing worth removing, when nothing but
+    silence would remain, or when the re-encoded result is not smaller than
+    the upload; else a dict with the
+    trimmed "data", its "offset_map" and the "original_seconds",
+    "removed_seconds" and "bytes_saved" it achieved. Raises AudioDecodeError
+    when the audio cannot be decoded or cut here.
+    """
+    samples = pcm_cache.decode(data, file_name, SAMPLE_RATE, audio_hash)
+    silences = find_silences(samples, SAMPLE_RATE, min_seconds)
+    if not silences:
+        return None
+    if not is_wav(data) and not ffmpeg_available():
+        raise AudioDecodeError(f"ffmpeg is required to trim {file_name}")
+
+    duration = duration_seconds(data, file_name) if is_wav(data) else len(samples) / SAMPLE_RATE
+    offset_map = offset_map_for(duration, silences)
+    if not offset_map:
+        # All silence: send the recording as it is rather than an empty file
+        return None
+    trimmed = _cut_wav(data, offset_map) if is_wav(data) else _cut_ffmpeg(data, file_name, offset_map)
+    if len(trimmed) >= len(data):
+        # Re-encoding a lossy upload can outweigh the silence removed
+        return None
+    return {
+        "data": trimmed,
+        "offset_map": offset_map,
+        "original_seconds": duration,
+        "removed_seconds": duration - sum(length for _, _, length in offset_map),
+        "bytes_saved": len(data) - len(trimmed),
+    }
+
+# Only bracketed timestamps, as the prompts ask for: [12:34], (1:02:03) or a range such as
+# [00:00–05:00]. Clock times in the text itself ("10:30 we meet") are left alone
+TIME = r"(?:\d{1,2}:)?\d{1,2}:\d{2}"
+TIMESTAMP_PATTERN = re.compile(rf"[\[(]{TIME}(?:\s*[-–—]\s*{TIME})?[\])]")
+TIME_PATTERN = re.compile(TIME)
+
+def format_timestamp(seconds, with_hours=False):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    if hours or with_hours:
+        return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+    return f"{rest // 60:02d}:{rest % 60:02d}"
+
+def remap_timestamps(text, offset_map):
+    """Rewrite timestamps reported against the trimmed audio into original-recording time."""
+    def replace_time(match):
+        parts = [int(p) for p in match.group().split(":")]
+        seconds = parts[-1] + 60 * parts[-2] + (3600 * parts[0] if len(parts) == 3 else 0)
+        original = to_original(seconds, offset_map)
+        return format_timestamp(original, with_hours=len(parts) == 3)
+    return TIMESTAMP_PATTERN.sub(lambda match: TIME_PATTERN.sub(replace_time, match.group()), text)
+
+def describe(trim):
+    """Return a one-line report of what trimming saved."""
+    share = trim["removed_seconds"] / trim["original_seconds"] if trim["original_seconds"] else 0
+    return (f"✂️ Trimming {format_timestamp(trim['removed_seconds'])} of silence ({share:.0%} of the recording) "
+            f"saves {trim['bytes_saved'] / 1e6:.1f} MB of upload.")
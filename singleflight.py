@@ -0,0 +1,144 @@
+"""Single-flight coalescing: identical work already in flight is joined instead of started again.
+
+When several people analyze the same shared recording at about the same
+time, the first caller for a key leads and does the work; later callers with
+the same key wait for it and receive the same result. Three groups cover the
+pipeline:
+
+    JOBS        whole analyses, keyed by content hash, analysis type and settings
+    SEGMENTS    segment transcription calls, keyed by the segment plan and index
+    REDUCES     final-analysis calls, keyed by model and prompt
+
+so a burst of duplicate clicks costs one set of model calls even when the
+callers' runs only overlap in part. Work is only shared while it is running;
+afterwards the archive and segment memo take over. If the leader is cancelled,
+a waiting caller starts the work itself rather than inheriting the cancellation.
+"""
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import metrics
+from cancellation import AnalysisCancelled
+from results_store import cache_key
+
+class _Flight:
+    def __init__(self):
+        self.future = Future()
+        # Written by the leader, read by waiting callers (e.g. the latest progress)
+        self.state = {}
+
+class Group:
+    """In-flight work of one kind, by key."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def _join_or_lead(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _land(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def do(self, key, func, cancel_token=None, on_poll=None, poll_interval=0.5):
+        """Return (func(state), joined), running func only if no call with this key is in flight.
+
+        func receives the flight's state dict to share with waiting callers;
+        on_poll(state) is called on a waiting caller's thread while it waits.
+        A waiting caller stays cancellable through its own cancel_token.
+        """
+        while True:
+            flight, leader = self._join_or_lead(key)
+            if leader:
+                try:
+                    value = func(flight.state)
+                except BaseException as e:
+                    self._land(key, flight)
+                    flight.future.set_exception(e)
+                    raise
+                self._land(key, flight)
+                flight.future.set_result(value)
+                return value, False
+
+            metrics.COALESCED.inc(stage=self.stage)
+            try:
+                return self._wait(flight, cancel_token, on_poll, poll_interval), True
+            except _LeaderStopped:
+                # Take over (or join whoever took over first)
+                continue
+
+    def _wait(self, flight, cancel_token, on_poll, poll_interval):
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            try:
+                error = flight.future.exception(timeout=poll_interval)
+            except FutureTimeoutError:
+                if on_poll is not None:
+                    on_poll(flight.state)
+                if cancel_token is not None and cancel_token.on_wait is not None:
+                    cancel_token.on_wait()
+                continue
+            if on_poll is not None:
+                on_poll(flight.state)
+            if error is None:
+                return flight.future.result()
+            # The leader's own cancellation (or its script being stopped) is not a failure of the work
+            if isinstance(error, AnalysisCancelled) or not isinstance(error, Exception):
+                raise _LeaderStopped()
+            raise error
+
+    async def do_async(self, key, coroutine_func):
+        """Coroutine counterpart of do() for the asyncio pipeline; returns (value, joined)."""
+        import asyncio
+        while True:
+            flight, leader = self._join_or_lead(key)
+            if leader:
+                try:
+                    value = await coroutine_func(flight.state)
+                except BaseException as e:
+                    self._land(key, flight)
+                    flight.future.set_exception(e)
+                    raise
+                self._land(key, flight)
+                flight.future.set_result(value)
+                return value, False
+
+            metrics.COALESCED.inc(stage=self.stage)
+            waiter = asyncio.wrap_future(flight.future)
+            # wait() raises only when this caller is cancelled, never with the leader's error
+            await asyncio.wait({waiter})
+            error = None if waiter.cancelled() else waiter.exception()
+            if waiter.cancelled() or isinstance(error, AnalysisCancelled) or \
+                    (error is not None and not isinstance(error, Exception)):
+                continue
+            if error is not None:
+                raise error
+            return waiter.result(), True
+
+class _LeaderStopped(Exception):
+    pass
+
+JOBS = Group("job")
+SEGMENTS = Group("segment")
+REDUCES = Group("reduce")
+
+def job_key(audio_hash, analysis_type, settings, reused_segments=()):
+    """Key of a whole analysis; runs reusing different memoized segments are kept apart."""
+    return cache_key(audio_hash, analysis_type, dict(settings, reused_segments=sorted(reused_segments)))
+
+def call_key(*parts):
+    """Key of a model call from its model name, prompt and other JSON-serializable inputs."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
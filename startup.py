@@ -0,0 +1,111 @@
+"""Cold-start control: when heavy modules get imported, and how long the first render took.
+
+AUDIO_ANALYSIS_STARTUP_MODE selects the strategy:
+  eager    import everything before the first render (the old behaviour)
+  lazy     import the Gemini SDK and NumPy only when first needed
+  prewarm  render first, then import them in a background thread (default)
+
+Run `python startup.py` to profile import times with `python -X importtime`.
+"""
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+STARTUP_MODE = os.environ.get("AUDIO_ANALYSIS_STARTUP_MODE", "prewarm")
+
+# Imported lazily by the page; google.generativeai pulls in gRPC and protobuf
+HEAVY_MODULES = ("google.generativeai", "numpy", "fingerprint")
+
+IMPORT_SECONDS = {}
+_IMPORTED_AT = time.time()
+_state = {"first_render_seconds": None, "prewarm_started": False}
+_lock = threading.Lock()
+
+def process_start_time():
+    """Return the wall-clock time this process started, from /proc when available."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return _IMPORTED_AT
+
+PROCESS_STARTED = process_start_time()
+
+def import_heavy_modules():
+    """Import HEAVY_MODULES, recording how long each one took."""
+    imported = False
+    for name in HEAVY_MODULES:
+        if name in sys.modules:
+            continue
+        started = time.perf_counter()
+        importlib.import_module(name)
+        IMPORT_SECONDS[name] = time.perf_counter() - started
+        imported = True
+    if imported:
+        # Logged once the imports are done, which in prewarm mode is after the first render
+        print(json.dumps({"event": "heavy_imports", "mode": STARTUP_MODE,
+                          "import_seconds": {name: round(seconds, 3) for name, seconds in IMPORT_SECONDS.items()}}),
+              flush=True)
+
+def prewarm():
+    """Import the heavy modules once per process in a background thread."""
+    with _lock:
+        if _state["prewarm_started"]:
+            return
+        _state["prewarm_started"] = True
+    threading.Thread(target=import_heavy_modules, name="prewarm-imports", daemon=True).start()
+
+def before_render():
+    """Called at the top of every script run."""
+    if STARTUP_MODE == "eager":
+        import_heavy_modules()
+
+def after_render():
+    """Called once the page has been drawn; returns seconds from process start to first render."""
+    with _lock:
+        first_render = _state["first_render_seconds"] is None
+        if first_render:
+            _state["first_render_seconds"] = time.time() - PROCESS_STARTED
+    if first_render:
+        # One structured line per cold start, picked up by Cloud Logging
+        print(json.dumps({"event": "first_render", "mode": STARTUP_MODE,
+                          "seconds": round(_state["first_render_seconds"], 3)}), flush=True)
+    if STARTUP_MODE == "prewarm":
+        prewarm()
+    return _state["first_render_seconds"]
+
+def startup_report():
+    """Return the startup mode, first-render time and measured import times."""
+    return {
+        "mode": STARTUP_MODE,
+        "first_render_seconds": _state["first_render_seconds"],
+        "import_seconds": dict(IMPORT_SECONDS),
+    }
+
+def profile_imports(statement="import streamlit, app; import " + ", ".join(HEAVY_MODULES), top=25):
+    """Run a statement under `python -X importtime` and return (cumulative_us, module) rows."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)", line)
+        if match:
+            depth = (len(match.group(3)) - 1) // 2
+            rows.append((int(match.group(2)), depth, match.group(4)))
+    # Top-level imports carry the full cost of everything below them
+    top_level = sorted((r for r in rows if r[1] == 0), reverse=True)
+    return [(cumulative, name) for cumulative, _, name in top_level[:top]]
+
+if __name__ == "__main__":
+    for cumulative, name in profile_imports():
+        print(f"{cumulative / 1000:9.1f} ms  {name}")
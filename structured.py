@@ -0,0 +1,170 @@
+"""Structured (JSON) output for single-shot "Transcript & Summary" runs.
+
+Instead of asking for two headed text parts and splitting the response on
+"PART 2 - SUMMARY", which fails whenever the model rephrases the heading, the
+call requests RESPONSE_SCHEMA and the JSON is parsed as is. The parsed dict is
+kept in run_info["structured"] for exports, and the text result is rendered
+from it in the same layout as the other modes:
+
+    transcript      the full transcript
+    summary         overview, participants, key_points, decisions, follow_ups, context
+    action_items    task, owner, deadline, priority
+    quotes          quote, speaker, context
+
+AUDIO_ANALYSIS_STRUCTURED_OUTPUT=0 goes back to the text prompt.
+"""
+import json
+import os
+
+from prompts import combine_transcript_and_summary, get_analysis_prompt, split_transcript_and_summary
+from results_store import base_analysis_type
+
+STRUCTURED_OUTPUT = os.environ.get("AUDIO_ANALYSIS_STRUCTURED_OUTPUT", "1") != "0"
+STRUCTURED_TYPES = ("Transcript & Summary",)
+
+_STRINGS = {"type": "array", "items": {"type": "string"}}
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "transcript": {"type": "string"},
+        "summary": {
+            "type": "object",
+            "properties": {
+                "overview": {"type": "string"},
+                "participants": _STRINGS,
+                "key_points": _STRINGS,
+                "decisions": _STRINGS,
+                "follow_ups": _STRINGS,
+                "context": _STRINGS,
+            },
+            "required": ["overview", "key_points"],
+        },
+        "action_items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "task": {"type": "string"},
+                    "owner": {"type": "string"},
+                    "deadline": {"type": "string"},
+                    "priority": {"type": "string"},
+                },
+                "required": ["task"],
+            },
+        },
+        "quotes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "quote": {"type": "string"},
+                    "speaker": {"type": "string"},
+                    "context": {"type": "string"},
+                },
+                "required": ["quote"],
+            },
+        },
+    },
+    "required": ["transcript", "summary", "action_items", "quotes"],
+}
+
+STRUCTURED_PROMPT = """Please provide both a clean, accurate transcript of this audio file AND a comprehensive summary of the content, as JSON.
+
+        transcript: a clean, accurate transcript of the whole audio file. Do not try to associate names that may be mentioned in the audio to piece of text in the transcript.
+
+        summary:
+        - overview: the main purpose of the meeting, its overall tone and engagement level
+        - participants: everyone taking part, with their role when it is apparent
+        - key_points: the major topics discussed, with important questions raised and their answers
+        - decisions: decisions made or conclusions reached
+        - follow_ups: scheduled follow-up meetings, requested documents or resources, pending decisions and unresolved issues
+        - context: references to past meetings or decisions, risks or concerns, budget or resource discussions
+
+        action_items: every task or assignment, with who is responsible (owner), any deadline or timeframe, and its priority when one is indicated.
+
+        quotes: significant statements or insights, with the speaker and the context that makes them notable.
+
+        Leave a field empty rather than guessing."""
+
+def enabled_for(analysis_type):
+    """Return True when a single-shot run of this analysis type asks for structured output."""
+    return STRUCTURED_OUTPUT and base_analysis_type(analysis_type) in STRUCTURED_TYPES
+
+def generation_config(genai):
+    return genai.types.GenerationConfig(response_mime_type="application/json", response_schema=RESPONSE_SCHEMA)
+
+def parse_response(text):
+    """Return the structured response as a dict, or None when it is not valid JSON of the schema's shape."""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("transcript"), str) \
+            or not isinstance(data.get("summary"), dict):
+        return None
+    data.setdefault("action_items", [])
+    data.setdefault("quotes", [])
+    return data
+
+def _bullets(items):
+    return "\n".join(f"- {item}" for item in items if item) or "- None noted"
+
+def _action_item(item):
+    details = [f"{label}: {item[key]}" for key, label in
+               (("owner", "Owner"), ("deadline", "Deadline"), ("priority", "Priority")) if item.get(key)]
+    return item["task"] + (f" ({'; '.join(details)})" if details else "")
+
+def _quote(item):
+    speaker = f" — {item['speaker']}" if item.get("speaker") else ""
+    context = f" ({item['context']})" if item.get("context") else ""
+    return f"\"{item['quote']}\"{speaker}{context}"
+
+def render_summary(data):
+    """Return the summary part of a structured response as the numbered sections of the text prompt."""
+    summary = data["summary"]
+    sections = [
+        ("1. Meeting Overview", summary.get("overview", "") + (
+            "\n\nParticipants:\n" + _bullets(summary["participants"]) if summary.get("participants") else "")),
+        ("2. Key Discussion Points", _bullets(summary.get("key_points", [])) + (
+            "\n\nDecisions:\n" + _bullets(summary["decisions"]) if summary.get("decisions") else "")),
+        ("3. Action Items & Next Steps", _bullets(_action_item(i) for i in data["action_items"] if i.get("task"))),
+        ("4. Follow-up Requirements", _bullets(summary.get("follow_ups", []))),
+        ("5. Notable Quotes & Key Insights", _bullets(_quote(q) for q in data["quotes"] if q.get("quote"))),
+        ("6. Additional Context", _bullets(summary.get("context", []))),
+    ]
+    return "\n\n".join(f"## {title}\n\n{body.strip()}" for title, body in sections)
+
+def render_result(data):
+    """Return the "Transcript & Summary" text result of a structured response."""
+    return combine_transcript_and_summary(data["transcript"].strip(), render_summary(data))
+
+def single_shot_request(analysis_type, genai):
+    """Return (prompt, generate kwargs) for a single-shot run."""
+    if enabled_for(analysis_type):
+        return STRUCTURED_PROMPT, {"generation_config": generation_config(genai)}
+    return get_analysis_prompt(analysis_type), {}
+
+def single_shot_result(text, analysis_type, run_info=None):
+    """Return the result of a single-shot response, recording its transcript (and structured data) in run_info.
+
+    A structured response that is not valid JSON gives an error result.
+    """
+    run_info = run_info if run_info is not None else {}
+    if analysis_type.startswith("Transcription"):
+        run_info["transcript"] = text
+    if not analysis_type.startswith("Transcript & Summary"):
+        return text
+    if enabled_for(analysis_type):
+        data = parse_response(text)
+        if data is None:
+            # e.g. cut off at the output limit; an error keeps the broken JSON out of the archive
+            return "Error processing audio: the model's structured response could not be parsed"
+        run_info["structured"] = data
+        run_info["transcript"] = data["transcript"].strip()
+        return render_result(data)
+    parts = split_transcript_and_summary(text)
+    if parts:
+        run_info["transcript"] = parts[0]
+        return combine_transcript_and_summary(*parts)
+    return text
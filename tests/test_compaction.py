@@ -0,0 +1,67 @@
+import importlib
+from collections import Counter
+
+import pytest
+
+import compaction
+
+def compact(text, level="full"):
+    return compaction.compact_transcript(text, level, compaction._Deduplicator(), Counter())
+
+@pytest.mark.parametrize("line, expected", [
+    ("A: We should, uh, start.", "A: We should start."),
+    ("A: That was bad. Hmm. Let us move on.", "A: That was bad. Let us move on."),
+    ("A: It is an issue, hmm.", "A: It is an issue."),
+    ("A: Uh, what?", "A: What?"),
+    ("A: It is, uh... complicated.", "A: It is... complicated."),
+    ("A: Ahh, the umbrella is here.", "A: The umbrella is here."),
+    ("A: Wait... what. No fillers here.", "A: Wait... what. No fillers here."),
+])
+def test_fillers_are_removed_with_their_punctuation(line, expected):
+    assert compact(line) == expected
+
+def test_a_line_of_fillers_only_is_dropped():
+    assert compact("A: Hmm.\nB: Right.") == "B: Right."
+
+@pytest.mark.parametrize("line, expected", [
+    ("A: I I think so.", "A: I think so."),
+    ("A: The the the plan is fine.", "A: The plan is fine."),
+    ("A: No, no, no.", "A: No."),
+    ("A: No, no, that is wrong.", "A: No, no, that is wrong."),
+    ("A: It is very very good.", "A: It is very very good."),
+    ("A: Bye bye.", "A: Bye bye."),
+    ("A: We had had enough.", "A: We had had enough."),
+    ("A: 5 5 items.", "A: 5 5 items."),
+])
+def test_only_stutters_are_collapsed(line, expected):
+    assert compact(line) == expected
+
+def test_duplicate_sentences_are_dropped_per_speaker():
+    sentence = "We need to send the budget plan by Friday."
+    text = f"Speaker 1: {sentence}\nSpeaker 3: {sentence}\n[00:40] Speaker 1: {sentence}"
+    assert compact(text) == f"Speaker 1: {sentence}\nSpeaker 3: {sentence}"
+
+def test_near_duplicates_of_the_same_speaker_are_dropped():
+    text = ("A: We need to send the whole budget plan to finance by Friday.\n"
+            "A: So we need to send the whole budget plan to finance by Friday.")
+    assert compact(text) == "A: We need to send the whole budget plan to finance by Friday."
+
+def test_short_sentences_are_never_duplicates():
+    assert compact("A: Yes.\nB: Ok.\nA: Yes.") == "A: Yes.\nB: Ok.\nA: Yes."
+
+def test_light_level_keeps_the_words():
+    text = "--- SEGMENT 1/2 TRANSCRIPT (00:00–05:00) ---\nA:  I I  think, uh, so.\nA: I I think, uh, so."
+    assert compact(text, "light") == "[Segment 1/2, 00:00–05:00]\nA: I I think, uh, so."
+
+def test_light_is_the_default_level(monkeypatch):
+    # The level is read from the environment at import
+    monkeypatch.delenv("AUDIO_ANALYSIS_COMPACTION", raising=False)
+    try:
+        importlib.reload(compaction)
+        assert compaction.COMPACTION_LEVEL == "light"
+        transcripts, report = compaction.compact_transcripts(["A: Um, we should, uh, start."])
+        assert report["level"] == "light"
+        assert transcripts == ["A: Um, we should, uh, start."]
+    finally:
+        monkeypatch.undo()
+        importlib.reload(compaction)
@@ -0,0 +1,70 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+import silence
+
+# Kept 0–10 s and 25–40 s of a 60 s recording: 10–25 s and 40–60 s were cut
+OFFSET_MAP = [(0.0, 0.0, 10.0), (10.0, 25.0, 15.0)]
+
+def test_offset_map_lists_the_kept_spans():
+    assert silence.offset_map_for(60.0, [(10.0, 25.0), (40.0, 60.0)]) == OFFSET_MAP
+
+def test_offset_map_keeps_everything_without_silences():
+    assert silence.offset_map_for(30.0, []) == [(0.0, 0.0, 30.0)]
+
+def test_offset_map_of_leading_silence_starts_later():
+    assert silence.offset_map_for(30.0, [(0.0, 5.0)]) == [(0.0, 5.0, 25.0)]
+
+@pytest.mark.parametrize("trimmed, original", [
+    (0.0, 0.0),
+    (9.5, 9.5),
+    (10.0, 25.0),
+    (12.0, 27.0),
+    (24.9, 39.9),
+    (30.0, 45.0),
+])
+def test_to_original(trimmed, original):
+    assert silence.to_original(trimmed, OFFSET_MAP) == pytest.approx(original)
+
+def test_to_original_without_a_map_is_unchanged():
+    assert silence.to_original(42.0, []) == 42.0
+
+@pytest.mark.parametrize("text, expected", [
+    ("[00:12] Speaker 1: Hello.", "[00:27] Speaker 1: Hello."),
+    ("Budget (00:05), then hiring [00:14].", "Budget (00:05), then hiring [00:29]."),
+    ("[0:00:12] A: Hi.", "[0:00:27] A: Hi."),
+    ("--- SEGMENT 2/2 TRANSCRIPT (00:05–00:15) ---", "--- SEGMENT 2/2 TRANSCRIPT (00:05–00:30) ---"),
+    ("[00:08 - 00:12] Intro", "[00:08 - 00:27] Intro"),
+])
+def test_bracketed_timestamps_are_remapped(text, expected):
+    assert silence.remap_timestamps(text, OFFSET_MAP) == expected
+
+@pytest.mark.parametrize("text", [
+    "10:30 we meet again.",
+    "A: The train leaves at 12:15, so hurry.",
+    "- 00:12 is when it started",
+    "[Segment 1/2, 00:00–05:00]",
+])
+def test_other_times_are_left_alone(text):
+    assert silence.remap_timestamps(text, OFFSET_MAP) == text
+
+def wav_bytes(samples, rate=8000):
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.astype('<i2').tobytes())
+    return out.getvalue()
+
+def test_cut_wav_keeps_exactly_the_mapped_frames():
+    samples = np.arange(60 * 100, dtype=np.int16)
+    data = wav_bytes(samples, rate=100)
+    trimmed = silence._cut_wav(data, OFFSET_MAP, block_frames=7)
+    with wave.open(io.BytesIO(trimmed), 'rb') as wav:
+        assert wav.getframerate() == 100
+        kept = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+    np.testing.assert_array_equal(kept, np.concatenate([samples[0:1000], samples[2500:4000]]))
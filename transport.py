@@ -0,0 +1,270 @@
+"""How audio travels to Gemini: inline in the request, or uploaded once through the File API.
+
+Inline bytes cost nothing up front but are re-sent with every call, and a
+request is capped at 20 MB. An upload costs a round trip plus processing
+time, after which every call carries only a reference. choose_mode() compares
+the two for the payload size and the number of calls expected to use it (one
+per segment in long-audio mode), using linear latency models:
+
+    inline      seconds per call carrying the bytes inline
+    upload      seconds to upload the file and wait for it to become active
+    reference   seconds per call carrying a file reference
+
+The defaults are rough; `python transport.py --benchmark` measures them
+against the real API and stores them in DATA_DIR/transport_calibration.json,
+which is picked up on the next start. AUDIO_ANALYSIS_TRANSPORT=inline or
+upload forces one mode, AUDIO_ANALYSIS_INLINE_MAX_MB (default 15) caps
+inline payloads.
+
+    python transport.py --benchmark --sizes 0.5,2,8,14 --repeat 3
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import wave
+from contextlib import contextmanager
+
+import metrics
+from cancellation import AnalysisCancelled
+from results_store import DATA_DIR
+
+TRANSPORT_MODE = os.environ.get("AUDIO_ANALYSIS_TRANSPORT", "auto")
+INLINE_MAX_BYTES = int(float(os.environ.get("AUDIO_ANALYSIS_INLINE_MAX_MB", "15")) * 1_000_000)
+CALIBRATION_PATH = os.path.join(DATA_DIR, "transport_calibration.json")
+# (seconds, seconds per MB) of each path until a benchmark has been run
+DEFAULT_CALIBRATION = {"inline": [0.0, 1.0], "upload": [1.5, 1.0], "reference": [0.0, 0.05]}
+FILE_ACTIVE_TIMEOUT_SECONDS = 120
+
+EXTENSION_MIME_TYPES = {
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'm4a': 'audio/mp4'
+}
+
+def sniff_mime(data, file_name=None):
+    """Return the MIME type of audio from its first bytes, falling back to the file extension."""
+    head = bytes(data[:12])
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'audio/wav'
+    if head[:3] == b'ID3':
+        return 'audio/mpeg'
+    if head[4:8] == b'ftyp':
+        return 'audio/mp4'
+    if head[:4] == b'OggS':
+        return 'audio/ogg'
+    if head[:4] == b'fLaC':
+        return 'audio/flac'
+    if head[:4] == b'FORM' and head[8:12] in (b'AIFF', b'AIFC'):
+        return 'audio/aiff'
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'audio/webm'
+    if len(head) >= 2 and head[0] == 0xFF:
+        # ADTS (AAC) and MPEG audio frames share the sync word; the layer bits tell them apart
+        if head[1] & 0xF6 == 0xF0:
+            return 'audio/aac'
+        if head[1] & 0xE0 == 0xE0 and head[1] & 0x06:
+            return 'audio/mpeg'
+    # audio_io pulls in NumPy, which the page defers until it is needed
+    from audio_io import file_extension
+    return EXTENSION_MIME_TYPES.get(file_extension(file_name or ""), 'audio/mpeg')
+
+def load_calibration(path=CALIBRATION_PATH):
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+        return {k: stored[k] for k in DEFAULT_CALIBRATION}
+    except (OSError, ValueError, KeyError):
+        return dict(DEFAULT_CALIBRATION)
+
+_calibration = {}
+_calibration_lock = threading.Lock()
+
+def calibration():
+    """Return the latency models, loading the benchmark results on first use."""
+    with _calibration_lock:
+        if not _calibration:
+            _calibration.update(load_calibration())
+        return _calibration
+
+def _seconds(model, size_mb):
+    fixed, per_mb = model
+    return fixed + per_mb * size_mb
+
+def choose_mode(size, uses=1, calibration_models=None):
+    """Return "inline" or "upload" for a payload of size bytes sent with uses calls."""
+    if TRANSPORT_MODE in ("inline", "upload"):
+        return TRANSPORT_MODE
+    if size > INLINE_MAX_BYTES:
+        return "upload"
+    models = calibration_models or calibration()
+    size_mb = size / 1e6
+    inline = uses * _seconds(models["inline"], size_mb)
+    upload = _seconds(models["upload"], size_mb) + uses * _seconds(models["reference"], size_mb)
+    return "upload" if upload < inline else "inline"
+
+def part_size(part):
+    """Return the audio bytes a content part stands for, inline or uploaded."""
+    if isinstance(part, dict):
+        return len(part.get('data', b''))
+    return getattr(part, 'size_bytes', 0)
+
+def inline_part(file_name, audio_bytes):
+    """Build the inline audio part for a generate_content call."""
+    return {'mime_type': sniff_mime(audio_bytes, file_name), 'data': audio_bytes}
+
+def upload_part(file_name, audio_bytes, cancel_token=None):
+    """Upload audio through the File API and return the file once it is active.
+
+    When a cancel_token is given, the remote file is deleted if the run is cancelled.
+    """
+    import google.generativeai as genai
+    from audio_io import file_extension
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.' + file_extension(file_name))
+    try:
+        tmp.write(audio_bytes)
+        tmp.close()
+        uploaded = genai.upload_file(tmp.name, mime_type=sniff_mime(audio_bytes, file_name),
+                                     display_name=file_name)
+    finally:
+        os.unlink(tmp.name)
+    metrics.BYTES_UPLOADED.inc(len(audio_bytes))
+    if cancel_token is not None:
+        cancel_token.add_cleanup(release, uploaded)
+    try:
+        # Audio files are processed before they can be referenced
+        deadline = time.monotonic() + FILE_ACTIVE_TIMEOUT_SECONDS
+        while True:
+            # Checked once more after the last poll, so a run cancelled meanwhile gets no file to leak
+            if cancel_token is not None and cancel_token.cancelled:
+                raise AnalysisCancelled("Analysis was cancelled")
+            if uploaded.state.name != "PROCESSING":
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Uploaded file {uploaded.name} was still processing after "
+                                   f"{FILE_ACTIVE_TIMEOUT_SECONDS}s")
+            time.sleep(0.5)
+            uploaded = genai.get_file(uploaded.name)
+        if uploaded.state.name != "ACTIVE":
+            raise RuntimeError(f"Uploaded file {uploaded.name} is {uploaded.state.name}")
+    except BaseException:
+        release(uploaded)
+        raise
+    return uploaded
+
+def prepare(file_name, audio_bytes, uses=1, cancel_token=None):
+    """Return the audio part for uses calls, inline or uploaded as choose_mode() decides."""
+    mode = choose_mode(len(audio_bytes), uses)
+    metrics.AUDIO_PARTS.inc(mode=mode)
+    if mode == "upload":
+        return upload_part(file_name, audio_bytes, cancel_token)
+    return inline_part(file_name, audio_bytes)
+
+def release(part):
+    """Delete the remote copy of an uploaded part; inline parts need nothing."""
+    if isinstance(part, dict):
+        return
+    import google.generativeai as genai
+    try:
+        genai.delete_file(part.name)
+    except Exception:
+        # Uploaded files expire on their own after 48 hours
+        pass
+
+@contextmanager
+def audio_part(file_name, audio_bytes, uses=1, cancel_token=None):
+    """Provide the audio part for uses calls and delete any uploaded copy afterwards."""
+    part = prepare(file_name, audio_bytes, uses, cancel_token)
+    try:
+        yield part
+    finally:
+        release(part)
+
+def _benchmark_wav(size):
+    """Return a mono 16 kHz WAV of noise of about size bytes."""
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(os.urandom(max(2, int(size) - 44) // 2 * 2))
+    return out.getvalue()
+
+def _fit(samples):
+    """Least-squares (seconds, seconds per MB) through (size_mb, seconds) samples."""
+    sizes = [s for s, _ in samples]
+    seconds = [t for _, t in samples]
+    if len(set(sizes)) < 2:
+        return [statistics.median(seconds), 0.0]
+    slope, intercept = statistics.linear_regression(sizes, seconds)
+    return [max(0.0, intercept), max(0.0, slope)]
+
+def benchmark(model, sizes_mb, repeat=3):
+    """Time inline calls, uploads and reference calls at each size and fit the latency models."""
+    import google.generativeai as genai
+    prompt = "Reply with the single word OK."
+    config = genai.types.GenerationConfig(max_output_tokens=5)
+    samples = {"inline": [], "upload": [], "reference": []}
+    for size_mb in sizes_mb:
+        data = _benchmark_wav(size_mb * 1e6)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            model.generate_content([inline_part("benchmark.wav", data), prompt], generation_config=config)
+            samples["inline"].append((size_mb, time.perf_counter() - started))
+
+            started = time.perf_counter()
+            uploaded = upload_part("benchmark.wav", data)
+            samples["upload"].append((size_mb, time.perf_counter() - started))
+            try:
+                started = time.perf_counter()
+                model.generate_content([uploaded, prompt], generation_config=config)
+                samples["reference"].append((size_mb, time.perf_counter() - started))
+            finally:
+                release(uploaded)
+            print(f"{size_mb:6.1f} MB  inline {samples['inline'][-1][1]:6.2f}s  "
+                  f"upload {samples['upload'][-1][1]:6.2f}s  reference {samples['reference'][-1][1]:6.2f}s",
+                  flush=True)
+    return {name: _fit(points) for name, points in samples.items()}
+
+def break_even_mb(models, uses, limit_mb=INLINE_MAX_BYTES / 1e6):
+    """Return the smallest size (MB) at which uploading wins for uses calls, or None below the inline cap."""
+    size_mb = 0.0
+    while size_mb <= limit_mb:
+        if choose_mode(size_mb * 1e6, uses, models) == "upload":
+            return size_mb
+        size_mb += 0.1
+    return None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--benchmark", action="store_true", help="measure against the API and store the result")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--sizes", default="0.5,2,8,14", help="payload sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default=CALIBRATION_PATH)
+    return parser.parse_args(argv)
+
+def main(args):
+    models = calibration()
+    if args.benchmark:
+        import google.generativeai as genai
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+        models = benchmark(genai.GenerativeModel(args.model), [float(s) for s in args.sizes.split(",")],
+                           args.repeat)
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump({**models, "model": args.model, "measured_at": time.time()}, f, indent=2)
+        print(f"Wrote {args.out}")
+    for name, (fixed, per_mb) in models.items():
+        print(f"{name:10} {fixed:6.2f}s + {per_mb:5.2f}s/MB")
+    for uses in (1, 2, 4, 8):
+        threshold = break_even_mb(models, uses)
+        print(f"{uses} call(s): " + (f"upload from {threshold:.1f} MB" if threshold is not None
+                                     else f"inline up to the {INLINE_MAX_BYTES / 1e6:.0f} MB cap"))
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,272 @@
+"""Token and cost accounting per user and analysis type, with daily budgets.
+
+Budgets come from AUDIO_ANALYSIS_BUDGETS (JSON) or the file named by
+AUDIO_ANALYSIS_BUDGETS_FILE, for example:
+
+    {"default": {"daily_tokens": 2000000, "on_exceed": "downgrade"},
+     "users": {"key:1a2b3c4d5e6f7a8b": {"daily_cost_usd": 5, "on_exceed": "refuse"}}}
+
+Users are identified by a hash of their API key; raw keys are never stored.
+Run `python usage.py` for a per-user, per-analysis-type report of the last 30 days.
+"""
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from results_store import DATA_DIR, base_analysis_type
+
+DOWNGRADE_MODEL = "gemini-2.5-flash-lite"
+
+# USD per million tokens as (audio/text input, output); override with AUDIO_ANALYSIS_PRICES
+PRICES = {
+    "gemini-2.5-flash": {"audio_input": 1.00, "text_input": 0.30, "output": 2.50},
+    "gemini-2.5-flash-lite": {"audio_input": 0.30, "text_input": 0.10, "output": 0.40},
+    "gemini-2.5-pro": {"audio_input": 1.25, "text_input": 1.25, "output": 10.00},
+}
+PRICES.update(json.loads(os.environ.get("AUDIO_ANALYSIS_PRICES", "{}")))
+
+# Gemini counts 32 tokens per second of audio; assume ~128 kbit/s uploads
+AUDIO_BYTES_PER_TOKEN = 500
+# Rough transcript length relative to the audio tokens it came from
+TRANSCRIPT_TOKENS_PER_AUDIO_TOKEN = 0.15
+REDUCE_OUTPUT_TOKENS = 4000
+# A reservation whose run never got recorded (e.g. its page was closed mid-run) stops holding the budget
+RESERVATION_SECONDS = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    user_id TEXT NOT NULL,
+    analysis_type TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cost_usd REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usage_user_time ON usage(user_id, created_at);
+"""
+
+class BudgetExceeded(Exception):
+    """Raised when a run would exceed the user's budget even after downgrading."""
+
+def user_id_for_key(api_key):
+    """Return a stable, non-reversible identifier for an API key."""
+    return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+def short_model_name(model_name):
+    return model_name.split("/")[-1]
+
+def call_cost(model_name, stage, input_tokens, output_tokens):
+    """Return the USD cost of one call; unknown models are priced at zero."""
+    prices = PRICES.get(short_model_name(model_name))
+    if not prices:
+        return 0.0
+    input_price = prices["text_input"] if stage == "reduce" else prices["audio_input"]
+    return (input_tokens * input_price + output_tokens * prices["output"]) / 1e6
+
+def usage_from_response(response):
+    """Return (input_tokens, output_tokens) from a response's usage metadata."""
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return 0, 0
+    return metadata.prompt_token_count or 0, metadata.candidates_token_count or 0
+
+def estimate_run(audio_size, model_name, num_segments=0, reused_segments=0):
+    """Estimate (tokens, cost_usd) of a run before dispatching it.
+
+    Long-audio mode sends the whole file once per segment and then adds a
+    text-only reduce call over the segment transcripts. model_name may also be
+    a {stage: model name} routing, as returned by routing.stage_models().
+    Memoized segments (reused_segments) are not sent again and cost nothing.
+    """
+    audio_tokens = audio_size // AUDIO_BYTES_PER_TOKEN
+    transcript_tokens = int(audio_tokens * TRANSCRIPT_TOKENS_PER_AUDIO_TOKEN)
+    if num_segments:
+        segment_output = transcript_tokens // num_segments
+        calls = [("segment", audio_tokens, segment_output)] * max(0, num_segments - reused_segments)
+        calls.append(("reduce", transcript_tokens, REDUCE_OUTPUT_TOKENS))
+    else:
+        calls = [("single", audio_tokens, transcript_tokens + REDUCE_OUTPUT_TOKENS)]
+    tokens = sum(i + o for _, i, o in calls)
+    models = model_name if isinstance(model_name, dict) else {}
+    cost = sum(call_cost(models.get(stage, model_name), stage, i, o) for stage, i, o in calls)
+    return tokens, cost
+
+def load_budgets():
+    """Return the budget configuration from the environment."""
+    path = os.environ.get("AUDIO_ANALYSIS_BUDGETS_FILE")
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return json.loads(os.environ.get("AUDIO_ANALYSIS_BUDGETS", "{}"))
+
+def budget_for(user_id, budgets=None):
+    """Return the budget dict that applies to a user, or {} when unlimited."""
+    budgets = load_budgets() if budgets is None else budgets
+    return budgets.get("users", {}).get(user_id, budgets.get("default", {}))
+
+_late_calls_lock = threading.Lock()
+
+def add_call(run_info, call):
+    """Append a finished call to run_info["calls"]; store it right away if the run was already recorded."""
+    with _late_calls_lock:
+        run_info.setdefault("calls", []).append(call)
+        recorded = run_info.get("usage_ledger")
+    if recorded:
+        ledger, user_id, analysis_type = recorded
+        ledger.record_calls(user_id, analysis_type, [call])
+
+class UsageLedger:
+    """SQLite log of every model call's token usage."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "usage.sqlite3")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        # Estimated spend of runs that passed the budget check but are not recorded yet
+        self._reservations = {}
+        self._reservation_ids = itertools.count()
+        self.budget_lock = threading.Lock()
+
+    def reserve(self, user_id, tokens, cost):
+        """Hold a run's estimated spend against the user's budget until release()."""
+        with self._lock:
+            reservation = next(self._reservation_ids)
+            self._reservations[reservation] = (user_id, tokens, cost, time.time())
+        return reservation
+
+    def release(self, reservation):
+        with self._lock:
+            self._reservations.pop(reservation, None)
+
+    def reserved(self, user_id):
+        """Return the (tokens, cost_usd) reserved by the user's runs in progress."""
+        cutoff = time.time() - RESERVATION_SECONDS
+        with self._lock:
+            held = [r for r in self._reservations.values() if r[0] == user_id and r[3] >= cutoff]
+        return sum(r[1] for r in held), sum(r[2] for r in held)
+
+    def record_calls(self, user_id, analysis_type, calls):
+        """Store the per-call usage entries collected in run_info["calls"]."""
+        rows = [
+            (call.get("finished_at", time.time()), user_id, base_analysis_type(analysis_type),
+             call["stage"], short_model_name(call["model"]), call["input_tokens"], call["output_tokens"],
+             call_cost(call["model"], call["stage"], call["input_tokens"], call["output_tokens"]))
+            for call in calls
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO usage (created_at, user_id, analysis_type, stage, model, "
+                "input_tokens, output_tokens, cost_usd) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def record_run(self, user_id, analysis_type, run_info):
+        """Store a run's calls, and from then on each call of the run that finishes late.
+
+        A cancelled or out-raced call keeps running on its pool thread and only
+        reaches run_info["calls"] when it returns, possibly after the run ended.
+        """
+        with _late_calls_lock:
+            calls = list(run_info.get("calls", []))
+            run_info["usage_ledger"] = (self, user_id, analysis_type)
+        self.record_calls(user_id, analysis_type, calls)
+        # The real usage now counts against the budget in place of the estimate
+        if "budget_reservation" in run_info:
+            self.release(run_info.pop("budget_reservation"))
+
+    def spent_since(self, user_id, since):
+        """Return (tokens, cost_usd) used by a user since a timestamp."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(input_tokens + output_tokens), 0), COALESCE(SUM(cost_usd), 0) "
+                "FROM usage WHERE user_id = ? AND created_at >= ?",
+                (user_id, since)
+            ).fetchone()
+        return row[0], row[1]
+
+    def report(self, since):
+        """Return usage grouped by user and analysis type since a timestamp."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, analysis_type, COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(cost_usd) "
+                "FROM usage WHERE created_at >= ? GROUP BY user_id, analysis_type "
+                "ORDER BY SUM(cost_usd) DESC",
+                (since,)
+            ).fetchall()
+        return [
+            {"user_id": r[0], "analysis_type": r[1], "calls": r[2],
+             "input_tokens": r[3], "output_tokens": r[4], "cost_usd": r[5]}
+            for r in rows
+        ]
+
+def start_of_day(now=None):
+    """Return the timestamp of local midnight, when daily budgets reset."""
+    now = time.localtime(now)
+    return time.mktime((now.tm_year, now.tm_mon, now.tm_mday, 0, 0, 0, 0, 0, -1))
+
+def check_budget(ledger, user_id, audio_size, model_name, num_segments=0, reused_segments=0, budgets=None,
+                 run_info=None):
+    """Decide how a run may proceed under the user's daily budget.
+
+    Returns (model_name, num_segments, message): the original settings when the
+    run fits, or cheaper ones (lighter model, fewest segments) when the budget
+    allows downgrading. Raises BudgetExceeded when even that does not fit.
+
+    Runs still in progress count with their estimated spend. Given the run's
+    run_info, the estimate of the chosen settings is reserved the same way until
+    ledger.record_run() stores the real usage, so runs started at the same time
+    cannot each pass against the same spent total.
+    """
+    budget = budget_for(user_id, budgets)
+    if not budget:
+        return model_name, num_segments, None
+
+    token_limit = budget.get("daily_tokens")
+    cost_limit = budget.get("daily_cost_usd")
+    with ledger.budget_lock:
+        spent_tokens, spent_cost = ledger.spent_since(user_id, start_of_day())
+        reserved_tokens, reserved_cost = ledger.reserved(user_id)
+
+        def fits(model, segments, reused=0):
+            tokens, cost = estimate_run(audio_size, model, segments, reused)
+            return ((token_limit is None or spent_tokens + reserved_tokens + tokens <= token_limit)
+                    and (cost_limit is None or spent_cost + reserved_cost + cost <= cost_limit))
+
+        plan = None
+        if fits(model_name, num_segments, reused_segments):
+            plan = (model_name, num_segments, reused_segments, None)
+        elif budget.get("on_exceed", "refuse") == "downgrade":
+            cheaper_segments = min(num_segments, 2) if num_segments else 0
+            cheaper_reused = min(reused_segments, cheaper_segments)
+            if fits(DOWNGRADE_MODEL, cheaper_segments, cheaper_reused):
+                message = f"Daily budget nearly used: running with {DOWNGRADE_MODEL}"
+                if cheaper_segments != num_segments:
+                    message += f" and {cheaper_segments} segments"
+                plan = (DOWNGRADE_MODEL, cheaper_segments, cheaper_reused, message + ".")
+        if plan is None:
+            raise BudgetExceeded(
+                f"This analysis would exceed your daily budget (used {spent_tokens:,} tokens / "
+                f"${spent_cost:.2f} today)."
+            )
+        if run_info is not None:
+            tokens, cost = estimate_run(audio_size, *plan[:3])
+            run_info["budget_reservation"] = ledger.reserve(user_id, tokens, cost)
+    return plan[0], plan[1], plan[3]
+
+if __name__ == "__main__":
+    ledger = UsageLedger()
+    print(f"{'user':<22} {'analysis type':<22} {'calls':>6} {'input':>12} {'output':>10} {'cost $':>9}")
+    for row in ledger.report(time.time() - 30 * 86400):
+        print(f"{row['user_id']:<22} {row['analysis_type']:<22} {row['calls']:>6} "
+              f"{row['input_tokens']:>12,} {row['output_tokens']:>10,} {row['cost_usd']:>9.2f}")